@@ -0,0 +1,153 @@
+from imgdescgenlib.cache import DescriptionCacheBase
+from imgdescgenlib.chatbot.async_base import AsyncChatbotBase
+from imgdescgenlib.chatbot.exceptions import ChatbotPartiallyFailed
+from imgdescgenlib.imgdescgen import ImgDescGenBase, _StreamWriter
+from imgdescgenlib.images import Images
+from imgdescgenlib.metadata_writer import WriteMode
+from imgdescgenlib.schemas import ImageDescription
+
+import asyncio
+
+from typing import AsyncIterator
+
+class AsyncImgDescGen(ImgDescGenBase):
+    """
+    Asyncio counterpart of ImgDescGen.
+    Image loading and metadata writing run in worker threads, so they don't block event loop.
+    Pipelined generation is available only in ImgDescGen, it needs sync chatbot.
+    """
+    def __init__(
+        self,
+        chatbot: AsyncChatbotBase,
+        exiftool_pool_size: int = 1,
+        description_cache: DescriptionCacheBase = None,
+        lazy_images: bool = False,
+        preprocess_workers: int = 0,
+        write_mode: WriteMode = "copy",
+        near_duplicate_distance: int = None
+    ):
+        """
+        Args:
+            chatbot (AsyncChatbotBase): Asyncio chatbot used to generate descriptions.
+            exiftool_pool_size (int): Number of ExifTool processes kept running for each ExifTool executable.
+            description_cache (DescriptionCacheBase): Cache of generated descriptions.
+            lazy_images (bool): Open images only while they are used and don't keep encoded images in memory.
+            preprocess_workers (int): Number of processes that decode, resize and encode images.
+            write_mode (WriteMode): Where description and keywords are written: copy, in_place or sidecar.
+            near_duplicate_distance (int): Send only one image of each group of near duplicates, see ImgDescGen.
+        """
+        super().__init__(chatbot, exiftool_pool_size, description_cache, lazy_images, preprocess_workers, write_mode, near_duplicate_distance)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await asyncio.to_thread(self.close)
+
+    async def _generate_new(self, imgs: Images) -> list[ImageDescription]:
+        """
+        Calls chatbot, only representatives of near duplicates are sent if detection is on.
+        """
+        duplicates = await asyncio.to_thread(self._find_near_duplicates, imgs)
+        if duplicates is None:
+            return await self._chatbot.generate_image_description(imgs)
+
+        representatives, unique = duplicates
+        try:
+            generated = await self._chatbot.generate_image_description(imgs.subset(unique))
+        except ChatbotPartiallyFailed as e:
+            raise ChatbotPartiallyFailed(self._expand_duplicates(representatives, unique, e.results), e.errors) from e
+        return self._expand_duplicates(representatives, unique, generated)
+
+    async def generate_image_description(
+        self,
+        img_paths: list[str],
+        output_dir: str = None,
+        reduce_quality: bool = True,
+        exiftool_path: str = None,
+        size_budget: int = None,
+        max_dimension: int = None,
+        skip_described: bool = False
+    ) -> list[ImageDescription]:
+        """
+        Loads image from file and sends request to the chatbot.
+        Then writes metadata to image and dumps it to disk.
+        See ImgDescGen.generate_image_description.
+        """
+        imgs, img_metadata = await asyncio.to_thread(
+            self._load_undescribed_images, img_paths, reduce_quality, exiftool_path, size_budget, max_dimension, skip_described
+        )
+        undescribed = [i for i, description in enumerate(img_metadata) if description is None]
+        keys = await asyncio.to_thread(self._get_cached_undescribed, imgs, img_metadata)
+
+        missing = [i for i, description in enumerate(img_metadata) if description is None]
+        if missing:
+            await asyncio.to_thread(self._fit_to_budget, imgs.subset(missing), size_budget, max_dimension)
+            try:
+                generated = await self._generate_new(imgs.subset(missing))
+            except ChatbotPartiallyFailed as e:
+                await asyncio.to_thread(self._merge_generated_descriptions, keys, img_metadata, missing, e.results)
+                raise ChatbotPartiallyFailed(img_metadata, e.errors) from e
+            await asyncio.to_thread(self._merge_generated_descriptions, keys, img_metadata, missing, generated)
+
+        if self._should_write(output_dir):
+            written = range(len(imgs)) if self._should_write_described() else undescribed
+            await asyncio.to_thread(imgs.subset(written).write_description_metadata, [img_metadata[i] for i in written], output_dir, self._write_mode)
+
+        return img_metadata
+
+    async def generate_image_description_stream(
+        self,
+        img_paths: list[str],
+        output_dir: str = None,
+        reduce_quality: bool = True,
+        exiftool_path: str = None,
+        size_budget: int = None,
+        max_dimension: int = None,
+        skip_described: bool = False,
+        write_batch_size: int = 50
+    ) -> AsyncIterator[tuple[str, ImageDescription]]:
+        """
+        Yields path of image and its description as soon as it is generated, metadata is written in background.
+        See ImgDescGen.generate_image_description_stream.
+        """
+        imgs, img_metadata = await asyncio.to_thread(
+            self._load_undescribed_images, img_paths, reduce_quality, exiftool_path, size_budget, max_dimension, skip_described
+        )
+        described = {i for i, description in enumerate(img_metadata) if description is not None}
+        keys = await asyncio.to_thread(self._get_cached_undescribed, imgs, img_metadata)
+
+        writer = _StreamWriter(imgs, output_dir, self._write_mode, write_batch_size) if self._should_write(output_dir) else None
+        errors: list[Exception] = []
+        try:
+            for i, description in enumerate(img_metadata):
+                if description is not None:
+                    if writer and (i not in described or self._should_write_described()):
+                        writer.put(i, description)
+                    yield img_paths[i], description
+
+            missing = [i for i, description in enumerate(img_metadata) if description is None]
+            if missing:
+                await asyncio.to_thread(self._fit_to_budget, imgs.subset(missing), size_budget, max_dimension)
+                groups = await asyncio.to_thread(self._group_near_duplicates, imgs, missing)
+                try:
+                    async for j, description in self._chatbot.generate_image_description_stream(imgs.subset([group[0] for group in groups])):
+                        for i, img_description in self._put_group_description(groups[j], description, img_metadata, keys):
+                            if writer:
+                                writer.put(i, img_description)
+                            yield img_paths[i], img_description
+                except ChatbotPartiallyFailed as e:
+                    errors = e.errors
+        finally:
+            if writer:
+                await asyncio.to_thread(writer.close)
+
+        if errors:
+            raise ChatbotPartiallyFailed(img_metadata, errors) from errors[0]
+
+    async def write_description_metadata(self, img_paths: list[str], img_metadata: list[ImageDescription], output_dir: str = None, exiftool_path: str = None):
+        """
+        Writes already generated descriptions to images, see ImgDescGen.write_description_metadata.
+        """
+        imgs = await asyncio.to_thread(self._create_images, img_paths, exiftool_path)
+        await asyncio.to_thread(imgs.write_description_metadata, img_metadata, output_dir, self._write_mode)
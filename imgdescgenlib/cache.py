@@ -0,0 +1,126 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+from imgdescgenlib.schemas import ImageDescription
+
+class DescriptionCacheBase:
+    """
+    Base class of cache of generated descriptions.
+    Key identifies image content, model and prompt, see make_key.
+    """
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(content_hash: str, chatbot_key: str) -> str:
+        """
+        Returns cache key of image.
+
+        Args:
+            content_hash (str): Identifies image sent to the chatbot, see Image.content_key.
+            chatbot_key (str): String identifying model and prompt, see ChatbotBase.get_cache_key.
+        """
+        return hashlib.sha256(f"{content_hash}\0{chatbot_key}".encode()).hexdigest()
+
+    def get(self, key: str) -> ImageDescription | None:
+        """
+        Returns cached description or None and updates hit/miss counters.
+        """
+        description = self._get(key)
+        with self._stats_lock:
+            if description is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return description
+
+    def put(self, key: str, description: ImageDescription):
+        raise NotImplementedError
+
+    def _get(self, key: str) -> ImageDescription | None:
+        raise NotImplementedError
+
+class SQLiteDescriptionCache(DescriptionCacheBase):
+    """
+    Description cache stored in SQLite database.
+    Entries older than max_age are dropped, least recently used entries are evicted above max_entries.
+    """
+    def __init__(self, path: str, max_entries: int = None, max_age: float = None):
+        """
+        Args:
+            path (str): Path to the database file, ":memory:" for in-memory database.
+            max_entries (int): Max number of cached descriptions, None for no limit.
+            max_age (float): Max age of cached description in seconds, None for no limit.
+        """
+        super().__init__()
+
+        self._max_entries = max_entries
+        self._max_age = max_age
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS descriptions ("
+                "key TEXT PRIMARY KEY, description TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS descriptions_accessed ON descriptions (accessed)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM descriptions").fetchone()[0]
+
+    def _get(self, key: str) -> ImageDescription | None:
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT description, created FROM descriptions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            description, created = row
+            if self._max_age is not None and now - created > self._max_age:
+                self._connection.execute("DELETE FROM descriptions WHERE key = ?", (key,))
+                return None
+
+            self._connection.execute("UPDATE descriptions SET accessed = ? WHERE key = ?", (now, key))
+
+        return ImageDescription.model_validate_json(description)
+
+    def put(self, key: str, description: ImageDescription):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO descriptions (key, description, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, description.model_dump_json(), now, now)
+            )
+            self._evict(now)
+
+    def _evict(self, now: float):
+        """
+        Removes expired entries and least recently used entries above the limit.
+        """
+        if self._max_age is not None:
+            self._connection.execute("DELETE FROM descriptions WHERE created < ?", (now - self._max_age,))
+
+        if self._max_entries is not None:
+            self._connection.execute(
+                "DELETE FROM descriptions WHERE key IN ("
+                "SELECT key FROM descriptions ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self._max_entries,)
+            )
@@ -0,0 +1,40 @@
+from imgdescgenlib.chatbot.exceptions import ChatbotPartiallyFailed
+from imgdescgenlib.images import Images
+from imgdescgenlib.schemas import ImageDescription
+
+from typing import AsyncIterator
+
+class AsyncChatbotBase():
+    """
+    Asyncio chatbot base class
+    """
+    async def generate_image_description(self, images: Images) -> list[ImageDescription]:
+        raise NotImplementedError
+
+    async def generate_image_description_stream(self, images: Images) -> AsyncIterator[tuple[int, ImageDescription]]:
+        """
+        Yields index of image and its description as soon as the description is generated.
+        Default implementation yields results of generate_image_description when all of them are ready.
+        """
+        try:
+            descriptions = await self.generate_image_description(images)
+        except ChatbotPartiallyFailed as e:
+            for i, description in enumerate(e.results):
+                if description is not None:
+                    yield i, description
+            raise
+
+        for i, description in enumerate(descriptions):
+            yield i, description
+
+    def get_image_max_dimension(self) -> int | None:
+        """
+        Returns max size of the longer image side the model makes use of, None if images are sent at original resolution.
+        """
+        return None
+
+    def get_cache_key(self) -> str:
+        """
+        Returns string that identifies model and prompt, used as part of cached description key.
+        """
+        raise NotImplementedError
@@ -0,0 +1,65 @@
+import asyncio
+import aiohttp
+
+from imgdescgenlib.chatbot.async_base import AsyncChatbotBase
+from imgdescgenlib.chatbot.exceptions import ChatbotHttpRequestFailed, ChatbotPayloadTooLarge
+
+class AsyncChatbotClientBase(AsyncChatbotBase):
+    """
+    Chatbot base asyncio HTTP client.
+    Connections are reused and number of in-flight requests is limited by semaphore.
+    """
+    def __init__(self, max_concurrency: int = 100):
+        """
+        Args:
+            max_concurrency (int): Max number of requests in flight.
+        """
+        self._max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session: aiohttp.ClientSession = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """
+        Returns HTTP session, it is created on first use inside running event loop.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self._max_concurrency)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        """
+        Closes HTTP session.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, method: str, url: str, **kwargs) -> tuple[aiohttp.ClientResponse, bytes]:
+        """
+        Sends request, waiting for free slot if too many requests are in flight.
+        Returns response and its body.
+        """
+        async with self._semaphore:
+            async with self.session.request(method, url, **kwargs) as response:
+                body = await response.read()
+                return response, body
+
+    def _check_response(self, response: aiohttp.ClientResponse, body: bytes):
+        """
+        Checks if response status is success and raises exception if failed
+        """
+        if response.status != 200:
+            text = body.decode("utf-8", errors="replace")
+            if response.status == 413:
+                # probably image too large
+                raise ChatbotPayloadTooLarge(response.status, text)
+
+            raise ChatbotHttpRequestFailed(response.status, text)
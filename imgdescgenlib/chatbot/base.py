@@ -1,9 +1,56 @@
+from imgdescgenlib.chatbot.exceptions import ChatbotPartiallyFailed
 from imgdescgenlib.images import Images
 from imgdescgenlib.schemas import ImageDescription
 
+from typing import Iterator
+
 class ChatbotBase():
     """
     Chatbot base class
     """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Releases threads and connections of chatbot, they are created again on next use.
+        """
+        pass
+
     def generate_image_description(self, images: Images) -> list[ImageDescription]:
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+    def generate_image_description_stream(self, images: Images) -> Iterator[tuple[int, ImageDescription]]:
+        """
+        Yields index of image and its description as soon as the description is generated.
+        Default implementation yields results of generate_image_description when all of them are ready.
+        """
+        try:
+            descriptions = self.generate_image_description(images)
+        except ChatbotPartiallyFailed as e:
+            yield from ((i, description) for i, description in enumerate(e.results) if description is not None)
+            raise
+
+        yield from enumerate(descriptions)
+
+    def prepare_images(self, images: Images):
+        """
+        Does work that can be done before generation, e.g. uploads images.
+        Pipeline calls it for the next chunk while descriptions of the current one are generated.
+        """
+        pass
+
+    def get_image_max_dimension(self) -> int | None:
+        """
+        Returns max size of the longer image side the model makes use of, None if images are sent at original resolution.
+        """
+        return None
+
+    def get_cache_key(self) -> str:
+        """
+        Returns string that identifies model and prompt, used as part of cached description key.
+        """
+        raise NotImplementedError
@@ -0,0 +1,57 @@
+def plan_chunks(
+    sizes: list[int],
+    tokens: list[int],
+    max_count: int,
+    max_bytes: int = None,
+    max_tokens: int = None,
+    output_tokens: list[int] = None,
+    max_output_tokens: int = None
+) -> list[list[int]]:
+    """
+    Splits images into chunks of consecutive indices, so that each chunk fits all limits.
+    Image that exceeds a limit alone is put into its own chunk.
+
+    Args:
+        sizes (list[int]): Encoded size of each image in bytes.
+        tokens (list[int]): Estimated input tokens of each image.
+        max_count (int): Max number of images in chunk.
+        max_bytes (int): Max total size of images in chunk, None for no limit.
+        max_tokens (int): Max total tokens of images in chunk, None for no limit.
+        output_tokens (list[int]): Estimated output tokens of description of each image.
+        max_output_tokens (int): Max total output tokens of chunk, None for no limit.
+
+    Returns:
+        list[list[int]]: Image indices of each chunk, in input order.
+    """
+    if max_count < 1:
+        raise ValueError("Max image count in chunk must be at least 1")
+
+    chunks: list[list[int]] = []
+    chunk: list[int] = []
+    chunk_bytes = 0
+    chunk_tokens = 0
+    chunk_output_tokens = 0
+    if output_tokens is None:
+        output_tokens = [0] * len(sizes)
+    for i in range(len(sizes)):
+        fits = len(chunk) < max_count \
+            and (max_bytes is None or chunk_bytes + sizes[i] <= max_bytes) \
+            and (max_tokens is None or chunk_tokens + tokens[i] <= max_tokens) \
+            and (max_output_tokens is None or chunk_output_tokens + output_tokens[i] <= max_output_tokens)
+
+        if chunk and not fits:
+            chunks.append(chunk)
+            chunk = []
+            chunk_bytes = 0
+            chunk_tokens = 0
+            chunk_output_tokens = 0
+
+        chunk.append(i)
+        chunk_bytes += sizes[i]
+        chunk_tokens += tokens[i]
+        chunk_output_tokens += output_tokens[i]
+
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks
@@ -1,15 +1,108 @@
+import logging
 import requests
+import requests.adapters
+import time
 
 from imgdescgenlib.chatbot.base import ChatbotBase
 from imgdescgenlib.chatbot.exceptions import ChatbotHttpRequestFailed, ChatbotPayloadTooLarge
+from imgdescgenlib.chatbot.rate_limit import CircuitBreaker, RetryPolicy, TokenBucket
+
+logger = logging.getLogger("chatbotclient")
+
+def is_retryable_status(status_code: int) -> bool:
+    """
+    Returns True if request that failed with the status code can succeed if repeated.
+    """
+    return status_code in (408, 429) or status_code >= 500
 
 class ChatbotClientBase(ChatbotBase):
     """
     Chatbot base HTTP client 
     """
-    def __init__(self):
+    def __init__(
+        self,
+        pool_maxsize: int = requests.adapters.DEFAULT_POOLSIZE,
+        requests_per_minute: float = None,
+        tokens_per_minute: float = None,
+        retry_policy: RetryPolicy = None,
+        circuit_breaker: CircuitBreaker = None
+    ):
+        """
+        Args:
+            pool_maxsize (int): Max number of connections kept open to a host.
+                Should be not less than number of concurrent requests.
+            requests_per_minute (float): Requests quota, None for no limit.
+            tokens_per_minute (float): Tokens quota, None for no limit.
+            retry_policy (RetryPolicy): Policy of retrying rate limited and failed requests, None for no retries.
+            circuit_breaker (CircuitBreaker): Circuit breaker that pauses requests after repeated failures, None to disable.
+        """
         self.session = requests.Session()
 
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._retry_policy = retry_policy or RetryPolicy(max_retries=0)
+        self._circuit_breaker = circuit_breaker
+
+    def close(self):
+        """
+        Closes pooled connections of HTTP session.
+        """
+        self.session.close()
+
+    def _request(self, method: str, url: str, tokens: int = 0, **kwargs) -> requests.Response:
+        """
+        Sends request within rate limits.
+        Requests that failed with retryable status or connection error are retried with backoff,
+        last response is returned if retries are exhausted.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Request URL.
+            tokens (int): Estimated number of tokens used by request.
+            kwargs: Arguments passed to requests.Session.request.
+        """
+        attempt = 0
+        while True:
+            if self._circuit_breaker:
+                self._circuit_breaker.before_request()
+            if self._request_bucket:
+                self._request_bucket.acquire()
+            if self._token_bucket and tokens:
+                self._token_bucket.acquire(tokens)
+
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if self._circuit_breaker:
+                    self._circuit_breaker.record_failure()
+                if attempt >= self._retry_policy.max_retries:
+                    raise
+
+                delay = self._retry_policy.get_delay(attempt)
+                logger.warning(f"HTTP request failed: {e}, retrying in {delay:.1f} s")
+            else:
+                if not is_retryable_status(response.status_code):
+                    if self._circuit_breaker:
+                        self._circuit_breaker.record_success()
+                    return response
+
+                if self._circuit_breaker:
+                    self._circuit_breaker.record_failure()
+                if attempt >= self._retry_policy.max_retries:
+                    return response
+
+                delay = self._retry_policy.get_delay(attempt, response.headers.get("Retry-After"))
+                logger.warning(f"HTTP request failed with status code {response.status_code}, retrying in {delay:.1f} s")
+                # streamed response holds its pooled connection until closed
+                response.close()
+
+            time.sleep(delay)
+            attempt += 1
+
     def _check_response(self, response: requests.Response):
         """
         Checks if response status is success and raises exception if failed
@@ -12,4 +12,21 @@ class ChatbotHttpRequestFailed(ChatbotFailed):
         self._text = text
 
 class ChatbotPayloadTooLarge(ChatbotHttpRequestFailed):
-    pass
\ No newline at end of file
+    pass
+
+class ChatbotCircuitOpen(ChatbotFailed):
+    """
+    Raised when requests are paused after repeated failures.
+    """
+    pass
+
+class ChatbotPartiallyFailed(ChatbotFailed):
+    """
+    Raised when descriptions were generated only for part of images.
+    """
+    def __init__(self, results: list, errors: list[Exception]):
+        super().__init__(f"Failed to generate description for {results.count(None)} of {len(results)} images: {errors[0]}")
+
+        # results in input order, None for images that failed
+        self.results = results
+        self.errors = errors
@@ -0,0 +1,287 @@
+from imgdescgenlib.chatbot.async_client_base import AsyncChatbotClientBase
+from imgdescgenlib.chatbot.exceptions import ChatbotFailed, ChatbotPartiallyFailed
+from imgdescgenlib.chatbot.gemini.common import GeminiClientMixin
+from imgdescgenlib.chatbot.gemini.exceptions import GeminiModelRequired, GeminiUploadFailed
+from imgdescgenlib.chatbot.gemini.file_index import GeminiFileIndex
+from imgdescgenlib.chatbot.gemini.schemas import (
+    GeminiConfig,
+    GeminiCountTokensResponse,
+    GeminiFileListResponse,
+    GeminiModelListResponse
+)
+from imgdescgenlib.image import EncodedImage
+from imgdescgenlib.images import Images
+from imgdescgenlib.schemas import ImageDescription
+
+import aiohttp
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger("chatbotclient")
+
+class AsyncGeminiClient(GeminiClientMixin, AsyncChatbotClientBase):
+    """
+    Asyncio Gemini client, requires API key to work.
+    """
+
+    def __init__(self, config: GeminiConfig = None, max_concurrency: int = 100):
+        """
+        Args:
+            config (GeminiConfig): Gemini config.
+            max_concurrency (int): Max number of requests in flight, shared by all calls of this client.
+        """
+        if not config:
+            config = GeminiConfig()
+        self._config = config
+        self._init_token_counts()
+
+        self._file_index = GeminiFileIndex(config.api_key, config.file_index_path, config.file_index_refresh_interval)
+        self._file_index_lock = asyncio.Lock()
+
+        super().__init__(max_concurrency=max_concurrency)
+
+    async def get_available_models(self) -> GeminiModelListResponse:
+        """
+        Returns list of available and supported by library models from Gemini API.
+        See GeminiClient.get_available_models.
+        """
+        response, body = await self._request(
+            "GET",
+            f"{self._config.base_url}/v1beta/models?key={self._config.api_key}"
+        )
+        self._check_response(response, body)
+
+        model_list_response = GeminiModelListResponse(**json.loads(body))
+        return model_list_response.get_supported_models()
+
+    async def _count_tokens(self, parts: list[dict]) -> int:
+        """
+        Returns number of input tokens of content parts, counted by countTokens API.
+        """
+        response, body = await self._request(
+            "POST",
+            self._count_tokens_url(),
+            headers={"Content-Type": "application/json"},
+            json=self._count_tokens_payload(parts)
+        )
+        self._check_response(response, body)
+        return GeminiCountTokensResponse(**json.loads(body)).totalTokens
+
+    async def _update_token_counts(self, images: Images):
+        """
+        Counts tokens of prompt and of image resolutions that were not counted yet.
+        See GeminiClient._update_token_counts.
+        """
+        resolutions = await asyncio.to_thread(self._uncounted_resolutions, images)
+        if not resolutions:
+            return
+
+        try:
+            if self._prompt_tokens is None:
+                self._prompt_tokens = await self._count_tokens([{"text": self._config.image_description_prompt}])
+            for width, height in resolutions:
+                part = await asyncio.to_thread(self._resolution_probe_part, width, height)
+                self._image_tokens[(width, height)] = await self._count_tokens([part])
+        except (ChatbotFailed, aiohttp.ClientError) as e:
+            logger.warning(f"Failed to count tokens, estimating them instead: {e}")
+            self._token_counting = False
+
+    async def _uploaded_files(self) -> GeminiFileListResponse:
+        """
+        Returns list of all files in Gemini storage, all pages are requested.
+        """
+        files = []
+        page_token = None
+        while True:
+            response, body = await self._request(
+                "GET",
+                self._files_url(page_token),
+                headers={"Content-Type": "application/json"}
+            )
+            self._check_response(response, body)
+
+            page = GeminiFileListResponse(**json.loads(body))
+            files += page.files
+
+            page_token = page.nextPageToken
+            if not page_token:
+                break
+
+        return GeminiFileListResponse(files=files)
+
+    async def _refresh_file_index(self):
+        """
+        Reloads uploaded file index from the server if it is outdated.
+        """
+        async with self._file_index_lock:
+            if not self._file_index.needs_refresh():
+                return
+
+            self._file_index.replace((await self._uploaded_files()).files)
+            await asyncio.to_thread(self._file_index.save)
+
+    async def _upload_image(self, encoded: EncodedImage, image_filename: str) -> str:
+        """
+        Uploads image to the Gemini storage using media.load method of the File API and returns URL.
+        Uploaded file is added to the file index.
+        """
+        image_data = encoded.data
+        image_len = len(image_data)
+
+        headers, metadata = self._upload_start_request(image_len, encoded.mime_type, image_filename)
+        response, body = await self._request(
+            "POST",
+            f"{self._config.base_url}/upload/v1beta/files?key={self._config.api_key}",
+            headers=headers,
+            json=metadata
+        )
+        self._check_response(response, body)
+
+        upload_url = response.headers.get("X-Goog-Upload-URL")
+        if not upload_url:
+            raise ChatbotFailed("Failed to get upload URL")
+
+        upload_headers = {
+            "Content-Length": str(image_len),
+            "X-Goog-Upload-Offset": "0",
+            "X-Goog-Upload-Command": "upload, finalize"
+        }
+
+        response, body = await self._request("POST", upload_url, headers=upload_headers, data=image_data)
+        self._check_response(response, body)
+
+        return self._index_uploaded_file(encoded, json.loads(body)["file"])
+
+    async def generate_image_description(self, images: Images) -> list[ImageDescription]:
+        """
+        Generates descriptions for images.
+        Images are split into chunks that are sent concurrently, results are returned in input order.
+        """
+        if not self._config.model_name:
+            raise GeminiModelRequired("Model name is required to use Gemini.")
+
+        await self._update_token_counts(images)
+
+        # encoding images is CPU bound, don't block event loop
+        chunks = await asyncio.to_thread(self._plan_chunks, images)
+        logger.debug(f"Split {len(images)} images into {len(chunks)} chunks")
+
+        if len(chunks) == 1:
+            return await self._generate_chunk(images)
+
+        chunk_results = await asyncio.gather(
+            *(self._generate_chunk(images.subset(chunk)) for chunk in chunks),
+            return_exceptions=True
+        )
+        for chunk_result in chunk_results:
+            if isinstance(chunk_result, Exception) and not isinstance(chunk_result, ChatbotFailed):
+                raise chunk_result
+
+        return self._merge_chunk_results(len(images), chunks, chunk_results)
+
+    async def _generate_missing(self, images: Images, missing: list[int], results: list[ImageDescription | None], attempt: int) -> list[Exception]:
+        """
+        Requests descriptions of images missing from response again.
+        See GeminiClient._generate_missing.
+        """
+        if attempt >= self._config.missing_retries:
+            return [ChatbotFailed(f"Gemini returned no description for {len(missing)} images")]
+
+        logger.info(f"Requesting {len(missing)} missing descriptions again")
+        chunks = [[missing[i] for i in chunk] for chunk in await asyncio.to_thread(self._plan_chunks, images.subset(missing))]
+        chunk_results = await asyncio.gather(
+            *(self._generate_chunk(images.subset(chunk), attempt + 1) for chunk in chunks),
+            return_exceptions=True
+        )
+
+        errors = []
+        for chunk, chunk_result in zip(chunks, chunk_results):
+            if isinstance(chunk_result, ChatbotPartiallyFailed):
+                errors += chunk_result.errors
+                chunk_result = chunk_result.results
+            elif isinstance(chunk_result, ChatbotFailed):
+                errors.append(chunk_result)
+                continue
+            elif isinstance(chunk_result, BaseException):
+                raise chunk_result
+
+            for i, description in zip(chunk, chunk_result):
+                results[i] = description
+        return errors
+
+    async def _generate_chunk(self, images: Images, attempt: int = 0) -> list[ImageDescription]:
+        """
+        Sends generateContent request to Gemini to generate JSON object that contains image metadata: general description and list of keywords.
+        Images missing from truncated or short response are requested again.
+        """
+        self._check_image_count(len(images))
+
+        def encode_images() -> list[EncodedImage]:
+            # encode in parallel if images have preprocessor, then take cached results
+            images.encode()
+            return [img.encode() for img in images]
+
+        encoded_images = await asyncio.to_thread(encode_images)
+        total_size = sum(encoded.size for encoded in encoded_images)
+
+        logger.debug(f"Total image size: {total_size} bytes")
+
+        errors = []
+        if self._needs_upload(total_size):
+            logger.info(f"Total image size > {self._config.inline_size_limit} bytes, uploading files to the server")
+
+            async def image_file_part(img, encoded: EncodedImage) -> dict:
+                img_uri = self._lookup_uploaded_file(encoded)
+                if not img_uri and self._file_index.needs_refresh():
+                    await self._refresh_file_index()
+                    img_uri = self._lookup_uploaded_file(encoded)
+
+                if not img_uri:
+                    logger.debug(f"Image {img.get_filename()} doesn't exists on the server, uploading")
+                    try:
+                        img_uri = await self._upload_image(encoded, img.get_filename())
+                    except (ChatbotFailed, aiohttp.ClientError, KeyError, ValueError) as e:
+                        raise GeminiUploadFailed(img.get_filename(), str(e)) from e
+                return self._file_part(encoded, img_uri)
+
+            image_parts = await asyncio.gather(
+                *(image_file_part(img, encoded) for img, encoded in zip(images, encoded_images)),
+                return_exceptions=True
+            )
+            await asyncio.to_thread(self._file_index.save)
+
+            for i, image_part in enumerate(image_parts):
+                if isinstance(image_part, GeminiUploadFailed):
+                    logger.error(str(image_part))
+                    errors.append(image_part)
+                    image_parts[i] = None
+                elif isinstance(image_part, BaseException):
+                    raise image_part
+        else:
+            image_parts = await asyncio.to_thread(lambda: [self._inline_part(encoded) for encoded in encoded_images])
+
+        # generate descriptions for images that were uploaded, failed images are reported in errors
+        succeeded = [i for i, part in enumerate(image_parts) if part is not None]
+        if not succeeded:
+            raise errors[0]
+
+        response, body = await self._request(
+            "POST",
+            self._generate_content_url(),
+            headers={"Content-Type": "application/json"},
+            json=self._generate_content_payload([image_parts[i] for i in succeeded])
+        )
+        self._check_response(response, body)
+
+        descriptions = self._parse_generate_content_response(json.loads(body), len(succeeded))
+
+        results: list[ImageDescription | None] = [None] * len(images)
+        for i, description in zip(succeeded, descriptions):
+            results[i] = description
+
+        missing = [i for i, description in zip(succeeded, descriptions) if description is None]
+        if missing:
+            errors += await self._generate_missing(images, missing, results, attempt)
+
+        return self._chunk_result(len(images), list(range(len(images))), results, errors)
@@ -0,0 +1,463 @@
+from imgdescgenlib.chatbot.batching import plan_chunks
+from imgdescgenlib.chatbot.partial_json import parse_array_items
+from imgdescgenlib.chatbot.exceptions import ChatbotFailed, ChatbotPartiallyFailed
+from imgdescgenlib.chatbot.gemini.exceptions import GeminiModelRequired
+from imgdescgenlib.chatbot.gemini.file_index import GeminiFileIndex
+from imgdescgenlib.chatbot.gemini.schemas import (
+    GeminiConfig,
+    GeminiGenerateContentResponse,
+    GeminiUsageMetadata
+)
+from imgdescgenlib.chatbot.streaming import Base64Value
+from imgdescgenlib.image import EncodedImage, Image
+from imgdescgenlib.images import Images
+from imgdescgenlib.schemas import ImageDescription
+
+from pydantic import ValidationError
+
+from datetime import datetime, timedelta, timezone
+
+import base64
+import io
+import json
+import logging
+import math
+import PIL.Image
+
+logger = logging.getLogger("chatbotclient")
+
+# input tokens of one image tile
+IMAGE_TILE_TOKENS = 258
+
+# longer side assumed for image which dimensions can't be read, e.g. HEIC without decoder, if max dimension is not set
+UNKNOWN_IMAGE_DIMENSION = 3072
+
+# average number of characters in one text token
+CHARS_PER_TOKEN = 4
+
+# output token limit used if model doesn't report it
+DEFAULT_OUTPUT_TOKEN_LIMIT = 8192
+
+# observed output tokens per description are multiplied by this value, descriptions vary in length
+OUTPUT_TOKENS_MARGIN = 1.25
+
+# uploaded files are stored for 48 hours, used if upload response doesn't contain expiration time
+UPLOADED_FILE_LIFETIME = timedelta(hours=48)
+
+# max number of files returned by one files.list request
+FILES_PAGE_SIZE = 100
+
+# delay in seconds before first upload retry, doubled for each next retry
+UPLOAD_RETRY_DELAY = 1.0
+
+# appended to prompt if images are labeled with ids
+IMAGE_ID_PROMPT = ' Each image is preceded by its id, add it to each Image as "id": int.'
+
+class GeminiClientMixin:
+    """
+    Request building and response parsing shared by sync and async Gemini clients.
+    """
+    _config: GeminiConfig
+    _file_index: GeminiFileIndex
+
+    # token counts received from countTokens API
+    _image_tokens: dict[tuple[int, int], int] # resolution -> input tokens of image
+    _prompt_tokens: int | None
+    _token_counting: bool # disabled if countTokens fails
+    _output_tokens_per_image: int
+
+    def _init_token_counts(self):
+        self._image_tokens = {}
+        self._prompt_tokens = None
+        self._token_counting = self._config.count_tokens
+        self._output_tokens_per_image = self._config.description_output_tokens
+
+    def get_config(self) -> GeminiConfig:
+        """
+        Returns config object.
+        """
+        return self._config
+
+    def get_cache_key(self) -> str:
+        """
+        Returns string that identifies model and prompt, used as part of cached description key.
+        """
+        if not self._config.model_name:
+            raise GeminiModelRequired("Model name is required to use Gemini.")
+        return f"{self._config.model_name.name}\n{self._config.image_description_prompt}"
+
+    def get_image_max_dimension(self) -> int | None:
+        """
+        Returns target resolution of images for the configured model.
+        """
+        model_name = self._config.model_name.name if self._config.model_name else None
+        for prefix, max_dimension in self._config.model_image_max_dimension.items():
+            if model_name and model_name.startswith(prefix):
+                return max_dimension
+        return self._config.image_max_dimension
+
+    @staticmethod
+    def _place_description(descriptions: list[ImageDescription | None], item, position: int) -> int | None:
+        """
+        Validates item of response array and puts it to descriptions of images.
+        Item is matched to image by id if the model returned it, otherwise by position.
+        Returns index of image or None if item is invalid or its image already has description.
+        """
+        try:
+            description = ImageDescription.model_validate(item)
+        except ValidationError:
+            return None
+
+        index = item.get("id")
+        if not isinstance(index, int) or not 0 <= index < len(descriptions) or descriptions[index] is not None:
+            index = position
+        if index >= len(descriptions) or descriptions[index] is not None:
+            return None
+
+        descriptions[index] = description
+        return index
+
+    def _get_chatbot_structured_output(self, response: GeminiGenerateContentResponse, image_count: int) -> tuple[list[ImageDescription | None], bool]:
+        """
+        Extracts JSON array with image metadata from response: general description and list of keywords of each image.
+        Complete items of truncated array are kept, see _place_description.
+
+        Returns description of each image, None for missing ones, and True if the whole array was parsed.
+        """
+        parts = response.candidates[0].content.get("parts") or [{}]
+        items, complete = parse_array_items(parts[0].get("text", ""))
+
+        descriptions: list[ImageDescription | None] = [None] * image_count
+        for position, item in enumerate(items):
+            self._place_description(descriptions, item, position)
+
+        return descriptions, complete
+
+    def _estimate_image_tokens(self, img: Image) -> int:
+        """
+        Returns input tokens of image counted by countTokens for its resolution.
+        If not counted, estimates them: small images take one tile, larger ones are split into 768x768 tiles.
+        Image with unknown dimensions is estimated as a square of max dimension.
+        https://ai.google.dev/gemini-api/docs/vision?lang=rest#technical-details-image
+        """
+        dimensions = img.get_encoded_dimensions()
+        if dimensions is None:
+            side = self._config.image_max_dimension or UNKNOWN_IMAGE_DIMENSION
+            return math.ceil(side / 768) ** 2 * IMAGE_TILE_TOKENS
+
+        width, height = dimensions
+        counted = self._image_tokens.get((width, height))
+        if counted is not None:
+            return counted
+
+        if width <= 384 and height <= 384:
+            return IMAGE_TILE_TOKENS
+        return math.ceil(width / 768) * math.ceil(height / 768) * IMAGE_TILE_TOKENS
+
+    def _estimate_prompt_tokens(self) -> int:
+        if self._prompt_tokens is not None:
+            return self._prompt_tokens
+        return len(self._config.image_description_prompt) // CHARS_PER_TOKEN
+
+    def _estimate_request_tokens(self, images: list[Image]) -> int:
+        """
+        Estimates input tokens of generateContent request: prompt and images.
+        """
+        return self._estimate_prompt_tokens() + sum(self._estimate_image_tokens(img) for img in images)
+
+    def _uncounted_resolutions(self, images: Images) -> list[tuple[int, int]]:
+        """
+        Returns resolutions of images which tokens should be counted with countTokens.
+        """
+        if not self._token_counting:
+            return []
+
+        resolutions = dict.fromkeys(img.get_encoded_dimensions() for img in images)
+        return [resolution for resolution in resolutions if resolution is not None and resolution not in self._image_tokens]
+
+    @staticmethod
+    def _resolution_probe_part(width: int, height: int) -> dict:
+        """
+        Returns inline part with blank image of given resolution.
+        Image tokens depend only on resolution, so blank image is counted instead of sending real one.
+        """
+        buffer = io.BytesIO()
+        PIL.Image.new("L", (width, height)).save(buffer, format="JPEG", quality=10)
+        return {
+            "inlineData": {
+                "mimeType": "image/jpeg",
+                "data": base64.b64encode(buffer.getvalue()).decode("utf-8")
+            }
+        }
+
+    def _count_tokens_url(self) -> str:
+        return f"{self._config.base_url}/v1beta/{self._config.model_name.name}:countTokens?key={self._config.api_key}"
+
+    @staticmethod
+    def _count_tokens_payload(parts: list[dict]) -> dict:
+        return {"contents": [{"parts": parts}]}
+
+    def _get_output_token_limit(self) -> int:
+        """
+        Returns max output tokens of one request.
+        """
+        model_output_limit = getattr(self._config.model_name, "outputTokenLimit", None) or DEFAULT_OUTPUT_TOKEN_LIMIT
+        if self._config.chunk_max_output_tokens is None:
+            return model_output_limit
+        return min(self._config.chunk_max_output_tokens, model_output_limit)
+
+    def _update_output_tokens(self, usage_metadata: GeminiUsageMetadata, image_count: int):
+        """
+        Raises estimate of output tokens per description if descriptions of response were longer.
+        """
+        if not image_count:
+            return
+        observed = math.ceil(usage_metadata.candidatesTokenCount / image_count * OUTPUT_TOKENS_MARGIN)
+        if observed > self._output_tokens_per_image:
+            self._output_tokens_per_image = observed
+
+    def _plan_chunks(self, images: Images) -> list[list[int]]:
+        """
+        Splits images into chunks that fit image count, inline size, input and output token limits,
+        so that response is not truncated.
+        """
+        # sizes are needed for planning, encode images first so that preprocessor encodes them in parallel
+        images.encode()
+
+        max_tokens = self._config.chunk_max_tokens
+        model_input_limit = getattr(self._config.model_name, "inputTokenLimit", None)
+        if model_input_limit and (max_tokens is None or max_tokens > model_input_limit):
+            max_tokens = model_input_limit
+        if max_tokens is not None:
+            max_tokens -= self._estimate_prompt_tokens()
+
+        return plan_chunks(
+            [img.size() for img in images],
+            [self._estimate_image_tokens(img) for img in images],
+            min(self._config.chunk_max_image_count, self._config.max_image_count),
+            self._config.chunk_max_bytes,
+            max_tokens,
+            [self._output_tokens_per_image] * len(images),
+            self._get_output_token_limit()
+        )
+
+    @staticmethod
+    def _merge_chunk_results(image_count: int, chunks: list[list[int]], chunk_results: list[list[ImageDescription] | Exception]) -> list[ImageDescription]:
+        """
+        Merges chunk results back in input order.
+        Raises the error if all chunks failed and ChatbotPartiallyFailed if some of them failed.
+        """
+        results: list[ImageDescription] = [None] * image_count
+        errors: list[Exception] = []
+        for chunk, chunk_result in zip(chunks, chunk_results):
+            if isinstance(chunk_result, ChatbotPartiallyFailed):
+                errors += chunk_result.errors
+                chunk_result = chunk_result.results
+            elif isinstance(chunk_result, Exception):
+                errors.append(chunk_result)
+                continue
+
+            for i, description in zip(chunk, chunk_result):
+                results[i] = description
+
+        if errors:
+            if results.count(None) == image_count:
+                raise errors[0]
+            raise ChatbotPartiallyFailed(results, errors) from errors[0]
+
+        return results
+
+    @staticmethod
+    def _chunk_result(image_count: int, succeeded: list[int], descriptions: list[ImageDescription], errors: list[Exception]) -> list[ImageDescription]:
+        """
+        Returns descriptions of chunk where only images at succeeded indices were described.
+        Raises ChatbotPartiallyFailed if some images failed.
+        """
+        if not errors:
+            return descriptions
+
+        results: list[ImageDescription] = [None] * image_count
+        for i, description in zip(succeeded, descriptions):
+            results[i] = description
+        raise ChatbotPartiallyFailed(results, errors) from errors[0]
+
+    def _check_image_count(self, image_count: int):
+        """
+        Raises exception if image count exceeds the limit of one request.
+        """
+        if self._config.max_image_count < image_count:
+            raise ChatbotFailed(
+                f"Max image count is {self._config.max_image_count}, but got {image_count}. " \
+                "Adjust this value in config if specification is changed: https://ai.google.dev/gemini-api/docs/vision?lang=rest#technical-details-image"
+            )
+
+    def _needs_upload(self, total_size: int) -> bool:
+        """
+        Returns True if images should be uploaded instead of being sent inline
+        """
+        return self._config.force_upload or total_size > self._config.inline_size_limit
+
+    def _generate_content_url(self) -> str:
+        return f"{self._config.base_url}/v1beta/{self._config.model_name.name}:generateContent?key={self._config.api_key}"
+
+    def _stream_generate_content_url(self) -> str:
+        return f"{self._config.base_url}/v1beta/{self._config.model_name.name}:streamGenerateContent?alt=sse&key={self._config.api_key}"
+
+    @staticmethod
+    def _parse_stream_event(line: bytes | str) -> dict | None:
+        """
+        Returns data of server-sent event line, None for other lines.
+        """
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.startswith("data:"):
+            return None
+        return json.loads(line[len("data:"):])
+
+    @staticmethod
+    def _stream_event_text(event: dict) -> tuple[str, str | None]:
+        """
+        Returns text and finish reason of streamGenerateContent event, finish reason is set only in the last event.
+        """
+        candidates = event.get("candidates") or [{}]
+        parts = candidates[0].get("content", {}).get("parts") or []
+        return "".join(part.get("text", "") for part in parts), candidates[0].get("finishReason")
+
+    def _update_stream_usage(self, event: dict, image_count: int):
+        usage_metadata = event.get("usageMetadata") or {}
+        if "candidatesTokenCount" in usage_metadata:
+            self._update_output_tokens(
+                GeminiUsageMetadata(promptTokenCount=usage_metadata.get("promptTokenCount", 0), candidatesTokenCount=usage_metadata["candidatesTokenCount"]),
+                image_count
+            )
+
+    def _generate_content_payload(self, image_parts: list[dict]) -> dict:
+        """
+        Returns generateContent request body with prompt and image parts.
+        """
+        prompt = self._config.image_description_prompt
+        if self._config.label_images:
+            prompt += IMAGE_ID_PROMPT
+
+        parts = [{"text": prompt}]
+        for i, image_part in enumerate(image_parts):
+            if self._config.label_images:
+                parts.append({"text": f"Image id: {i}"})
+            parts.append(image_part)
+
+        return {
+            "contents": [{
+                "parts": parts
+            }],
+            "generationConfig": {
+                "response_mime_type": "application/json", # specify json response to get just json string without markdown
+            }
+        }
+
+    @staticmethod
+    def _inline_part(encoded: EncodedImage) -> dict:
+        return {
+            "inlineData": {
+                "mimeType": encoded.mime_type,
+                "data": encoded.base64
+            }
+        }
+
+    @staticmethod
+    def _inline_stream_part(encoded: EncodedImage) -> dict:
+        """
+        Returns inline part which data is base64 encoded only while request body is sent, see JsonStream.
+        """
+        return {
+            "inlineData": {
+                "mimeType": encoded.mime_type,
+                "data": Base64Value(encoded.data)
+            }
+        }
+
+    @staticmethod
+    def _file_part(encoded: EncodedImage, file_uri: str) -> dict:
+        return {
+            "file_data": {
+                "mimeType": encoded.mime_type,
+                "file_uri": file_uri
+            }
+        }
+
+    @staticmethod
+    def _file_sha256_hash(encoded: EncodedImage) -> str:
+        """
+        Returns image hash in format of GeminiFile.sha256Hash
+        """
+        return base64.b64encode(encoded.sha256.encode()).decode('utf-8')
+
+    def _lookup_uploaded_file(self, encoded: EncodedImage) -> str | None:
+        """
+        Returns URI of uploaded file with the same content or None.
+        """
+        return self._file_index.get(self._file_sha256_hash(encoded))
+
+    def _index_uploaded_file(self, encoded: EncodedImage, file: dict) -> str:
+        """
+        Adds file from upload response to the file index and returns its URI.
+        """
+        expiration_time = file.get("expirationTime") or datetime.now(timezone.utc) + UPLOADED_FILE_LIFETIME
+        self._file_index.add(self._file_sha256_hash(encoded), file["uri"], expiration_time)
+        return file["uri"]
+
+    def _files_url(self, page_token: str = None) -> str:
+        """
+        Returns URL of files.list request.
+        """
+        url = f"{self._config.base_url}/v1beta/files?key={self._config.api_key}&pageSize={FILES_PAGE_SIZE}"
+        if page_token:
+            url += f"&pageToken={page_token}"
+        return url
+
+    @staticmethod
+    def _upload_start_request(image_len: int, image_mime_type: str, image_filename: str) -> tuple[dict, dict]:
+        """
+        Returns headers and body of request that starts resumable upload.
+        """
+        headers = {
+            "X-Goog-Upload-Protocol": "resumable",
+            "X-Goog-Upload-Command": "start",
+            "X-Goog-Upload-Header-Content-Length": str(image_len),
+            "X-Goog-Upload-Header-Content-Type": image_mime_type,
+            "Content-Type": "application/json"
+        }
+        metadata = {
+            "file": {
+                "display_name": image_filename
+            }
+        }
+        return headers, metadata
+
+    def _parse_generate_content_response(self, response_json: dict, image_count: int) -> list[ImageDescription | None]:
+        """
+        Validates generateContent response and returns description of each image.
+        If response is truncated or short, descriptions that were generated are returned and missing ones are None.
+        Raises ChatbotFailed if there are no descriptions at all.
+        """
+        response_model = GeminiGenerateContentResponse(**response_json)
+        self._update_output_tokens(response_model.usageMetadata, image_count)
+
+        descriptions, complete = self._get_chatbot_structured_output(response_model, image_count)
+        self._check_structured_output(descriptions, complete, response_model.candidates[0].finishReason)
+        return descriptions
+
+    @staticmethod
+    def _check_structured_output(descriptions: list[ImageDescription | None], complete: bool, finish_reason: str | None):
+        """
+        Raises ChatbotFailed if response has no descriptions, warns if some of them are missing.
+        """
+        found = len(descriptions) - descriptions.count(None)
+        if finish_reason == "STOP" and complete and found == len(descriptions):
+            return
+
+        if not found:
+            if finish_reason != "STOP":
+                raise ChatbotFailed(f"Gemini stopped to generate tokens: {finish_reason}")
+            raise ChatbotFailed(f"Gemini returned no valid descriptions for {len(descriptions)} images")
+
+        logger.warning(f"Gemini returned {found} of {len(descriptions)} descriptions (finish reason {finish_reason})")
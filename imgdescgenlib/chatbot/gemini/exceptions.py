@@ -11,3 +11,12 @@ class GeminiModelRequired(GeminiFailed):
     Gemini model required exception.
     """
     pass
+
+class GeminiUploadFailed(GeminiFailed):
+    """
+    Gemini file upload failed exception.
+    """
+    def __init__(self, image_filename: str, reason: str):
+        super().__init__(f"Failed to upload {image_filename}: {reason}")
+
+        self.image_filename = image_filename
@@ -0,0 +1,124 @@
+from imgdescgenlib.chatbot.gemini.schemas import GeminiFile, GeminiFileIndexData, GeminiFileIndexEntry
+
+from datetime import datetime, timedelta, timezone
+
+import hashlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("chatbotclient")
+
+class GeminiFileIndex:
+    """
+    Local index of files uploaded to Gemini storage, maps file sha256Hash to its URI and expiration time.
+    Index can be stored in file between runs. It is bound to API key, index of another key is ignored on load.
+    """
+
+    # file must not expire before the request that uses it is processed
+    EXPIRATION_MARGIN = timedelta(minutes=10)
+
+    def __init__(self, api_key: str, path: str = None, refresh_interval: float = 3600):
+        """
+        Args:
+            api_key (str): API key that owns uploaded files.
+            path (str): Path to the index file, None to keep index only in memory.
+            refresh_interval (float): Time in seconds after which index should be refreshed from the server.
+        """
+        self._path = path
+        self._refresh_interval = refresh_interval
+        self._owner = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._data = GeminiFileIndexData(owner=self._owner)
+        self._load()
+
+    def _load(self):
+        if not self._path or not os.path.exists(self._path):
+            return
+
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                data = GeminiFileIndexData.model_validate_json(f.read())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load Gemini file index {self._path}: {e}")
+            return
+
+        if data.owner != self._owner:
+            logger.debug(f"Gemini file index {self._path} belongs to another API key, ignoring it")
+            return
+
+        self._data = data
+        self._drop_expired()
+
+    def save(self):
+        """
+        Writes index to file, if path is set.
+        """
+        if not self._path:
+            return
+
+        with self._save_lock:
+            with self._lock:
+                content = self._data.model_dump_json()
+
+            tmp_path = f"{self._path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp_path, self._path)
+
+    def _is_expired(self, entry: GeminiFileIndexEntry) -> bool:
+        return entry.expirationTime <= datetime.now(timezone.utc) + self.EXPIRATION_MARGIN
+
+    def _drop_expired(self):
+        with self._lock:
+            self._data.files = {
+                sha256_hash: entry for sha256_hash, entry in self._data.files.items()
+                if not self._is_expired(entry)
+            }
+
+    def get(self, sha256_hash: str) -> str | None:
+        """
+        Returns URI of file with the hash, None if file is unknown or expires soon.
+        """
+        with self._lock:
+            entry = self._data.files.get(sha256_hash)
+            if entry is None:
+                return None
+
+            if self._is_expired(entry):
+                del self._data.files[sha256_hash]
+                return None
+
+            return entry.uri
+
+    def add(self, sha256_hash: str, uri: str, expiration_time: datetime):
+        """
+        Adds uploaded file to the index.
+        """
+        with self._lock:
+            self._data.files[sha256_hash] = GeminiFileIndexEntry(uri=uri, expirationTime=expiration_time)
+
+    def needs_refresh(self) -> bool:
+        """
+        Returns True if index wasn't refreshed from the server for refresh interval.
+        """
+        with self._lock:
+            return self._data.refreshed is None or time.time() - self._data.refreshed > self._refresh_interval
+
+    def replace(self, files: list[GeminiFile]):
+        """
+        Replaces index with complete list of files from the server.
+        """
+        entries = {
+            file.sha256Hash: GeminiFileIndexEntry(uri=file.uri, expirationTime=file.expirationTime)
+            for file in files
+        }
+        with self._lock:
+            self._data.files = entries
+            self._data.refreshed = time.time()
+
+        self._drop_expired()
+        logger.debug(f"Gemini file index refreshed, {len(self._data.files)} files")
@@ -1,59 +1,84 @@
-from imgdescgenlib.chatbot.client_base import ChatbotClientBase
-from imgdescgenlib.chatbot.exceptions import ChatbotFailed
-from imgdescgenlib.chatbot.gemini.exceptions import GeminiModelRequired
+from imgdescgenlib.chatbot.client_base import ChatbotClientBase, is_retryable_status
+from imgdescgenlib.chatbot.exceptions import ChatbotFailed, ChatbotHttpRequestFailed, ChatbotPartiallyFailed
+from imgdescgenlib.chatbot.gemini.common import UPLOAD_RETRY_DELAY, GeminiClientMixin
+from imgdescgenlib.chatbot.gemini.exceptions import GeminiModelRequired, GeminiUploadFailed
+from imgdescgenlib.chatbot.gemini.file_index import GeminiFileIndex
 from imgdescgenlib.chatbot.gemini.schemas import (
     GeminiConfig,
+    GeminiCountTokensResponse,
     GeminiFileListResponse,
-    GeminiModelListResponse,
-    GeminiGenerateContentResponse
+    GeminiModelListResponse
 )
-from imgdescgenlib.image import Image
+from imgdescgenlib.chatbot.partial_json import ArrayItemParser
+from imgdescgenlib.chatbot.rate_limit import CircuitBreaker, RetryPolicy
+from imgdescgenlib.chatbot.streaming import BytesStream, JsonStream
+from imgdescgenlib.image import EncodedImage
 from imgdescgenlib.images import Images
 from imgdescgenlib.schemas import ImageDescription
 
-from pydantic import TypeAdapter
-
 import logging
-import base64
-import hashlib
-from io import BytesIO
+import requests
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator
 
 logger = logging.getLogger("chatbotclient")
 logger.setLevel(logging.getLogger().getEffectiveLevel())
 
-class GeminiClient(ChatbotClientBase):
+class GeminiClient(GeminiClientMixin, ChatbotClientBase):
     """
     Gemini client, requires API key to work.
     """
-    BASE_URL = "https://generativelanguage.googleapis.com"
 
     def __init__(self, config: GeminiConfig = None):
-        super().__init__()
-
         if not config:
             config = GeminiConfig()
         self._config = config
+        self._init_token_counts()
+
+        self._file_index = GeminiFileIndex(config.api_key, config.file_index_path, config.file_index_refresh_interval)
+        self._file_index_lock = threading.Lock()
+        self._upload_executor: ThreadPoolExecutor = None
+        self._upload_executor_lock = threading.Lock()
+
+        super().__init__(
+            pool_maxsize=config.max_workers + config.upload_workers,
+            requests_per_minute=config.requests_per_minute,
+            tokens_per_minute=config.tokens_per_minute,
+            retry_policy=RetryPolicy(config.max_retries, config.retry_base_delay, config.retry_max_delay),
+            circuit_breaker=CircuitBreaker(config.circuit_breaker_threshold, config.circuit_breaker_timeout) if config.circuit_breaker_threshold else None
+        )
 
-    def _get_chatbot_structured_output(self, response: GeminiGenerateContentResponse) -> list[ImageDescription]:
+    def _get_upload_executor(self) -> ThreadPoolExecutor:
         """
-        Extracts JSON object with image metadata from response dict: general description and list of keywords and converts it to dict type.
+        Returns pool of upload threads, pool is started on first use.
+        """
+        with self._upload_executor_lock:
+            if self._upload_executor is None:
+                self._upload_executor = ThreadPoolExecutor(max_workers=self._config.upload_workers, thread_name_prefix="gemini-upload")
+            return self._upload_executor
 
-        Returns list[ImageDescription].
+    def close(self):
         """
-        adapter = TypeAdapter(list[ImageDescription])
-        return adapter.validate_json(
-            response.candidates[0].content["parts"][0]["text"]
-        )
+        Stops upload threads and closes connections, they are started again on next use.
+        """
+        with self._upload_executor_lock:
+            if self._upload_executor is not None:
+                self._upload_executor.shutdown()
+                self._upload_executor = None
+        super().close()
 
     def get_available_models(self) -> GeminiModelListResponse:
         """
         Returns list of available and supported by library models from Gemini API.
-        Notes: 
+        Notes:
             - available doesn't mean that they are available for your API key.
             - supported means that they support generation methods: generateContent and countTokens.
         """
-        response = self.session.get(
-            f"{self.BASE_URL}/v1beta/models?key={self._config.api_key}",
+        response = self._request(
+            "GET",
+            f"{self._config.base_url}/v1beta/models?key={self._config.api_key}",
         )
 
         self._check_response(response)
@@ -61,158 +86,404 @@ class GeminiClient(ChatbotClientBase):
         model_list_response = GeminiModelListResponse(**response.json())
         return model_list_response.get_supported_models()
 
-    def get_config(self) -> GeminiConfig:
+    def _count_tokens(self, parts: list[dict]) -> int:
+        """
+        Returns number of input tokens of content parts, counted by countTokens API.
+        """
+        response = self._request(
+            "POST",
+            self._count_tokens_url(),
+            headers={"Content-Type": "application/json"},
+            json=self._count_tokens_payload(parts)
+        )
+        self._check_response(response)
+        return GeminiCountTokensResponse(**response.json()).totalTokens
+
+    def _update_token_counts(self, images: Images):
         """
-        Returns config object.
+        Counts tokens of prompt and of image resolutions that were not counted yet.
+        If counting fails, it is disabled and tokens are estimated.
         """
-        return self._config
+        resolutions = self._uncounted_resolutions(images)
+        if not resolutions:
+            return
+
+        try:
+            if self._prompt_tokens is None:
+                self._prompt_tokens = self._count_tokens([{"text": self._config.image_description_prompt}])
+            for width, height in resolutions:
+                self._image_tokens[(width, height)] = self._count_tokens([self._resolution_probe_part(width, height)])
+                logger.debug(f"Image {width}x{height} takes {self._image_tokens[(width, height)]} tokens")
+        except (ChatbotFailed, requests.RequestException) as e:
+            logger.warning(f"Failed to count tokens, estimating them instead: {e}")
+            self._token_counting = False
 
     def _uploaded_files(self) -> GeminiFileListResponse:
         """
-        Returns list of all files in Gemini storage.
+        Returns list of all files in Gemini storage, all pages are requested.
         """
         headers = {
             "Content-Type": "application/json"
         }
-        response = self.session.get(
-            f"{self.BASE_URL}/v1beta/files?key={self._config.api_key}",
-            headers=headers
-        )
-        self._check_response(response)
 
-        return GeminiFileListResponse(**response.json())
+        files = []
+        page_token = None
+        while True:
+            response = self._request(
+                "GET",
+                self._files_url(page_token),
+                headers=headers
+            )
+            self._check_response(response)
+
+            page = GeminiFileListResponse(**response.json())
+            files += page.files
 
-    def _upload_image(self, image_buffer: BytesIO, image_filename: str) -> str:
+            page_token = page.nextPageToken
+            if not page_token:
+                break
+
+        return GeminiFileListResponse(files=files)
+
+    def _refresh_file_index(self):
         """
-        Uploads image to the Gemini storage using media.load method of the File API and returns URL.
+        Reloads uploaded file index from the server if it is outdated.
         """
-        if not self._config.model_name:
-            raise GeminiModelRequired
+        with self._file_index_lock:
+            # index could be refreshed by another chunk while waiting for lock
+            if not self._file_index.needs_refresh():
+                return
 
-        image_len = image_buffer.getbuffer().nbytes
+            self._file_index.replace(self._uploaded_files().files)
+            self._file_index.save()
 
-        headers = {
-            "X-Goog-Upload-Protocol": "resumable",
-            "X-Goog-Upload-Command": "start",
-            "X-Goog-Upload-Header-Content-Length": str(image_len),
-            "X-Goog-Upload-Header-Content-Type": "image/jpeg",
-            "Content-Type": "application/json"
-        }
-        metadata = {
-            "file": {
-                "display_name": image_filename
-            }
-        }
-
-        res = self.session.post(
-            f"{self.BASE_URL}/upload/v1beta/files?key={self._config.api_key}",
+    def _start_upload(self, encoded: EncodedImage, image_filename: str) -> str:
+        """
+        Starts resumable upload and returns upload URL.
+        """
+        headers, metadata = self._upload_start_request(encoded.size, encoded.mime_type, image_filename)
+        res = self._request(
+            "POST",
+            f"{self._config.base_url}/upload/v1beta/files?key={self._config.api_key}",
             headers=headers,
             json=metadata
         )
+        self._check_response(res)
 
         upload_url = res.headers.get("X-Goog-Upload-URL")
         if not upload_url:
             raise ChatbotFailed("Failed to get upload URL")
+        return upload_url
 
-        upload_headers = {
-            "Content-Length": str(image_len),
-            "X-Goog-Upload-Offset": "0",
-            "X-Goog-Upload-Command": "upload, finalize"
-        }
+    def _query_upload(self, upload_url: str) -> tuple[str, int, dict | None]:
+        """
+        Requests status of resumable upload.
+        Returns upload status, number of bytes received by the server and file if upload is finished.
+        """
+        res = self.session.post(upload_url, headers={"X-Goog-Upload-Command": "query"})
+        self._check_response(res)
 
-        res = self.session.post(upload_url, headers=upload_headers, data=image_buffer.getbuffer())
-        res_json = res.json()
+        status = res.headers.get("X-Goog-Upload-Status", "")
+        size_received = int(res.headers.get("X-Goog-Upload-Size-Received", 0))
+        file = res.json().get("file") if status == "final" and res.content else None
+        return status, size_received, file
 
-        return res_json["file"]["uri"]
+    def _upload_image(self, encoded: EncodedImage, image_filename: str) -> str:
+        """
+        Uploads image to the Gemini storage using media.load method of the File API and returns URL.
+        Image is streamed from memory. If connection drops, upload is resumed from the offset received by the server.
+        Uploaded file is added to the file index. Any failure is raised as GeminiUploadFailed, so it fails only this image.
+        """
+        if not self._config.model_name:
+            raise GeminiModelRequired
+
+        image_len = encoded.size
+        upload_url = None
+        last_error: Exception = None
+        started = time.monotonic()
+        for attempt in range(self._config.upload_retries + 1):
+            if attempt:
+                time.sleep(UPLOAD_RETRY_DELAY * 2 ** (attempt - 1))
+
+            try:
+                offset = 0
+                if upload_url:
+                    status, offset, file = self._query_upload(upload_url)
+                    if status == "final" and file:
+                        return self._index_uploaded_file(encoded, file)
+                    if status != "active":
+                        # upload session is lost, start a new one
+                        upload_url = None
+                        offset = 0
+
+                if not upload_url:
+                    upload_url = self._start_upload(encoded, image_filename)
+
+                upload_headers = {
+                    "X-Goog-Upload-Offset": str(offset),
+                    "X-Goog-Upload-Command": "upload, finalize"
+                }
+                res = self.session.post(upload_url, headers=upload_headers, data=BytesStream(encoded.data, offset))
+                self._check_response(res)
+
+                elapsed = time.monotonic() - started
+                logger.info(
+                    f"Uploaded {image_filename}: {image_len} bytes in {elapsed:.2f} s " \
+                    f"({image_len / max(elapsed, 1e-6) / 1024 / 1024:.2f} MB/s, {attempt + 1} attempts)"
+                )
+                return self._index_uploaded_file(encoded, res.json()["file"])
+            except (requests.ConnectionError, requests.Timeout) as e:
+                logger.warning(f"Upload of {image_filename} was interrupted: {e}")
+                last_error = e
+            except ChatbotHttpRequestFailed as e:
+                if not is_retryable_status(e._status_code):
+                    raise GeminiUploadFailed(image_filename, str(e)) from e
+                logger.warning(f"Upload of {image_filename} failed: {e}")
+                last_error = e
+            except (ChatbotFailed, KeyError, ValueError) as e:
+                # no upload URL, open circuit breaker or unexpected response fail only this image
+                raise GeminiUploadFailed(image_filename, str(e) or repr(e)) from e
+
+        raise GeminiUploadFailed(image_filename, str(last_error)) from last_error
+
+    def _upload_images(self, images: Images) -> tuple[list[dict | None], list[GeminiUploadFailed]]:
+        """
+        Finds uploaded images in the file index and uploads the rest in parallel.
+        Returns file part of each image, None for images that failed to upload, and upload errors.
+        """
+        image_parts: list[dict | None] = [None] * len(images)
+        futures = {}
+        for i, img in enumerate(images):
+            encoded = img.encode()
+
+            img_uri = self._lookup_uploaded_file(encoded)
+            if not img_uri and self._file_index.needs_refresh():
+                self._refresh_file_index()
+                img_uri = self._lookup_uploaded_file(encoded)
+
+            if img_uri:
+                logger.debug(f"Image {img.get_filename()} already exists on the server, using existing uri")
+                image_parts[i] = self._file_part(encoded, img_uri)
+            else:
+                logger.debug(f"Image {img.get_filename()} doesn't exists on the server, uploading")
+                futures[self._get_upload_executor().submit(self._upload_image, encoded, img.get_filename())] = (i, encoded)
+
+        errors: list[GeminiUploadFailed] = []
+        for future in as_completed(futures):
+            i, encoded = futures[future]
+            try:
+                image_parts[i] = self._file_part(encoded, future.result())
+            except GeminiUploadFailed as e:
+                logger.error(str(e))
+                errors.append(e)
+
+        if futures:
+            self._file_index.save()
+
+        return image_parts, errors
+
+    def prepare_images(self, images: Images):
+        """
+        Uploads images of chunks that are too large to be sent inline.
+        Images that failed to upload are uploaded again on generation.
+        """
+        if not self._config.model_name:
+            raise GeminiModelRequired("Model name is required to use Gemini.")
+
+        self._update_token_counts(images)
+        for chunk in self._plan_chunks(images):
+            chunk_images = images.subset(chunk)
+            if self._needs_upload(chunk_images.calculate_size()):
+                self._upload_images(chunk_images)
 
     def generate_image_description(self, images: Images) -> list[ImageDescription]:
         """
-        Sends generateContent request to Gemini to generate JSON object that contains image metadata: general description and list of keywords 
+        Generates descriptions for images.
+        Images are split into chunks that are sent concurrently, results are returned in input order.
         """
         if not self._config.model_name:
             raise GeminiModelRequired("Model name is required to use Gemini.")
 
-        if self._config.max_image_count < len(images._images):
-            raise ChatbotFailed(
-                f"Max image count is {self._config.max_image_count}, but got {len(images._images)}. " \
-                "Adjust this value in config if specification is changed: https://ai.google.dev/gemini-api/docs/vision?lang=rest#technical-details-image"
-            )
+        self._update_token_counts(images)
+        chunks = self._plan_chunks(images)
+        logger.debug(f"Split {len(images)} images into {len(chunks)} chunks")
 
-        headers = {
-            "Content-Type": "application/json"
-        }
+        if len(chunks) == 1:
+            return self._generate_chunk(images)
 
-        payload = {
-            "contents": [{
-                "parts": [
-                    {
-                        "text": self._config.image_description_prompt,
-                    },
-                ]
-            }],
-            "generationConfig": {
-                "response_mime_type": "application/json", # specify json response to get just json string without markdown
-            }
-        }
+        def generate_chunk(chunk: list[int]) -> list[ImageDescription] | ChatbotFailed:
+            try:
+                return self._generate_chunk(images.subset(chunk))
+            except ChatbotFailed as e:
+                logger.warning(f"Failed to generate description for chunk of {len(chunk)} images: {e}")
+                return e
+
+        with ThreadPoolExecutor(max_workers=self._config.max_workers) as executor:
+            chunk_results = list(executor.map(generate_chunk, chunks))
+
+        return self._merge_chunk_results(len(images), chunks, chunk_results)
+
+    def _generate_missing(self, images: Images, missing: list[int], results: list[ImageDescription | None], attempt: int) -> list[Exception]:
+        """
+        Requests descriptions of images missing from response again, in chunks planned with updated output estimate.
+        Fills results and returns errors of images that are still missing.
+        """
+        if attempt >= self._config.missing_retries:
+            return [ChatbotFailed(f"Gemini returned no description for {len(missing)} images")]
+
+        logger.info(f"Requesting {len(missing)} missing descriptions again")
+        errors = []
+        for chunk in self._plan_chunks(images.subset(missing)):
+            chunk_indices = [missing[i] for i in chunk]
+            try:
+                chunk_results = self._generate_chunk(images.subset(chunk_indices), attempt + 1)
+            except ChatbotPartiallyFailed as e:
+                chunk_results = e.results
+                errors += e.errors
+            except ChatbotFailed as e:
+                errors.append(e)
+                continue
+
+            for i, description in zip(chunk_indices, chunk_results):
+                results[i] = description
+        return errors
+
+    def _prepare_image_parts(self, images: Images) -> tuple[list[dict | None], list[Exception]]:
+        """
+        Returns image parts of request: inline or uploaded if total size exceeds inline limit.
+        Parts of images that failed to upload are None, their errors are returned.
+        """
+        self._check_image_count(len(images))
 
         total_size = images.calculate_size()
-        # TODO: take out size constraints to config
 
         logger.debug(f"Total image size: {total_size} bytes")
 
-        # if total image size > 20mb, upload files to the server and get urls
-        if self._config.force_upload or total_size > 20*1024*1024: # 20mb
-            logger.info(f"Total image size > 20mb, uploading files to the server")
-
-            response = self._uploaded_files()
+        # if total image size exceeds inline limit, upload files to the server and get urls
+        if self._needs_upload(total_size):
+            logger.info(f"Total image size > {self._config.inline_size_limit} bytes, uploading files to the server")
+            return self._upload_images(images)
+        return [self._inline_stream_part(img.encode()) for img in images], []
 
-            # find image by hash or upload
-            for img in images._images:
-                buf = img.save_to_buffer()
+    def _generate_chunk(self, images: Images, attempt: int = 0) -> list[ImageDescription]:
+        """
+        Sends generateContent request to Gemini to generate JSON object that contains image metadata: general description and list of keywords.
+        Images missing from truncated or short response are requested again.
+        """
+        headers = {
+            "Content-Type": "application/json"
+        }
 
-                img_sha256Hash = base64.b64encode(hashlib.sha256(buf.getvalue()).hexdigest().encode()).decode('utf-8')
-                img_uri = next(
-                    (file.uri for file in response.files if file.sha256Hash == img_sha256Hash),
-                    None
-                )
+        image_parts, errors = self._prepare_image_parts(images)
 
-                if not img_uri:
-                    logger.debug(f"Image {img.get_filename()} doesn't exists on the server, uploading")
-                    img_uri = self._upload_image(buf, img.get_filename())
-                    assert img_uri
-                    # what if upload fails
-                else:
-                    logger.debug(f"Image {img.get_filename()} already exists on the server, using existing uri")
-
-                payload["contents"][0]["parts"].append(
-                    {
-                        "file_data": {
-                            "mimeType": "image/jpeg",
-                            "file_uri": img_uri
-                        }
-                    }
-                )
-        else:
-            imgs_base64 = images.encode_base64()
-            for img_base64 in imgs_base64:
-                payload["contents"][0]["parts"].append(
-                    {
-                        "inlineData": {
-                            "mimeType": "image/jpeg",
-                            "data": img_base64
-                        }
-                    }
-                )
+        # generate descriptions for images that were uploaded, failed images are reported in errors
+        succeeded = [i for i, part in enumerate(image_parts) if part is not None]
+        if not succeeded:
+            raise errors[0]
 
-        response = self.session.post(
-            f"{self.BASE_URL}/v1beta/{self._config.model_name.name}:generateContent?key={self._config.api_key}",
+        response = self._request(
+            "POST",
+            self._generate_content_url(),
+            tokens=self._estimate_request_tokens([images[i] for i in succeeded]),
             headers=headers,
-            json=payload
+            data=JsonStream(self._generate_content_payload([image_parts[i] for i in succeeded]))
         )
         self._check_response(response)
 
-        response_model = GeminiGenerateContentResponse(**response.json())
-        if response_model.candidates[0].finishReason != "STOP":
-            raise ChatbotFailed(f"Gemini stopped to generate tokens: {response_model.candidates[0].finishReason}")
+        descriptions = self._parse_generate_content_response(response.json(), len(succeeded))
+
+        results: list[ImageDescription | None] = [None] * len(images)
+        for i, description in zip(succeeded, descriptions):
+            results[i] = description
+
+        missing = [i for i, description in zip(succeeded, descriptions) if description is None]
+        if missing:
+            errors += self._generate_missing(images, missing, results, attempt)
+
+        return self._chunk_result(len(images), list(range(len(images))), results, errors)
+
+    def generate_image_description_stream(self, images: Images) -> Iterator[tuple[int, ImageDescription]]:
+        """
+        Generates descriptions with streamGenerateContent and yields index of image and its description
+        as soon as the description is complete, so results of early images are available while later ones are generated.
+        Chunks are streamed one after another. Images missing from the stream are requested again at the end of their chunk.
+
+        Raises:
+            ChatbotPartiallyFailed: After all results were yielded, if some images failed.
+        """
+        if not self._config.model_name:
+            raise GeminiModelRequired("Model name is required to use Gemini.")
+
+        self._update_token_counts(images)
+        chunks = self._plan_chunks(images)
+        logger.debug(f"Split {len(images)} images into {len(chunks)} chunks")
+
+        results: list[ImageDescription | None] = [None] * len(images)
+        errors: list[Exception] = []
+        for chunk in chunks:
+            chunk_images = images.subset(chunk)
+            chunk_results: list[ImageDescription | None] = [None] * len(chunk)
+            try:
+                for i, description in self._stream_chunk(chunk_images, chunk_results, errors):
+                    results[chunk[i]] = description
+                    yield chunk[i], description
+            except ChatbotFailed as e:
+                logger.warning(f"Failed to stream description for chunk of {len(chunk)} images: {e}")
+                errors.append(e)
+
+        if errors:
+            if results.count(None) == len(images):
+                raise errors[0]
+            raise ChatbotPartiallyFailed(results, errors) from errors[0]
+
+    def _stream_chunk(self, images: Images, results: list[ImageDescription | None], errors: list[Exception]) -> Iterator[tuple[int, ImageDescription]]:
+        """
+        Streams descriptions of chunk, fills results and yields index and description of each image.
+        Errors of images that are not described are added to errors.
+        """
+        image_parts, upload_errors = self._prepare_image_parts(images)
+        errors += upload_errors
+
+        succeeded = [i for i, part in enumerate(image_parts) if part is not None]
+        if not succeeded:
+            return
+
+        response = self._request(
+            "POST",
+            self._stream_generate_content_url(),
+            tokens=self._estimate_request_tokens([images[i] for i in succeeded]),
+            headers={"Content-Type": "application/json"},
+            data=JsonStream(self._generate_content_payload([image_parts[i] for i in succeeded])),
+            stream=True
+        )
+        self._check_response(response)
 
-        return self._get_chatbot_structured_output(response_model)
\ No newline at end of file
+        descriptions: list[ImageDescription | None] = [None] * len(succeeded)
+        parser = ArrayItemParser()
+        finish_reason = None
+        with response:
+            for line in response.iter_lines():
+                event = self._parse_stream_event(line)
+                if event is None:
+                    continue
+
+                text, event_finish_reason = self._stream_event_text(event)
+                finish_reason = event_finish_reason or finish_reason
+                self._update_stream_usage(event, len(succeeded))
+
+                items = parser.feed(text)
+                start = parser.item_count - len(items) # position of the first item in response array
+                for position, item in enumerate(items, start):
+                    index = self._place_description(descriptions, item, position)
+                    if index is not None:
+                        results[succeeded[index]] = descriptions[index]
+                        yield succeeded[index], descriptions[index]
+
+        self._check_structured_output(descriptions, parser.complete, finish_reason)
+
+        missing = [i for i, description in zip(succeeded, descriptions) if description is None]
+        if missing:
+            errors += self._generate_missing(images, missing, results, 0)
+            for i in missing:
+                if results[i] is not None:
+                    yield i, results[i]
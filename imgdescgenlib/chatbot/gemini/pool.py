@@ -0,0 +1,201 @@
+from imgdescgenlib.chatbot.base import ChatbotBase
+from imgdescgenlib.chatbot.exceptions import ChatbotCircuitOpen, ChatbotFailed, ChatbotHttpRequestFailed, ChatbotPartiallyFailed
+from imgdescgenlib.chatbot.gemini.exceptions import GeminiModelRequired
+from imgdescgenlib.chatbot.gemini.gemini import GeminiClient
+from imgdescgenlib.chatbot.gemini.schemas import GeminiConfig
+from imgdescgenlib.images import Images
+from imgdescgenlib.schemas import ImageDescription
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("chatbotclient")
+
+class GeminiPoolMember:
+    """
+    Client of one API key and base URL with its load and error statistics.
+    """
+    def __init__(self, client: GeminiClient, weight: float):
+        self.client = client
+        self.weight = weight
+        self.in_flight = 0 # chunks being generated
+        self.requests = 0 # chunks sent
+        self.failures = 0 # chunks failed
+        self.rate_limited = 0 # consecutive chunks failed with 429
+        self.ejected_until = 0.0 # monotonic time until which member is not used
+
+    def __repr__(self) -> str:
+        return f"{self.client.get_config().base_url}: in flight {self.in_flight}, requests {self.requests}, " \
+            f"failures {self.failures}, rate limited {self.rate_limited}"
+
+class GeminiClientPool(ChatbotBase):
+    """
+    Spreads chunks of images across Gemini clients with different API keys or base URLs, so throughput is not capped by quota of one key.
+    Each chunk goes to the least loaded client relative to its weight. Client that is rate limited (429) several times in a row
+    is ejected for a while, chunk that failed with rate limit or server error is sent to another client.
+    All clients must use the same model and prompt. Images are uploaded by the client that generates their chunk,
+    because uploaded files belong to the API key.
+    """
+    def __init__(
+        self,
+        configs: list[GeminiConfig],
+        weights: list[float] = None,
+        eject_after: int = 3,
+        eject_duration: float = 60.0
+    ):
+        """
+        Args:
+            configs (list[GeminiConfig]): Config of each client, with its own api_key, base_url and quota limits.
+                If file_index_path is set, it must be different for each key.
+            weights (list[float]): Relative capacity of each client, e.g. its requests per minute quota. Equal if None.
+            eject_after (int): Number of consecutive rate limited chunks after which client is ejected.
+            eject_duration (float): Seconds client is not used after ejection.
+        """
+        if not configs:
+            raise ValueError("At least one Gemini config is required")
+        if weights is not None and len(weights) != len(configs):
+            raise ValueError("Number of weights must match number of configs")
+
+        self._members = [
+            GeminiPoolMember(GeminiClient(config), weight)
+            for config, weight in zip(configs, weights or [1.0] * len(configs))
+        ]
+        self._eject_after = eject_after
+        self._eject_duration = eject_duration
+        self._lock = threading.Lock()
+
+        # chunks are planned by the first client, all clients share its counted image tokens
+        self._planner = self._members[0].client
+        for member in self._members[1:]:
+            member.client._image_tokens = self._planner._image_tokens
+
+    def close(self):
+        """
+        Closes clients of the pool, see GeminiClient.close.
+        """
+        for member in self._members:
+            member.client.close()
+
+    def get_members(self) -> list[GeminiPoolMember]:
+        """
+        Returns clients of the pool with their statistics.
+        """
+        return self._members
+
+    def get_cache_key(self) -> str:
+        return self._members[0].client.get_cache_key()
+
+    def get_image_max_dimension(self) -> int | None:
+        return self._members[0].client.get_image_max_dimension()
+
+    def _acquire(self, exclude: list[GeminiPoolMember]) -> GeminiPoolMember:
+        """
+        Selects the least loaded client that is not ejected and not excluded, and marks chunk as in flight on it.
+        If all clients are ejected, the one whose ejection ends first is used.
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [member for member in self._members if member not in exclude] or self._members
+            available = [member for member in candidates if member.ejected_until <= now]
+            if available:
+                member = min(available, key=lambda member: ((member.in_flight + 1) / member.weight, member.requests / member.weight))
+            else:
+                member = min(candidates, key=lambda member: member.ejected_until)
+
+            member.in_flight += 1
+            member.requests += 1
+            return member
+
+    def _release(self, member: GeminiPoolMember, error: Exception = None):
+        """
+        Updates statistics of client after chunk is done, ejects client after repeated rate limits.
+        """
+        with self._lock:
+            member.in_flight -= 1
+            if error is None:
+                member.rate_limited = 0
+                return
+
+            member.failures += 1
+            if isinstance(error, ChatbotHttpRequestFailed) and error._status_code == 429:
+                member.rate_limited += 1
+                if member.rate_limited >= self._eject_after:
+                    member.ejected_until = time.monotonic() + self._eject_duration
+                    member.rate_limited = 0
+                    logger.warning(f"Gemini client {member.client.get_config().base_url} is rate limited, ejected for {self._eject_duration} s")
+            elif isinstance(error, ChatbotCircuitOpen):
+                member.ejected_until = time.monotonic() + self._eject_duration
+
+    def _share_token_counts(self):
+        """
+        Makes all clients use counted prompt tokens of the planner and the highest output estimate raised by any response,
+        so chunks are planned and rate limited with what was learned from chunks sent with other keys.
+        """
+        with self._lock:
+            output_tokens = max(member.client._output_tokens_per_image for member in self._members)
+            for member in self._members:
+                member.client._output_tokens_per_image = output_tokens
+                member.client._prompt_tokens = self._planner._prompt_tokens
+                member.client._token_counting = self._planner._token_counting
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        """
+        Returns True if chunk that failed with error can succeed with another client.
+        """
+        if isinstance(error, ChatbotHttpRequestFailed):
+            return error._status_code == 429 or error._status_code >= 500
+        return isinstance(error, ChatbotCircuitOpen)
+
+    def _generate_chunk(self, images: Images) -> list[ImageDescription]:
+        """
+        Generates descriptions of chunk, chunk is moved to another client if it failed with rate limit or server error.
+        """
+        tried: list[GeminiPoolMember] = []
+        while True:
+            member = self._acquire(tried)
+            tried.append(member)
+            try:
+                descriptions = member.client._generate_chunk(images)
+            except ChatbotPartiallyFailed:
+                self._release(member)
+                self._share_token_counts()
+                raise
+            except ChatbotFailed as e:
+                self._release(member, e)
+                if not self._is_retryable(e) or len(tried) >= len(self._members):
+                    raise
+                logger.warning(f"Chunk of {len(images)} images failed on {member.client.get_config().base_url}, trying another client: {e}")
+                continue
+
+            self._release(member)
+            self._share_token_counts()
+            return descriptions
+
+    def generate_image_description(self, images: Images) -> list[ImageDescription]:
+        """
+        Generates descriptions for images.
+        Images are split into chunks that are sent concurrently to clients of the pool, results are returned in input order.
+        """
+        if not self._planner.get_config().model_name:
+            raise GeminiModelRequired("Model name is required to use Gemini.")
+
+        self._planner._update_token_counts(images)
+        self._share_token_counts()
+        chunks = self._planner._plan_chunks(images)
+        logger.debug(f"Split {len(images)} images into {len(chunks)} chunks for {len(self._members)} clients")
+
+        def generate_chunk(chunk: list[int]) -> list[ImageDescription] | ChatbotFailed:
+            try:
+                return self._generate_chunk(images.subset(chunk))
+            except ChatbotFailed as e:
+                logger.warning(f"Failed to generate description for chunk of {len(chunk)} images: {e}")
+                return e
+
+        max_workers = sum(member.client.get_config().max_workers for member in self._members)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            chunk_results = list(executor.map(generate_chunk, chunks))
+
+        return self._planner._merge_chunk_results(len(images), chunks, chunk_results)
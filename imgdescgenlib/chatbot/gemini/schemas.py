@@ -1,3 +1,4 @@
+from datetime import datetime
 from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -60,6 +61,12 @@ class GeminiGenerateContentResponse(BaseModel):
     candidates: list[GeminiCanditate]
     usageMetadata: GeminiUsageMetadata
 
+class GeminiCountTokensResponse(BaseModel):
+    """
+    Response of countTokens API.
+    """
+    totalTokens: int
+
 class GeminiFile(BaseModel):
     name: str
     displayName: str
@@ -76,6 +83,21 @@ class GeminiFileListResponse(BaseModel):
     files: list[GeminiFile] = []
     nextPageToken: str | None = None
 
+class GeminiFileIndexEntry(BaseModel):
+    """
+    Uploaded file stored in local file index.
+    """
+    uri: str
+    expirationTime: datetime
+
+class GeminiFileIndexData(BaseModel):
+    """
+    Content of local file index file.
+    """
+    owner: str # hash of API key that owns the files
+    refreshed: float | None = None # time of last refresh from the server
+    files: dict[str, GeminiFileIndexEntry] = {} # sha256Hash -> file
+
 class GeminiConfig(BaseSettings):
     """
     Gemini config class, used to store API key and other settings.
@@ -83,9 +105,36 @@ class GeminiConfig(BaseSettings):
     model_config = SettingsConfigDict(env_prefix='GEMINI_')
 
     api_key: str = ""
+    base_url: str = "https://generativelanguage.googleapis.com" # can be changed to use proxy or local test server
     model_name: GeminiModelName | None = None
     # TODO: write image schema from GeminiImageDescription
     image_description_prompt: str = 'Write a detailed description and key words of the each image, ' \
                 'with this JSON schema: Image = {"description": str, "keywords": list[str]} Return: list[Image]}.'
     max_image_count: int = 3600 # https://ai.google.dev/gemini-api/docs/vision?lang=rest#technical-details-image
-    force_upload: bool = False # force uploading images
\ No newline at end of file
+    force_upload: bool = False # force uploading images
+    # images are downscaled so that their longer side doesn't exceed this value, model downsamples larger images anyway
+    image_max_dimension: int | None = 3072
+    model_image_max_dimension: dict[str, int] = {} # model name prefix -> max dimension, overrides image_max_dimension
+    inline_size_limit: int = 20*1024*1024 # images are uploaded if their total size in request exceeds this value
+    # images are split into chunks, each chunk is sent in separate request
+    chunk_max_image_count: int = 50
+    chunk_max_bytes: int | None = 20*1024*1024
+    chunk_max_tokens: int | None = None # if None, model inputTokenLimit is used
+    chunk_max_output_tokens: int | None = None # if None, model outputTokenLimit is used
+    description_output_tokens: int = 300 # initial estimate of output tokens of one description, raised from responses
+    label_images: bool = True # precede each image with its id, so descriptions are matched to images by id
+    missing_retries: int = 2 # number of times images missing from truncated or short response are requested again
+    count_tokens: bool = True # count image tokens with countTokens API once per resolution instead of estimating
+    max_workers: int = 4 # number of chunks sent concurrently
+    upload_workers: int = 4 # number of images uploaded concurrently
+    upload_retries: int = 3 # number of times interrupted upload is resumed before image is reported as failed
+    file_index_path: str | None = None # file to keep index of uploaded files between runs
+    file_index_refresh_interval: float = 3600 # seconds after which uploaded file list is requested again
+    # client side rate limits, set them to your quota
+    requests_per_minute: float | None = None
+    tokens_per_minute: float | None = None
+    max_retries: int = 3 # number of retries of request rate limited or failed with server error
+    retry_base_delay: float = 1.0 # max delay in seconds before first retry, doubled for each next retry
+    retry_max_delay: float = 60.0
+    circuit_breaker_threshold: int = 5 # number of consecutive failed requests that pauses requests, 0 to disable
+    circuit_breaker_timeout: float = 30.0 # seconds requests are paused for
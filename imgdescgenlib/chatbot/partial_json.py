@@ -0,0 +1,84 @@
+import json
+
+_decoder = json.JSONDecoder()
+
+_WHITESPACE = " \t\n\r"
+
+class ArrayItemParser:
+    """
+    Incremental parser of JSON array that returns each item as soon as its text is complete.
+    Text of array is fed in pieces, e.g. as it is streamed from the server.
+    """
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0 # start of the next unparsed item
+        self._started = False
+        self.item_count = 0 # number of items parsed so far
+        self.complete = False # closing bracket of array was parsed
+        self.failed = False # text is not valid JSON array, the rest of it is ignored
+
+    def feed(self, text: str) -> list:
+        """
+        Adds text to the buffer and returns items completed by it.
+        """
+        self._buffer += text
+        items = []
+        while not self.complete and not self.failed:
+            position = self._skip_whitespace(self._position)
+            if position >= len(self._buffer):
+                break
+
+            if not self._started:
+                start = self._buffer.find("[", position)
+                if start < 0:
+                    break
+                self._started = True
+                self._position = start + 1
+                continue
+
+            if self._buffer[position] == "]":
+                self.complete = True
+                break
+
+            if self._buffer[position] == ",":
+                position = self._skip_whitespace(position + 1)
+                if position >= len(self._buffer):
+                    break
+            elif self.item_count:
+                self.failed = True
+                break
+
+            try:
+                item, end = _decoder.raw_decode(self._buffer, position)
+            except json.JSONDecodeError:
+                # item is incomplete, wait for more text
+                break
+
+            items.append(item)
+            self.item_count += 1
+            self._position = end
+
+        # parsed text is not needed anymore
+        self._buffer = self._buffer[self._position:]
+        self._position = 0
+        return items
+
+    def _skip_whitespace(self, position: int) -> int:
+        while position < len(self._buffer) and self._buffer[position] in _WHITESPACE:
+            position += 1
+        return position
+
+def parse_array_items(text: str) -> tuple[list, bool]:
+    """
+    Parses items of JSON array one by one, so complete items are returned even if array is truncated.
+    Parsing stops at the first item that is not valid JSON.
+
+    Args:
+        text (str): JSON array, possibly cut off at any position.
+
+    Returns:
+        tuple[list, bool]: Parsed items and True if the whole array was parsed.
+    """
+    parser = ArrayItemParser()
+    items = parser.feed(text)
+    return items, parser.complete
@@ -0,0 +1,144 @@
+import email.utils
+import random
+import threading
+import time
+
+from imgdescgenlib.chatbot.exceptions import ChatbotCircuitOpen
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting rate of requests or tokens per minute.
+    Request that needs more than bucket capacity waits for full bucket and leaves it in debt,
+    so average rate never exceeds the limit.
+    """
+    def __init__(self, rate_per_minute: float, burst_seconds: float = 10.0):
+        """
+        Args:
+            rate_per_minute (float): Number of tokens added to the bucket per minute.
+            burst_seconds (float): Bucket capacity expressed in seconds of refill.
+                Smaller capacity keeps short bursts from exceeding per-minute quota.
+        """
+        if rate_per_minute <= 0:
+            raise ValueError("Rate must be positive")
+
+        self._rate = rate_per_minute / 60
+        self._capacity = max(1.0, self._rate * burst_seconds)
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1) -> float:
+        """
+        Takes tokens from the bucket, waiting until they are available.
+        Returns time in seconds spent waiting.
+        """
+        needed = min(amount, self._capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= needed:
+                    self._tokens -= amount
+                    return waited
+                delay = (needed - self._tokens) / self._rate
+
+            time.sleep(delay)
+            waited += delay
+
+class CircuitBreaker:
+    """
+    Stops sending requests after repeated failures.
+    After reset timeout, one trial request is let through: success closes the circuit, failure opens it again.
+    """
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold (int): Number of consecutive failures that opens the circuit.
+            reset_timeout (float): Time in seconds the circuit stays open.
+        """
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+
+        self._failures = 0
+        self._opened_at: float = None
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None
+
+    def before_request(self):
+        """
+        Raises ChatbotCircuitOpen if requests are not allowed.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+
+            remaining = self._opened_at + self._reset_timeout - time.monotonic()
+            if remaining > 0 or self._trial_in_progress:
+                raise ChatbotCircuitOpen(f"Too many failed requests, requests are paused for {max(remaining, 0):.1f} s")
+
+            self._trial_in_progress = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_progress or self._failures >= self._failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_progress = False
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter, Retry-After header takes precedence.
+    """
+    def __init__(self, max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 60.0):
+        """
+        Args:
+            max_retries (int): Max number of retries of failed request.
+            base_delay (float): Max delay in seconds before first retry, doubled for each next retry.
+            max_delay (float): Max delay in seconds before retry.
+        """
+        self.max_retries = max_retries
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+
+    @staticmethod
+    def parse_retry_after(value: str | None) -> float | None:
+        """
+        Parses Retry-After header value: delay in seconds or HTTP date.
+        """
+        if not value:
+            return None
+
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, retry_at.timestamp() - time.time())
+
+    def get_delay(self, attempt: int, retry_after: str = None) -> float:
+        """
+        Returns delay in seconds before retry number attempt (starting from 0).
+        """
+        delay = self.parse_retry_after(retry_after)
+        if delay is not None:
+            return min(delay, self._max_delay)
+
+        return random.uniform(0, min(self._max_delay, self._base_delay * 2 ** attempt))
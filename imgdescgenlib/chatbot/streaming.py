@@ -0,0 +1,83 @@
+from typing import Iterator
+
+import base64
+import json
+import math
+import re
+import uuid
+
+# size of block sent in one write
+BLOCK_SIZE = 1024*1024
+
+class BytesStream:
+    """
+    Request body that streams bytes in blocks from a memoryview without copying them.
+    Has known length, so requests sends it with Content-Length instead of chunked encoding.
+    """
+    def __init__(self, data: bytes | memoryview, offset: int = 0, block_size: int = BLOCK_SIZE):
+        self._data = memoryview(data)[offset:]
+        self._block_size = block_size
+        self.bytes_sent = 0
+
+    def __len__(self) -> int:
+        return self._data.nbytes
+
+    def __iter__(self) -> Iterator[memoryview]:
+        for start in range(0, len(self), self._block_size):
+            block = self._data[start:start + self._block_size]
+            yield block
+            self.bytes_sent += block.nbytes
+
+class Base64Value:
+    """
+    JSON string value that holds base64 of binary data, encoded only when JsonStream is sent.
+    """
+    def __init__(self, data: bytes | memoryview):
+        self.data = memoryview(data)
+
+    def __len__(self) -> int:
+        """
+        Returns length of base64 encoded data
+        """
+        return 4 * math.ceil(self.data.nbytes / 3)
+
+class JsonStream:
+    """
+    Request body with JSON document where large binary values (Base64Value) are base64 encoded block by block while sending.
+    Only one block of encoded data is held in memory instead of the whole serialized document.
+    Has known length, so requests sends it with Content-Length instead of chunked encoding.
+    """
+    def __init__(self, document, block_size: int = BLOCK_SIZE):
+        values: list[Base64Value] = []
+        token = uuid.uuid4().hex
+
+        def placeholder(value):
+            if not isinstance(value, Base64Value):
+                raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+            values.append(value)
+            return f"{token}:{len(values) - 1}"
+
+        # document is serialized with placeholders, then split into text pieces and values
+        pieces = re.split(f"{token}:(\\d+)", json.dumps(document, default=placeholder))
+        self._pieces: list[bytes | Base64Value] = [
+            values[int(piece)] if i % 2 else piece.encode("utf-8")
+            for i, piece in enumerate(pieces)
+        ]
+
+        # base64 of each block must not be padded, so block size is a multiple of 3
+        self._block_size = max(3, block_size - block_size % 3)
+        self.bytes_sent = 0
+
+    def __len__(self) -> int:
+        return sum(len(piece) for piece in self._pieces)
+
+    def __iter__(self) -> Iterator[bytes]:
+        for piece in self._pieces:
+            if isinstance(piece, Base64Value):
+                for start in range(0, piece.data.nbytes, self._block_size):
+                    block = base64.b64encode(piece.data[start:start + self._block_size])
+                    yield block
+                    self.bytes_sent += len(block)
+            elif piece:
+                yield piece
+                self.bytes_sent += len(piece)
@@ -0,0 +1,95 @@
+import PIL.Image
+
+# dHash compares neighbouring pixels of image downscaled to (HASH_SIZE + 1) x HASH_SIZE, hash has HASH_SIZE^2 bits
+HASH_SIZE = 8
+
+def dhash(pil_image: PIL.Image.Image) -> int:
+    """
+    Returns difference hash of image: each bit tells if pixel is brighter than its right neighbour.
+    Similar images have hashes that differ in few bits.
+    """
+    small = pil_image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), PIL.Image.Resampling.BOX)
+    pixels = small.tobytes()
+
+    value = 0
+    for row in range(HASH_SIZE):
+        for column in range(HASH_SIZE):
+            offset = row * (HASH_SIZE + 1) + column
+            value = (value << 1) | (pixels[offset] > pixels[offset + 1])
+    return value
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+class BKTree:
+    """
+    Burkhard-Keller tree of hashes, finds hashes within Hamming distance without comparing with all of them.
+    """
+    def __init__(self):
+        self._root: tuple[int, int, dict] = None # (hash, value, children by distance)
+
+    def add(self, hash_value: int, value: int):
+        """
+        Adds hash with associated value.
+        """
+        if self._root is None:
+            self._root = (hash_value, value, {})
+            return
+
+        node = self._root
+        while True:
+            distance = hamming_distance(hash_value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (hash_value, value, {})
+                return
+            node = child
+
+    def search(self, hash_value: int, max_distance: int) -> list[tuple[int, int]]:
+        """
+        Returns (distance, value) of hashes within max_distance, closest first.
+        """
+        if self._root is None:
+            return []
+
+        found = []
+        nodes = [self._root]
+        while nodes:
+            node_hash, value, children = nodes.pop()
+            distance = hamming_distance(hash_value, node_hash)
+            if distance <= max_distance:
+                found.append((distance, value))
+
+            # by triangle inequality, matches can be only in children with distance in this range
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    nodes.append(child)
+
+        return sorted(found)
+
+def find_near_duplicates(hashes: list[int | None], max_distance: int) -> list[int]:
+    """
+    Groups hashes into clusters of near duplicates.
+    Image joins the cluster of the closest earlier representative within max_distance,
+    otherwise it becomes representative of a new cluster.
+
+    Args:
+        hashes (list[int | None]): Perceptual hash of each image, image without hash is never a near duplicate.
+        max_distance (int): Max Hamming distance between image and representative of its cluster.
+
+    Returns:
+        list[int]: Index of representative of each image, representative points to itself.
+    """
+    tree = BKTree()
+    representatives = []
+    for i, hash_value in enumerate(hashes):
+        if hash_value is None:
+            representatives.append(i)
+            continue
+        matches = tree.search(hash_value, max_distance)
+        if matches:
+            representatives.append(matches[0][1])
+        else:
+            tree.add(hash_value, i)
+            representatives.append(i)
+    return representatives
@@ -0,0 +1,187 @@
+import exiftool
+import logging
+import queue
+import threading
+import time
+import warnings
+
+from contextlib import contextmanager
+from typing import Iterator
+
+logger = logging.getLogger("imgdescgenlib")
+
+class ExifToolPool:
+    """
+    Thread-safe pool of long-lived ExifTool processes.
+    Each process runs in -stay_open mode, so ExifTool startup cost is paid once per process
+    instead of once per call. Crashed processes are restarted on next use.
+    """
+
+    def __init__(self, executable: str = None, size: int = 1, health_check_interval: float = 60.0):
+        """
+        Args:
+            executable (str): Path to the ExifTool executable.
+                If None, pyexiftool will search for it in PATH.
+            size (int): Max number of ExifTool processes.
+            health_check_interval (float): Idle time in seconds after which process is pinged before use.
+        """
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+
+        self._executable = executable
+        self._size = size
+        self._health_check_interval = health_check_interval
+
+        # idle processes with the time they were returned to the pool
+        self._idle: queue.LifoQueue[tuple[exiftool.ExifToolHelper, float]] = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_executable(self) -> str:
+        return self._executable
+
+    def _start(self) -> exiftool.ExifToolHelper:
+        """
+        Starts new ExifTool process
+        """
+        et = exiftool.ExifToolHelper(executable=self._executable)
+        et.run()
+        logger.debug(f"Started ExifTool process, version {et.version}")
+        return et
+
+    def _is_healthy(self, et: exiftool.ExifToolHelper, idle_since: float) -> bool:
+        """
+        Checks that process is alive and responds if it was idle for a long time
+        """
+        with warnings.catch_warnings():
+            # pyexiftool warns when it detects dead process
+            warnings.simplefilter("ignore")
+            if not et.running:
+                return False
+
+        if time.monotonic() - idle_since < self._health_check_interval:
+            return True
+
+        try:
+            et.execute("-ver")
+            return True
+        except (exiftool.exceptions.ExifToolException, OSError):
+            return False
+
+    def _discard(self, et: exiftool.ExifToolHelper):
+        """
+        Terminates process and frees its slot in the pool
+        """
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                et.terminate()
+        except (exiftool.exceptions.ExifToolException, OSError):
+            pass
+
+        with self._lock:
+            self._created -= 1
+
+        # wake up thread waiting for a process, so it can start a new one
+        self._idle.put((None, 0.0))
+
+    def _checkout(self) -> exiftool.ExifToolHelper:
+        """
+        Takes idle process from the pool, starts a new one or waits for one to be returned
+        """
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("ExifTool pool is closed")
+
+                start_new = self._idle.empty() and self._created < self._size
+                if start_new:
+                    self._created += 1
+
+            if start_new:
+                try:
+                    return self._start()
+                except BaseException:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+
+            et, idle_since = self._idle.get()
+            if et is None:
+                # slot was freed or pool was closed while waiting
+                continue
+
+            if self._is_healthy(et, idle_since):
+                return et
+
+            logger.warning("ExifTool process is not responding, restarting")
+            self._discard(et)
+
+    @contextmanager
+    def acquire(self) -> Iterator[exiftool.ExifToolHelper]:
+        """
+        Context manager that yields ExifToolHelper for exclusive use.
+        If ExifTool process crashes during use, it is discarded and replaced on next acquire.
+        """
+        et = self._checkout()
+        try:
+            yield et
+        except (exiftool.exceptions.ExifToolProcessStateError, exiftool.exceptions.ExifToolVersionError, OSError):
+            # process died or its output got out of sync
+            self._discard(et)
+            raise
+        except BaseException:
+            self._release(et)
+            raise
+        else:
+            self._release(et)
+
+    def _release(self, et: exiftool.ExifToolHelper):
+        """
+        Returns process to the pool
+        """
+        with self._lock:
+            closed = self._closed
+        if closed:
+            self._discard(et)
+        else:
+            self._idle.put((et, time.monotonic()))
+
+    def close(self):
+        """
+        Terminates all idle processes, processes in use are terminated when released.
+        """
+        with self._lock:
+            self._closed = True
+
+        while True:
+            try:
+                et, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if et is not None:
+                self._discard(et)
+
+        # wake up threads waiting for a process
+        for _ in range(self._size):
+            self._idle.put((None, 0.0))
+
+@contextmanager
+def exiftool_session(pool: ExifToolPool, executable: str = None) -> Iterator[exiftool.ExifToolHelper]:
+    """
+    Yields ExifToolHelper from the pool.
+    If pool is None, short-lived ExifTool process is started.
+    """
+    if pool is not None:
+        with pool.acquire() as et:
+            yield et
+    else:
+        with exiftool.ExifToolHelper(executable=executable) as et:
+            yield et
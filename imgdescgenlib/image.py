@@ -1,31 +1,223 @@
 import os
 import base64 # for image encoding
+import hashlib
 import exiftool
 import PIL.Image
 
 from io import BytesIO
 
+from imgdescgenlib.dedup import dhash
 from imgdescgenlib.exceptions import ImageToolException
+from imgdescgenlib.exiftool_pool import ExifToolPool, exiftool_session
+from imgdescgenlib.metadata_writer import MetadataWriter, WriteMode
 from imgdescgenlib.schemas import ImageDescription
 
+# image formats that are sent as is when no transform is requested
+PASSTHROUGH_MIME_TYPES = ("image/jpeg", "image/png", "image/webp", "image/heic", "image/heif")
+
+# quality used when "keep" can't be applied (source image is not JPEG)
+DEFAULT_JPEG_QUALITY = 95
+
+# lowest quality tried by adaptive reduction before image is downscaled
+MIN_JPEG_QUALITY = 10
+
+# adaptive reduction stops when quality is found with this precision
+QUALITY_SEARCH_TOLERANCE = 2
+
+# resize first reduces image by integer factor while it stays this many times larger than target size,
+# much faster than resampling of full image with the same quality
+RESIZE_REDUCING_GAP = 3.0
+
+# image is never downscaled below this size of the longer side
+MIN_DIMENSION = 64
+
+# JPEG is decoded at least at this size to compute perceptual hash
+HASH_DECODE_SIZE = 64
+
+def sniff_mime_type(header: bytes) -> str | None:
+    """
+    Detects image MIME type from the first bytes of file.
+    Returns None if format is unknown.
+    """
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[4:8] == b"ftyp":
+        brand = header[8:12]
+        if brand in (b"heic", b"heix", b"heim", b"heis"):
+            return "image/heic"
+        if brand in (b"mif1", b"msf1", b"heif"):
+            return "image/heif"
+    return None
+
+class EncodedImage:
+    """
+    Encoded representation of image: bytes sent to the chatbot.
+    Base64 and SHA-256 are computed on first access and then reused.
+    """
+
+    def __init__(self, data: bytes, mime_type: str = "image/jpeg"):
+        self._data = data
+        self.mime_type = mime_type
+        self._base64: str = None
+        self._sha256: str = None
+
+    @property
+    def data(self) -> bytes:
+        return self._data
+
+    @property
+    def size(self) -> int:
+        return len(self._data)
+
+    @property
+    def base64(self) -> str:
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self._data).decode('utf-8')
+        return self._base64
+
+    @property
+    def sha256(self) -> str:
+        """
+        SHA-256 hex digest of encoded bytes
+        """
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self._data).hexdigest()
+        return self._sha256
+
 class Image:
     """
     Encapsulation of image.
     """
     
-    def __init__(self, img_path: str):
+    def __init__(self, img_path: str, lazy: bool = False):
+        """
+        Args:
+            img_path (str): Path to the image file.
+            lazy (bool): Close file after each use and keep only size and hash of encoded image,
+                bytes are encoded again or read from file written by preprocessor when needed.
+                Memory and file handles don't grow with number of images.
+        """
         self._exiftool_path = None
+        self._exiftool_pool: ExifToolPool = None
+        self._internal_image: PIL.Image.Image = None
+        self._dimensions: tuple[int, int] = None
+        self._dimensions_read = False
+        self._perceptual_hash: int = None
+        self._source_sha256: str = None
+        self._lazy = lazy
         self._load(img_path)
 
         self._quality = "keep"
+        self._format = "JPEG"
+        self._max_dimension: int = None
+
+        # encoded image is cached until encoding settings change
+        self._encoded: EncodedImage = None
+        self._encoded_key: tuple = None
+        self._encoded_size: int = None
+        self._encoded_sha256: str = None
+        self._encoded_file: tuple[str, str] = None # (path, MIME type) of encoded bytes of lazy image written by preprocessor
 
     def _load(self, img_path: str):
         """
-        Loads image from file
+        Loads image from file.
+        Only file header is read, pixels are decoded on demand.
         """
-        self._internal_image = PIL.Image.open(img_path)
+        with open(img_path, "rb") as f:
+            self._mime_type = sniff_mime_type(f.read(16))
         self._img_path = img_path
 
+    def _open(self) -> PIL.Image.Image:
+        """
+        Opens image with PIL if not opened yet
+        """
+        if self._internal_image is None:
+            self._internal_image = PIL.Image.open(self._img_path)
+        return self._internal_image
+
+    def _release(self):
+        """
+        Closes image file if image is lazy
+        """
+        if self._lazy:
+            self.close()
+
+    def close(self):
+        """
+        Closes image file, it is opened again on demand.
+        """
+        if self._internal_image is not None:
+            self._internal_image.close()
+            self._internal_image = None
+
+    def get_dimensions(self) -> tuple[int, int] | None:
+        """
+        Returns image width and height, only image header is read.
+        Returns None for passthrough format PIL can't read, e.g. HEIC, such image is always sent as is.
+        """
+        if not self._dimensions_read:
+            try:
+                self._dimensions = self._open().size
+                self._release()
+            except PIL.UnidentifiedImageError:
+                if self._mime_type not in PASSTHROUGH_MIME_TYPES:
+                    raise
+            self._dimensions_read = True
+        return self._dimensions
+
+    def perceptual_hash(self) -> int | None:
+        """
+        Returns perceptual hash of image, see dedup.dhash.
+        JPEG is decoded at reduced scale in draft mode, so hashing is cheap.
+        Returns None if image can't be decoded, see get_dimensions.
+        """
+        if self._perceptual_hash is None and self.get_dimensions() is not None:
+            with PIL.Image.open(self._img_path) as pil_image:
+                if pil_image.format == "JPEG":
+                    pil_image.draft("L", (HASH_DECODE_SIZE, HASH_DECODE_SIZE))
+                self._perceptual_hash = dhash(pil_image)
+        return self._perceptual_hash
+
+    def get_encoded_dimensions(self) -> tuple[int, int] | None:
+        """
+        Returns width and height of image sent to the chatbot: dimensions after downscaling to max dimension.
+        None if dimensions are unknown, see get_dimensions.
+        """
+        if not self._needs_resize():
+            return self.get_dimensions()
+
+        width, height = self.get_dimensions()
+        scale = self._max_dimension / max(width, height)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def get_mime_type(self) -> str | None:
+        """
+        Returns MIME type of the original file, None if format is unknown
+        """
+        return self._mime_type
+
+    def is_passthrough(self) -> bool:
+        """
+        Returns True if original file bytes are sent without re-encoding.
+        Passthrough image that can't be decoded is sent as is with any settings.
+        """
+        if self._mime_type not in PASSTHROUGH_MIME_TYPES:
+            return False
+        return self._quality == "keep" and not self._needs_resize() or self.get_dimensions() is None
+
+    def _needs_resize(self) -> bool:
+        """
+        Returns True if image is larger than max dimension, False if its dimensions are unknown
+        """
+        if self._max_dimension is None:
+            return False
+        dimensions = self.get_dimensions()
+        return dimensions is not None and max(dimensions) > self._max_dimension
+
     def get_filename(self) -> str:
         """
         Returns image filename
@@ -39,49 +231,296 @@ class Image:
         """
         self._exiftool_path = exiftool_path
 
+    def set_exiftool_pool(self, exiftool_pool: ExifToolPool):
+        """
+        Sets the pool of running ExifTool processes.
+        If None, a new ExifTool process is started for each call.
+        """
+        self._exiftool_pool = exiftool_pool
+
+    def set_max_dimension(self, max_dimension: int):
+        """
+        Sets max size of the longer image side in pixels, larger image is downscaled on encoding.
+        If None, image is sent at original resolution.
+        """
+        self._max_dimension = max_dimension
+
     def reduce_quality(self):
         """
         Reduces quality of image
         """
-        self._quality = 10
+        if self._quality != 10:
+            self._quality = 10
+            self._encoded = None
+
+    def fit_to_budget(self, max_bytes: int = None, max_dimension: int = None) -> int:
+        """
+        Chooses the highest quality at which encoded image fits into byte budget.
+        Quality is searched by bisection on encoded size; if image doesn't fit even at the lowest quality,
+        it is downscaled in proportion to the overshoot and the search is repeated.
+        Image that already fits or can't be decoded is left as is.
+
+        Args:
+            max_bytes (int): Max size of encoded image in bytes, None for no limit.
+            max_dimension (int): Max size of the longer image side in pixels, None for no limit.
+
+        Returns number of trial encodes.
+        """
+        self._quality = "keep"
+        self.set_max_dimension(max_dimension)
+        trials = 1
+        if max_bytes is None or self.size() <= max_bytes or self.get_dimensions() is None:
+            return trials
+
+        # image re-encoded at "keep" quality was encoded at default quality, so it is known not to fit
+        default_too_large = not self.is_passthrough()
+        while True:
+            best, found = self._search_quality(max_bytes, default_too_large)
+            default_too_large = False
+            trials += found
+            if best is not None:
+                self._quality, encoded = best
+                self._cache_encoded(encoded, self._encode_key())
+                return trials
+
+            # smallest encode is still too large, downscale by the square root of overshoot with some margin
+            width, height = self.get_dimensions()
+            longer_side = min(max(width, height), self._max_dimension or max(width, height))
+            if longer_side <= MIN_DIMENSION:
+                # can't reduce further, keep the smallest encode
+                self._quality = MIN_JPEG_QUALITY
+                return trials
+
+            scale = 0.9 * (max_bytes / self.size()) ** 0.5
+            self._max_dimension = max(MIN_DIMENSION, min(int(longer_side * scale), longer_side - 1))
+
+    def _search_quality(self, max_bytes: int, default_too_large: bool = False) -> tuple[tuple[int, EncodedImage] | None, int]:
+        """
+        Bisects quality in range [MIN_JPEG_QUALITY, DEFAULT_JPEG_QUALITY] for the highest one that fits max_bytes.
+        Returns (quality, encoded image) or None if image doesn't fit at the lowest quality, and number of trial encodes.
+        Image is left encoded at the last tried quality.
+        If default_too_large is set, image is known not to fit at default quality and it is not tried.
+        """
+        trials = 0
+
+        def fits(quality: int) -> EncodedImage | None:
+            nonlocal trials
+            self._quality = quality
+            trials += 1
+            encoded = self.encode()
+            return encoded if encoded.size <= max_bytes else None
+
+        if not default_too_large:
+            encoded = fits(DEFAULT_JPEG_QUALITY)
+            if encoded:
+                return (DEFAULT_JPEG_QUALITY, encoded), trials
+
+        encoded = fits(MIN_JPEG_QUALITY)
+        if not encoded:
+            return None, trials
+
+        low, high = MIN_JPEG_QUALITY, DEFAULT_JPEG_QUALITY
+        best = (low, encoded)
+        while high - low > QUALITY_SEARCH_TOLERANCE:
+            middle = (low + high) // 2
+            encoded = fits(middle)
+            if encoded:
+                low = middle
+                best = (middle, encoded)
+            else:
+                high = middle
+
+        return best, trials
+
+    def _encode_key(self) -> tuple:
+        """
+        Returns the settings that affect encoded image bytes
+        """
+        return (self._quality, self._format, self._max_dimension)
+
+    def encode(self) -> EncodedImage:
+        """
+        Encodes image with current settings.
+        If no transform is requested, original file bytes are used as is.
+        Result is cached, so image is encoded once per settings.
+        """
+        key = self._encode_key()
+        if self._encoded is not None and self._encoded_key == key:
+            return self._encoded
+
+        if self._encoded_file is not None and self._encoded_key == key:
+            path, mime_type = self._encoded_file
+            with open(path, "rb") as f:
+                encoded = EncodedImage(f.read(), mime_type)
+            encoded._sha256 = self._encoded_sha256
+            return encoded
+
+        if self.is_passthrough():
+            with open(self._img_path, "rb") as f:
+                encoded = EncodedImage(f.read(), self._mime_type)
+        else:
+            encoded = self._encode_pixels()
+            self._release()
+
+        self._cache_encoded(encoded, key)
+        return encoded
+
+    def _cache_encoded(self, encoded: EncodedImage, key: tuple):
+        """
+        Remembers encoded image, lazy image keeps only its size and hash
+        """
+        self._discard_encoded_file()
+        if self._encoded_key != key:
+            self._encoded_key = key
+            self._encoded_sha256 = None
+        if encoded._sha256 is not None:
+            self._encoded_sha256 = encoded._sha256
+        self._encoded_size = encoded.size
+        self._encoded = None if self._lazy else encoded
+
+    def _cache_encoded_file(self, path: str, size: int, sha256: str, mime_type: str):
+        """
+        Remembers file with image encoded with current settings, lazy image reads bytes from it instead of encoding again.
+        Image owns the file, it is removed when image is encoded with other settings or discarded.
+        """
+        self._discard_encoded_file()
+        self._encoded_key = self._encode_key()
+        self._encoded_size = size
+        self._encoded_sha256 = sha256
+        self._encoded = None
+        self._encoded_file = (path, mime_type)
+
+    def discard_encoded(self):
+        """
+        Drops encoded image and its file written by preprocessor, image is encoded again when needed.
+        """
+        self._discard_encoded_file()
+        self._encoded = None
+        self._encoded_key = None
+        self._encoded_size = None
+        self._encoded_sha256 = None
+
+    def _discard_encoded_file(self):
+        """
+        Removes file with encoded bytes written by preprocessor, image is encoded again when needed.
+        """
+        if self._encoded_file is not None:
+            path, _ = self._encoded_file
+            self._encoded_file = None
+            if self._encoded_key == self._encode_key():
+                self._encoded_size = None
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _is_encoded(self) -> bool:
+        """
+        Returns True if image was encoded with current settings
+        """
+        return self._encoded_size is not None and self._encoded_key == self._encode_key()
+
+    def _decode(self) -> PIL.Image.Image:
+        """
+        Decodes image pixels scaled down to max dimension.
+        JPEG is decoded at reduced scale in draft mode, then it is resampled to exact size with LANCZOS filter.
+        """
+        if not self._needs_resize():
+            return self._open()
+
+        target_size = self.get_encoded_dimensions()
+
+        # draft changes size of opened image, so it is applied to separate instance
+        with PIL.Image.open(self._img_path) as pil_image:
+            if pil_image.format == "JPEG":
+                pil_image.draft("RGB", target_size)
+            if pil_image.mode not in ("RGB", "L"):
+                pil_image = pil_image.convert("RGB")
+            return pil_image.resize(target_size, PIL.Image.Resampling.LANCZOS, reducing_gap=RESIZE_REDUCING_GAP)
+
+    def _encode_pixels(self) -> EncodedImage:
+        """
+        Decodes image and encodes it with current settings
+        """
+        internal_image = self._decode()
+
+        # "keep" is possible only for unmodified JPEG
+        quality = self._quality
+        if quality == "keep" and internal_image.format != "JPEG":
+            quality = DEFAULT_JPEG_QUALITY
+        if internal_image.mode not in ("RGB", "L"):
+            internal_image = internal_image.convert("RGB")
+
+        buffer = BytesIO()
+        internal_image.save(buffer, format=self._format, quality=quality)
+        return EncodedImage(buffer.getvalue(), PIL.Image.MIME[self._format])
 
     def save(self, path: str):
         """
         Saves original image to directory
         """
-        self._internal_image.save(f"{path}/{os.path.basename(self._img_path)}", format="JPEG", quality="keep")
+        self._open().save(f"{path}/{os.path.basename(self._img_path)}", format="JPEG", quality="keep")
+        self._release()
 
     def save_to_buffer(self) -> BytesIO:
         """
         Saves image to buffer
         """
-        buffer = BytesIO()
-        self._internal_image.save(buffer, format="JPEG", quality=self._quality)
-        return buffer
+        return BytesIO(self.encode().data)
     
     def size(self) -> int:
         """
         Returns the size of an image in bytes 
         """
-        return self.save_to_buffer().getbuffer().nbytes
+        if self._is_encoded():
+            return self._encoded_size
+        return self.encode().size
 
     def encode_base64(self) -> str:
         """
         Encodes image bytes using base64.
         Returns base64 str.
         """
-        buffer = self.save_to_buffer()
-        return base64.b64encode(buffer.getvalue()).decode('utf-8')
+        return self.encode().base64
+
+    def sha256(self) -> str:
+        """
+        Returns SHA-256 hex digest of encoded image bytes
+        """
+        if self._is_encoded() and self._encoded_sha256 is not None:
+            return self._encoded_sha256
 
-    def read_metadata(self) -> list:
+        sha256 = self.encode().sha256
+        self._encoded_sha256 = sha256
+        return sha256
+
+    def source_sha256(self) -> str:
+        """
+        Returns SHA-256 hex digest of the original file, file is hashed once
+        """
+        if self._source_sha256 is None:
+            with open(self._img_path, "rb") as f:
+                self._source_sha256 = hashlib.file_digest(f, "sha256").hexdigest()
+        return self._source_sha256
+
+    def content_key(self) -> str:
+        """
+        Returns string identifying image sent to the chatbot: hash of the original file and encoding settings.
+        Unlike sha256, image is not encoded.
+        """
+        quality, img_format, max_dimension = self._encode_key()
+        return f"{self.source_sha256()}:{quality}:{img_format}:{max_dimension}"
+
+    def read_metadata(self, tags: list[str] = None) -> list:
         """
         Reads image metadata
+
+        Args:
+            tags (list[str]): Tags to read, e.g. "EXIF:ImageDescription". If None, all tags are read.
         """
         try:
-            with exiftool.ExifToolHelper(executable=self._exiftool_path) as et:
+            with exiftool_session(self._exiftool_pool, self._exiftool_path) as et:
                 return et.get_tags(
                     self._img_path,
-                    None
+                    tags
                 )
         except FileNotFoundError as e:
             raise ImageToolException(f"ExifTool not found: {e}")
@@ -90,25 +529,8 @@ class Image:
         except exiftool.exceptions.ExifToolException as e:
             raise ImageToolException(f"ExifTool error: {e}")
     
-    def write_description_metadata(self, img_metadata: ImageDescription, output_path: str):
+    def write_description_metadata(self, img_metadata: ImageDescription, output_path: str = None, mode: WriteMode = "copy"):
         """
-        Writes image description
+        Writes image description and keywords, see Images.write_description_metadata
         """
-
-        # create directory for processed images if not exists
-        os.makedirs(output_path, exist_ok=True)
-        
-        # write image with modded metadata
-        try:
-            with exiftool.ExifToolHelper(executable=self._exiftool_path) as et:
-                et.set_tags(
-                    self._img_path,
-                    {"ImageDescription": img_metadata.description},
-                    ["-o", f'{output_path}/{os.path.basename(self._img_path)}']
-                )
-        except FileNotFoundError as e:
-            raise ImageToolException(f"ExifTool not found: {e}")
-        except exiftool.exceptions.ExifToolExecuteException as e:
-            raise ImageToolException(f"ExifTool execution error: {e}")
-        except exiftool.exceptions.ExifToolException as e:
-            raise ImageToolException(f"ExifTool error: {e}")
+        MetadataWriter(mode, self._exiftool_pool, self._exiftool_path).write([self._img_path], [img_metadata], output_path)
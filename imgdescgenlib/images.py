@@ -1,11 +1,15 @@
-import os
 import exiftool
-import tempfile
-import csv
 import logging
+import math
 
+from typing import Iterator
+
+from imgdescgenlib.dedup import find_near_duplicates
 from imgdescgenlib.exceptions import ImageToolException
+from imgdescgenlib.exiftool_pool import ExifToolPool, exiftool_session
 from imgdescgenlib.image import Image
+from imgdescgenlib.metadata_writer import MetadataWriter, WriteMode
+from imgdescgenlib.preprocess import ImagePreprocessor
 from imgdescgenlib.schemas import ImageDescription
 
 logger = logging.getLogger("imgdescgenlib")
@@ -15,40 +19,74 @@ class Images:
     Manager for multiple Image instances; container for images
     """
 
-    def __init__(self, imgs_path: list[str]):
-        self._common_dir: str = None
+    def __init__(self, imgs_path: list[str], lazy: bool = False):
+        """
+        Args:
+            imgs_path (list[str]): Paths to the image files.
+            lazy (bool): Open each image only while it is used and don't keep encoded bytes in memory, see Image.
+                Use it for large batches, so memory and open files don't grow with number of images.
+        """
+        self._lazy = lazy
+        self._preprocessor: ImagePreprocessor = None
         self._exiftool_path: str = None
-
-        # temp dir for storing metadata.csv with/without images
-        self._tmpdir = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        self._exiftool_pool: ExifToolPool = None
         self._images: list[Image] = []
 
         self._load(imgs_path)
 
+    def __len__(self) -> int:
+        return len(self._images)
+
+    def __iter__(self) -> Iterator[Image]:
+        return iter(self._images)
+
+    def __getitem__(self, index: int) -> Image:
+        return self._images[index]
+
     def _load(self, imgs_path: list[str]):
         """
         Loads images from file
         """
-        img_dir = None
-        different_dirs = False
         for img_path in imgs_path:
-            if img_dir == None:
-                img_dir = os.path.dirname(img_path)
-            elif img_dir != os.path.dirname(img_path) and different_dirs == False:
-                different_dirs = True
+            self._images.append(Image(img_path, self._lazy))
 
-            self._images.append(Image(img_path))
+    def subset(self, indices: list[int]) -> "Images":
+        """
+        Returns container with images at given indices.
+        Image instances and ExifTool settings are shared with this container.
+        """
+        imgs = Images([], self._lazy)
+        imgs._images = [self._images[i] for i in indices]
+        imgs.set_exiftool_path(self._exiftool_path)
+        imgs.set_exiftool_pool(self._exiftool_pool)
+        imgs.set_preprocessor(self._preprocessor)
+        return imgs
+
+    def find_near_duplicates(self, max_distance: int) -> list[int]:
+        """
+        Groups near-duplicate images, e.g. burst shots, by perceptual hash.
 
-        if different_dirs == False:
-            # set a _common_dir to not to copy all images to temp directory if they are in the same
-            self._common_dir = os.path.normpath(os.path.dirname(img_path))
+        Args:
+            max_distance (int): Max Hamming distance between 64-bit hashes of near duplicates, 0 for identical hashes only.
 
-    def _save(self):
+        Returns:
+            list[int]: Index of representative of each image's cluster, representative points to itself.
         """
-        Saves all images to a temporary directory.
+        return find_near_duplicates([img.perceptual_hash() for img in self._images], max_distance)
+
+    def close(self):
+        """
+        Closes files of all images.
         """
         for img in self._images:
-            img.save(self._tmpdir.name)
+            img.close()
+
+    def discard_encoded(self):
+        """
+        Drops encoded bytes of all images, see Image.discard_encoded.
+        """
+        for img in self._images:
+            img.discard_encoded()
 
     def set_exiftool_path(self, exiftool_path: str):
         """
@@ -57,15 +95,47 @@ class Images:
         """
         self._exiftool_path = exiftool_path
 
+    def set_exiftool_pool(self, exiftool_pool: ExifToolPool):
+        """
+        Sets the pool of running ExifTool processes.
+        If None, a new ExifTool process is started for each call.
+        """
+        self._exiftool_pool = exiftool_pool
+
+    def set_preprocessor(self, preprocessor: ImagePreprocessor):
+        """
+        Sets the pool of processes that encode images.
+        If None, images are encoded in the calling thread.
+        """
+        self._preprocessor = preprocessor
+
+    def encode(self):
+        """
+        Encodes all images with current settings, in parallel if preprocessor is set.
+        """
+        if self._preprocessor:
+            self._preprocessor.encode(self._images)
+        else:
+            for img in self._images:
+                img.size()
+
     def calculate_size(self) -> int:
         """
         Calculates the size of all images in bytes.
         """
+        self.encode()
         size = 0
         for img in self._images:
             size += img.size()
         return size
 
+    def set_max_dimension(self, max_dimension: int):
+        """
+        Sets max size of the longer side of all images in pixels, larger images are downscaled on encoding.
+        """
+        for img in self._images:
+            img.set_max_dimension(max_dimension)
+
     def reduce_quality(self):
         """
         Reduces the quality of all images.
@@ -80,22 +150,71 @@ class Images:
             else:
                 img.reduce_quality()
 
+    def fit_to_budget(self, max_bytes: int = None, max_dimension: int = None):
+        """
+        Re-encodes images so that their total size fits into byte budget, see Image.fit_to_budget.
+        Budget is shared in proportion to image pixel count; budget left unused by images
+        that already fit is shared among the rest.
+
+        Args:
+            max_bytes (int): Max total size of encoded images in bytes, None for no limit.
+            max_dimension (int): Max size of the longer side of each image in pixels, None for no limit.
+        """
+        trials = self._fit_images(self._images, [None] * len(self._images), max_dimension)
+
+        if max_bytes is not None:
+            # images that can't be decoded are sent as is and take their size from the budget
+            pending = [i for i, img in enumerate(self._images) if img.get_encoded_dimensions() is not None]
+            remaining = max_bytes - sum(img.size() for img in self._images if img.get_encoded_dimensions() is None)
+            budgets: dict[int, int] = {}
+            pixels = {i: math.prod(self._images[i].get_encoded_dimensions()) for i in pending}
+            while pending:
+                total_pixels = sum(pixels[i] for i in pending)
+                budgets = {i: int(remaining * pixels[i] / total_pixels) for i in pending}
+
+                fitting = [i for i in pending if self._images[i].size() <= budgets[i]]
+                if not fitting:
+                    break
+                remaining -= sum(self._images[i].size() for i in fitting)
+                pending = [i for i in pending if i not in fitting]
+
+            trials += self._fit_images([self._images[i] for i in pending], [budgets[i] for i in pending], max_dimension)
+
+        logger.debug(f"Images fit to budget of {max_bytes} bytes: total size {self.calculate_size()}, {trials} trial encodes")
+
+    def _fit_images(self, images: list[Image], budgets: list[int | None], max_dimension: int) -> int:
+        """
+        Fits each image into its budget, in parallel if preprocessor is set.
+        Returns number of trial encodes.
+        """
+        if self._preprocessor:
+            return self._preprocessor.fit_to_budget(images, budgets, max_dimension)
+
+        trials = 0
+        for img, max_bytes in zip(images, budgets):
+            trials += img.fit_to_budget(max_bytes, max_dimension)
+        return trials
+
     def encode_base64(self) -> list[str]:
         """
         Encodes images bytes using base64.
         Returns base64 str list.
         """
+        self.encode()
         return [image.encode_base64() for image in self._images]
 
-    def read_metadata(self) -> list:
+    def read_metadata(self, tags: list[str] = None) -> list:
         """
-        Reads image metadata
+        Reads metadata of all images with one ExifTool call.
+
+        Args:
+            tags (list[str]): Tags to read, e.g. "EXIF:ImageDescription". If None, all tags are read.
         """
         try:
-            with exiftool.ExifToolHelper(executable=self._exiftool_path) as et:
+            with exiftool_session(self._exiftool_pool, self._exiftool_path) as et:
                 return et.get_tags(
                     [image._img_path for image in self._images],
-                    None
+                    tags
                 )
         except FileNotFoundError as e:
             raise ImageToolException(f"ExifTool not found: {e}")
@@ -104,44 +223,20 @@ class Images:
         except exiftool.exceptions.ExifToolException as e:
             raise ImageToolException(f"ExifTool error: {e}")
 
-    def write_description_metadata(self, img_metadata: list[ImageDescription], output_path: str):
+    def write_description_metadata(self, img_metadata: list[ImageDescription], output_path: str = None, mode: WriteMode = "copy"):
         """
-        Writes image description
+        Writes image description and keywords of all images with one ExifTool call, see MetadataWriter.
         Notes:
-            - If images are not in the same directory, they will all be saved to the temp directory
-        """
-
-        if self._common_dir == None:
-            logger.debug(f"Images are in different directories, saving them to {self._tmpdir.name}")
-            self._save()
-
-        # create directory for processed images if not exists
-        os.makedirs(output_path, exist_ok=True)
-        
-        # create temp csv file with filename and metadata
-        with open(f'{self._tmpdir.name}/metadata.csv', 'w', newline='', encoding="utf-8") as csvfile:
-            fieldnames = ['SourceFile', 'EXIF:ImageDescription']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-
-            for i in range(len(self._images)):
-                writer.writerow(
-                    {
-                        'SourceFile': self._images[i]._img_path if self._common_dir else f"{self._tmpdir.name}/{os.path.basename(self._images[i]._img_path)}",
-                        'EXIF:ImageDescription': img_metadata[i].description
-                    }
-                )
-
-        try:
-            with exiftool.ExifToolHelper(executable=self._exiftool_path) as et:
-                et.execute(
-                    f'-csv={self._tmpdir.name}/metadata.csv',
-                    '-o', output_path,
-                    self._common_dir if self._common_dir else self._tmpdir.name
-                )
-        except FileNotFoundError as e:
-            raise ImageToolException(f"ExifTool not found: {e}")
-        except exiftool.exceptions.ExifToolExecuteException as e:
-            raise ImageToolException(f"ExifTool execution error: {e}")
-        except exiftool.exceptions.ExifToolException as e:
-            raise ImageToolException(f"ExifTool error: {e}")
+            - Images can be in different directories, they are passed to ExifTool as a file list.
+
+        Args:
+            img_metadata (list[ImageDescription]): Description of each image.
+            output_path (str): Output directory, required in copy mode.
+            mode (WriteMode): copy - write images to output_path, in_place - update original images,
+                sidecar - write XMP sidecars without touching images.
+        """
+        MetadataWriter(mode, self._exiftool_pool, self._exiftool_path).write(
+            [img._img_path for img in self._images],
+            img_metadata,
+            output_path
+        )
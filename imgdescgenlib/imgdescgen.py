@@ -1,17 +1,429 @@
+from imgdescgenlib.cache import DescriptionCacheBase
 from imgdescgenlib.chatbot.base import ChatbotBase
+from imgdescgenlib.chatbot.exceptions import ChatbotFailed, ChatbotPartiallyFailed
+from imgdescgenlib.exiftool_pool import ExifToolPool
 from imgdescgenlib.images import Images
+from imgdescgenlib.metadata_writer import WriteMode
+from imgdescgenlib.pipeline import Pipeline, PipelineStage, StageStats
+from imgdescgenlib.preprocess import ImagePreprocessor
 from imgdescgenlib.schemas import ImageDescription
 
+import logging
 import os
+import queue
+import threading
 
-class ImgDescGen():
+from typing import Iterator
+
+logger = logging.getLogger("imgdescgenlib")
+
+# tags read to find images that are already described
+DESCRIPTION_TAG = "EXIF:ImageDescription"
+KEYWORDS_TAGS = ("IPTC:Keywords", "XMP:Subject")
+
+class _PipelineChunk:
     """
-    Class that provides simple interface for retrieving AI-generated description of image and writing it to the image metadata.
+    Chunk of images passed between pipeline stages.
+    """
+    def __init__(self, img_paths: list[str]):
+        self.img_paths = img_paths
+        self.imgs: Images = None
+        self.cached: tuple[list[str], list[ImageDescription]] = None # cache keys and cached descriptions
+        self.img_metadata: list[ImageDescription] = None
+        self.errors: list[Exception] = []
+
+class _StreamWriter:
+    """
+    Writes metadata of images in background thread while descriptions of other images are generated.
+    Descriptions that arrive while previous batch is written are written together in the next batch.
     """
-    def __init__(self, chatbot: ChatbotBase):
+    def __init__(self, imgs: Images, output_dir: str, write_mode: WriteMode, batch_size: int):
+        self._imgs = imgs
+        self._output_dir = output_dir
+        self._write_mode = write_mode
+        self._batch_size = batch_size
+        self._queue = queue.Queue()
+        self._errors: list[Exception] = []
+        self._thread = threading.Thread(target=self._run, name="imgdescgen-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, index: int, description: ImageDescription):
+        self._queue.put((index, description))
+
+    def close(self):
+        """
+        Waits until all descriptions are written, raises the first write error.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+    def _run(self):
+        done = False
+        while not done:
+            batch = [self._queue.get()]
+            while len(batch) < self._batch_size and not self._queue.empty():
+                batch.append(self._queue.get())
+            if None in batch:
+                done = True
+                batch.remove(None)
+            if not batch:
+                continue
+
+            try:
+                self._imgs.subset([index for index, _ in batch]).write_description_metadata(
+                    [description for _, description in batch],
+                    self._output_dir,
+                    self._write_mode
+                )
+            except Exception as e:
+                logger.warning(f"Failed to write metadata of {len(batch)} images: {e}")
+                self._errors.append(e)
+
+class ImgDescGenBase():
+    """
+    Shared part of ImgDescGen and AsyncImgDescGen: image loading, cache lookup, near-duplicate detection and ExifTool processes.
+    """
+    def __init__(
+        self,
+        chatbot: ChatbotBase,
+        exiftool_pool_size: int = 1,
+        description_cache: DescriptionCacheBase = None,
+        lazy_images: bool = False,
+        preprocess_workers: int = 0,
+        write_mode: WriteMode = "copy",
+        near_duplicate_distance: int = None
+    ):
+        """
+        Args:
+            chatbot (ChatbotBase): Chatbot used to generate descriptions.
+            exiftool_pool_size (int): Number of ExifTool processes kept running for each ExifTool executable.
+            description_cache (DescriptionCacheBase): Cache of generated descriptions.
+                If set, chatbot is called only for images that are not in the cache.
+            lazy_images (bool): Open images only while they are used and don't keep encoded images in memory.
+                Memory and open files stay constant with number of images, at cost of encoding images again.
+            preprocess_workers (int): Number of processes that decode, resize and encode images.
+                If 0, images are encoded in the calling thread; if None, number of CPUs is used.
+            write_mode (WriteMode): Where description and keywords are written:
+                copy - images are written to output directory,
+                in_place - original images are updated, output directory is not needed,
+                sidecar - XMP sidecars are written next to images or to output directory if it is set.
+            near_duplicate_distance (int): If set, near-duplicate images (e.g. burst shots) are found by perceptual hash,
+                only one image of each group is sent to the chatbot and its description is copied to the others.
+                Max Hamming distance between 64-bit hashes of near duplicates, 0 for identical hashes only.
+        """
         self._chatbot = chatbot
+        self._near_duplicate_distance = near_duplicate_distance
+        self._description_cache = description_cache
+        self._lazy_images = lazy_images
+        self._write_mode = write_mode
+        self._pipeline_stats: list[StageStats] = []
+        self._preprocessor = ImagePreprocessor(preprocess_workers) if preprocess_workers != 0 else None
+
+        self._exiftool_pool_size = exiftool_pool_size
+        self._exiftool_pools: dict[str, ExifToolPool] = {}
+        self._exiftool_pools_lock = threading.Lock()
+
+    def close(self):
+        """
+        Terminates all ExifTool and image preprocessing processes started by this instance.
+        """
+        if self._preprocessor:
+            self._preprocessor.close()
+
+        with self._exiftool_pools_lock:
+            for pool in self._exiftool_pools.values():
+                pool.close()
+            self._exiftool_pools.clear()
+
+    def get_exiftool_pool(self, exiftool_path: str = None) -> ExifToolPool:
+        """
+        Returns pool of ExifTool processes for the executable, pool is created on first use.
+        """
+        with self._exiftool_pools_lock:
+            pool = self._exiftool_pools.get(exiftool_path)
+            if not pool:
+                pool = ExifToolPool(exiftool_path, self._exiftool_pool_size)
+                self._exiftool_pools[exiftool_path] = pool
+            return pool
+
+    def _create_images(self, img_paths: list[str], exiftool_path: str) -> Images:
+        """
+        Creates images container with ExifTool settings of this instance.
+        """
+        imgs = Images(img_paths, self._lazy_images)
+
+        if not exiftool_path:
+            exiftool_path = os.environ.get("EXIFTOOL_PATH")
+        imgs.set_exiftool_path(exiftool_path)
+        imgs.set_exiftool_pool(self.get_exiftool_pool(exiftool_path))
+        return imgs
+
+    def _load_images(self, img_paths: list[str], reduce_quality: bool, exiftool_path: str, size_budget: int = None, max_dimension: int = None) -> Images:
+        """
+        Loads images and prepares them for sending to the chatbot, see _prepare_images.
+        """
+        imgs = self._create_images(img_paths, exiftool_path)
+        imgs.set_preprocessor(self._preprocessor)
+        self._prepare_images(imgs, reduce_quality, size_budget, max_dimension)
+        return imgs
+
+    def _prepare_images(self, imgs: Images, reduce_quality: bool, size_budget: int = None, max_dimension: int = None):
+        """
+        Sets encoding settings of images for sending to the chatbot, images are not encoded.
+        With size budget, quality depends on other images of the batch, so images are fit to it by _fit_to_budget
+        after cache lookup; cache key is computed from settings set here.
+        """
+        imgs.set_max_dimension(self._get_max_dimension(max_dimension))
+        if reduce_quality and size_budget is None:
+            imgs.reduce_quality()
+
+    def _fit_to_budget(self, imgs: Images, size_budget: int = None, max_dimension: int = None):
+        """
+        Chooses quality of images sent to the chatbot so that their total size fits into size budget, if it is set.
+        """
+        if size_budget is not None and len(imgs):
+            imgs.fit_to_budget(size_budget, self._get_max_dimension(max_dimension))
+
+    def _get_max_dimension(self, max_dimension: int = None) -> int | None:
+        """
+        Returns max dimension of images, target resolution of the chatbot model if it is not set.
+        """
+        if max_dimension is None:
+            return self._chatbot.get_image_max_dimension()
+        return max_dimension
+
+    def _load_undescribed_images(
+        self,
+        img_paths: list[str],
+        reduce_quality: bool,
+        exiftool_path: str,
+        size_budget: int = None,
+        max_dimension: int = None,
+        skip_described: bool = False
+    ) -> tuple[Images, list[ImageDescription]]:
+        """
+        Loads images and returns them with existing descriptions if skip_described is set, None for other images.
+        Existing metadata is read before images are prepared, so described images are not encoded and don't share size budget.
+        Images are not fit to size budget yet, see _fit_to_budget.
+        """
+        imgs = self._create_images(img_paths, exiftool_path)
+        imgs.set_preprocessor(self._preprocessor)
+
+        img_metadata: list[ImageDescription] = [None] * len(imgs)
+        if skip_described:
+            img_metadata = self._read_existing_descriptions(imgs)
+
+        undescribed = [i for i, description in enumerate(img_metadata) if description is None]
+        if undescribed:
+            self._prepare_images(imgs.subset(undescribed), reduce_quality, size_budget, max_dimension)
+        return imgs, img_metadata
+
+    def _get_cached_descriptions(self, imgs: Images) -> tuple[list[str], list[ImageDescription]]:
+        """
+        Looks up images in the description cache.
+        Returns cache keys and cached descriptions, None for images that are not cached.
+        """
+        chatbot_key = self._chatbot.get_cache_key()
+        # key is computed from source file and encoding settings, so cached images are not encoded
+        keys = [self._description_cache.make_key(img.content_key(), chatbot_key) for img in imgs]
+        return keys, [self._description_cache.get(key) for key in keys]
+
+    @staticmethod
+    def _parse_existing_description(tags: dict) -> ImageDescription | None:
+        """
+        Returns description from tags read by ExifTool, None if image has no description.
+        """
+        description = str(tags.get(DESCRIPTION_TAG, "")).strip()
+        if not description:
+            return None
+
+        keywords = []
+        for tag in KEYWORDS_TAGS:
+            value = tags.get(tag)
+            if value is None:
+                continue
+            for keyword in value if isinstance(value, list) else [value]:
+                if str(keyword) not in keywords:
+                    keywords.append(str(keyword))
+
+        return ImageDescription(description=description, keywords=keywords)
+
+    def _read_existing_descriptions(self, imgs: Images) -> list[ImageDescription]:
+        """
+        Reads descriptions that are already written to images, None for images without description.
+        Only description and keyword tags of all images are read with one ExifTool call.
+        """
+        img_tags = imgs.read_metadata([DESCRIPTION_TAG, *KEYWORDS_TAGS])
+        img_metadata = [self._parse_existing_description(tags) for tags in img_tags]
+        logger.debug(f"{len(img_metadata) - img_metadata.count(None)} of {len(img_metadata)} images are already described")
+        return img_metadata
+
+    def _merge_generated_descriptions(self, keys: list[str] | None, img_metadata: list[ImageDescription], missing: list[int], generated: list[ImageDescription]):
+        """
+        Stores generated descriptions in the cache if keys are set and puts them to img_metadata at missing indices.
+        """
+        for i, description in zip(missing, generated):
+            if description is None:
+                continue
+            if keys is not None:
+                self._description_cache.put(keys[i], description)
+            img_metadata[i] = description
+
+    def _find_near_duplicates(self, imgs: Images) -> tuple[list[int], list[int]] | None:
+        """
+        Returns representative of each image and sorted indices of representatives, None if detection is off.
+        """
+        if self._near_duplicate_distance is None:
+            return None
+
+        representatives = imgs.find_near_duplicates(self._near_duplicate_distance)
+        unique = sorted(set(representatives))
+        if len(unique) < len(imgs):
+            logger.info(f"{len(imgs) - len(unique)} of {len(imgs)} images are near duplicates, their descriptions are reused")
+        return representatives, unique
+
+    @staticmethod
+    def _expand_duplicates(representatives: list[int], unique: list[int], generated: list[ImageDescription]) -> list[ImageDescription]:
+        """
+        Returns description of each image: description of representative of its group.
+        """
+        by_representative = dict(zip(unique, generated))
+        return [
+            description.model_copy(deep=True) if (description := by_representative[representative]) is not None else None
+            for representative in representatives
+        ]
 
-    def generate_image_description(self, img_paths: list[str], output_dir: str = None, reduce_quality: bool = True, exiftool_path: str = None) -> list[ImageDescription]:
+    def _get_cached_undescribed(self, imgs: Images, img_metadata: list[ImageDescription]) -> list[str] | None:
+        """
+        Looks up images without description in the cache and puts cached descriptions to img_metadata.
+        Returns cache key of each image, None for images that were not looked up, or None if cache is not set.
+        """
+        if self._description_cache is None:
+            return None
+
+        keys: list[str] = [None] * len(imgs)
+        undescribed = [i for i, description in enumerate(img_metadata) if description is None]
+        if undescribed:
+            undescribed_keys, cached = self._get_cached_descriptions(imgs.subset(undescribed))
+            self._merge_descriptions(keys, undescribed, undescribed_keys)
+            self._merge_descriptions(img_metadata, undescribed, cached)
+        return keys
+
+    def _group_near_duplicates(self, imgs: Images, missing: list[int]) -> list[list[int]]:
+        """
+        Groups images at missing indices into near duplicates, representative is the first image of group.
+        Each image is a group of its own if detection is off.
+        """
+        duplicates = self._find_near_duplicates(imgs.subset(missing))
+        if duplicates is None:
+            return [[i] for i in missing]
+
+        by_representative: dict[int, list[int]] = {}
+        for k, representative in enumerate(duplicates[0]):
+            by_representative.setdefault(representative, []).append(missing[k])
+        return list(by_representative.values())
+
+    def _put_group_description(self, group: list[int], description: ImageDescription, img_metadata: list[ImageDescription], keys: list[str] | None) -> list[tuple[int, ImageDescription]]:
+        """
+        Puts description generated for representative to all images of its group and to the cache.
+        Returns index and description of each image of group.
+        """
+        results = []
+        for i in group:
+            img_description = description if i == group[0] else description.model_copy(deep=True)
+            img_metadata[i] = img_description
+            if keys:
+                self._description_cache.put(keys[i], img_description)
+            results.append((i, img_description))
+        return results
+
+    @staticmethod
+    def _merge_descriptions(img_metadata: list[ImageDescription], indices: list[int], descriptions: list[ImageDescription]):
+        """
+        Puts descriptions to img_metadata at indices.
+        """
+        for i, description in zip(indices, descriptions):
+            img_metadata[i] = description
+
+    def get_write_mode(self) -> WriteMode:
+        return self._write_mode
+
+    def _should_write_described(self) -> bool:
+        """
+        Returns True if images skipped because they are already described are written too:
+        in copy mode they are copied to output directory, in other modes they are left untouched.
+        """
+        return self._write_mode == "copy"
+
+    def _should_write(self, output_dir: str) -> bool:
+        """
+        Returns True if metadata should be written: output directory is set or images are updated in place.
+        """
+        return bool(output_dir) or self._write_mode != "copy"
+
+class ImgDescGen(ImgDescGenBase):
+    """
+    Class that provides simple interface for retrieving AI-generated description of image and writing it to the image metadata.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Terminates all ExifTool and image preprocessing processes started by this instance and closes the chatbot.
+        """
+        super().close()
+        self._chatbot.close()
+
+    def _generate_new(self, imgs: Images) -> list[ImageDescription]:
+        """
+        Calls chatbot, only representatives of near duplicates are sent if detection is on.
+        """
+        duplicates = self._find_near_duplicates(imgs)
+        if duplicates is None:
+            return self._chatbot.generate_image_description(imgs)
+
+        representatives, unique = duplicates
+        try:
+            generated = self._chatbot.generate_image_description(imgs.subset(unique))
+        except ChatbotPartiallyFailed as e:
+            raise ChatbotPartiallyFailed(self._expand_duplicates(representatives, unique, e.results), e.errors) from e
+        return self._expand_duplicates(representatives, unique, generated)
+
+    def _generate_cached(self, imgs: Images, cached: tuple[list[str], list[ImageDescription]] = None) -> list[ImageDescription]:
+        """
+        Returns cached descriptions and calls chatbot only for images that are not cached.
+        Result of _get_cached_descriptions can be passed in cached if images were already looked up.
+        """
+        keys, img_metadata = cached or self._get_cached_descriptions(imgs)
+
+        missing = [i for i, description in enumerate(img_metadata) if description is None]
+        if missing:
+            try:
+                generated = self._generate_new(imgs.subset(missing))
+            except ChatbotPartiallyFailed as e:
+                self._merge_generated_descriptions(keys, img_metadata, missing, e.results)
+                raise ChatbotPartiallyFailed(img_metadata, e.errors) from e
+
+            self._merge_generated_descriptions(keys, img_metadata, missing, generated)
+
+        return img_metadata
+
+    def generate_image_description(
+        self,
+        img_paths: list[str],
+        output_dir: str = None,
+        reduce_quality: bool = True,
+        exiftool_path: str = None,
+        size_budget: int = None,
+        max_dimension: int = None,
+        skip_described: bool = False
+    ) -> list[ImageDescription]:
         """
         Loads image from file and sends request to the chatbot.
         Then writes metadata to image and dumps it to disk.
@@ -21,24 +433,208 @@ class ImgDescGen():
             output_dir (str): Output directory for updated images.
                 Note that output directory must not contain images with the same name as in input directory.
             reduce_quality (bool): Reduce quality of all images.
+                If False, original files are sent without re-encoding when their format is supported.
             exiftool_path (str): Path to the ExifTool executable. 
                 If None, environment variable EXIFTOOL_PATH or PATH is used.
+            size_budget (int): Max total size of images sent to the chatbot in bytes.
+                If set, quality of each image is chosen adaptively instead of reduce_quality,
+                e.g. set it to GeminiConfig.inline_size_limit to avoid uploading images.
+            max_dimension (int): Max size of the longer side of each image in pixels, larger images are downscaled.
+                If None, target resolution of the chatbot model is used.
+            skip_described (bool): Read existing metadata of images first and send to the chatbot only images without description.
+                Existing description and keywords (IPTC:Keywords, XMP:Subject) are returned for other images,
+                they are not encoded; in copy mode they are copied to output directory, other modes leave them untouched.
 
         Returns:
             dict: Dictionary containing metadata for each image.
         """
-        imgs = Images(img_paths)
+        imgs, img_metadata = self._load_undescribed_images(img_paths, reduce_quality, exiftool_path, size_budget, max_dimension, skip_described)
+        undescribed = [i for i, description in enumerate(img_metadata) if description is None]
+        keys = self._get_cached_undescribed(imgs, img_metadata)
 
-        if not exiftool_path:
-            exiftool_path = os.environ.get("EXIFTOOL_PATH")
-        imgs.set_exiftool_path(exiftool_path)
+        missing = [i for i, description in enumerate(img_metadata) if description is None]
+        if missing:
+            self._fit_to_budget(imgs.subset(missing), size_budget, max_dimension)
+            try:
+                generated = self._generate_new(imgs.subset(missing))
+            except ChatbotPartiallyFailed as e:
+                self._merge_generated_descriptions(keys, img_metadata, missing, e.results)
+                raise ChatbotPartiallyFailed(img_metadata, e.errors) from e
+            self._merge_generated_descriptions(keys, img_metadata, missing, generated)
 
-        if reduce_quality:
-            imgs.reduce_quality()
+        if self._should_write(output_dir):
+            written = range(len(imgs)) if self._should_write_described() else undescribed
+            imgs.subset(written).write_description_metadata([img_metadata[i] for i in written], output_dir, self._write_mode)
+
+        return img_metadata
+
+    def generate_image_description_stream(
+        self,
+        img_paths: list[str],
+        output_dir: str = None,
+        reduce_quality: bool = True,
+        exiftool_path: str = None,
+        size_budget: int = None,
+        max_dimension: int = None,
+        skip_described: bool = False,
+        write_batch_size: int = 50
+    ) -> Iterator[tuple[str, ImageDescription]]:
+        """
+        Same as generate_image_description, but yields path of image and its description as soon as it is generated,
+        see ChatbotBase.generate_image_description_stream. Metadata of yielded images is written in background
+        while later images are still being generated.
+
+        Args:
+            img_paths, output_dir, reduce_quality, exiftool_path, size_budget, max_dimension, skip_described: See generate_image_description.
+            write_batch_size (int): Max number of images written with one ExifTool call.
+
+        Raises:
+            ChatbotPartiallyFailed: After all results were yielded, if some images failed.
+        """
+        imgs, img_metadata = self._load_undescribed_images(img_paths, reduce_quality, exiftool_path, size_budget, max_dimension, skip_described)
+        described = {i for i, description in enumerate(img_metadata) if description is not None}
+        keys = self._get_cached_undescribed(imgs, img_metadata)
+
+        writer = _StreamWriter(imgs, output_dir, self._write_mode, write_batch_size) if self._should_write(output_dir) else None
+        errors: list[Exception] = []
+        try:
+            for i, description in enumerate(img_metadata):
+                if description is not None:
+                    if writer and (i not in described or self._should_write_described()):
+                        writer.put(i, description)
+                    yield img_paths[i], description
+
+            missing = [i for i, description in enumerate(img_metadata) if description is None]
+            if missing:
+                self._fit_to_budget(imgs.subset(missing), size_budget, max_dimension)
+                groups = self._group_near_duplicates(imgs, missing)
+                try:
+                    for j, description in self._chatbot.generate_image_description_stream(imgs.subset([group[0] for group in groups])):
+                        for i, img_description in self._put_group_description(groups[j], description, img_metadata, keys):
+                            if writer:
+                                writer.put(i, img_description)
+                            yield img_paths[i], img_description
+                except ChatbotPartiallyFailed as e:
+                    errors = e.errors
+        finally:
+            if writer:
+                writer.close()
+
+        if errors:
+            raise ChatbotPartiallyFailed(img_metadata, errors) from errors[0]
+
+    def write_description_metadata(self, img_paths: list[str], img_metadata: list[ImageDescription], output_dir: str = None, exiftool_path: str = None):
+        """
+        Writes already generated descriptions to images and dumps them to output directory.
+
+        Args:
+            img_paths (list[str]): List of images path.
+            img_metadata (list[ImageDescription]): Description of each image.
+            output_dir (str): Output directory for updated images, see write_mode.
+            exiftool_path (str): Path to the ExifTool executable.
+        """
+        self._create_images(img_paths, exiftool_path).write_description_metadata(img_metadata, output_dir, self._write_mode)
+
+    def get_pipeline_stats(self) -> list[StageStats]:
+        """
+        Returns statistics of stages of the last generate_image_description_pipelined call.
+        """
+        return self._pipeline_stats
+
+    def generate_image_description_pipelined(
+        self,
+        img_paths: list[str],
+        output_dir: str = None,
+        reduce_quality: bool = True,
+        exiftool_path: str = None,
+        size_budget: int = None,
+        max_dimension: int = None,
+        chunk_size: int = 50,
+        generate_workers: int = 2,
+        queue_size: int = 2
+    ) -> list[ImageDescription]:
+        """
+        Same as generate_image_description, but images are split into chunks that go through stages:
+        loading and encoding, upload, generation and metadata writing.
+        Stages are connected by bounded queues and work on different chunks at the same time,
+        so total time approaches time of the slowest stage instead of sum of all stages.
+
+        Args:
+            img_paths, output_dir, reduce_quality, exiftool_path, max_dimension: See generate_image_description.
+            size_budget (int): Max total size of images of one chunk in bytes.
+            chunk_size (int): Number of images in chunk.
+            generate_workers (int): Number of chunks whose descriptions are generated concurrently.
+            queue_size (int): Max number of chunks waiting for each stage.
+
+        Raises:
+            ChatbotPartiallyFailed: Descriptions of some chunks or images failed, results contain None for them.
+        """
+        def prepare(chunk: _PipelineChunk) -> _PipelineChunk:
+            chunk.imgs = self._load_images(chunk.img_paths, reduce_quality, exiftool_path, size_budget, max_dimension)
+            missing = list(range(len(chunk.imgs)))
+            if self._description_cache is not None:
+                chunk.cached = self._get_cached_descriptions(chunk.imgs)
+                missing = [i for i, description in enumerate(chunk.cached[1]) if description is None]
+            self._fit_to_budget(chunk.imgs.subset(missing), size_budget, max_dimension)
+            chunk.imgs.subset(missing).encode()
+            return chunk
+
+        def upload(chunk: _PipelineChunk) -> _PipelineChunk:
+            missing = list(range(len(chunk.imgs)))
+            if chunk.cached:
+                missing = [i for i, description in enumerate(chunk.cached[1]) if description is None]
+            if missing:
+                self._chatbot.prepare_images(chunk.imgs.subset(missing))
+            return chunk
+
+        def generate(chunk: _PipelineChunk) -> _PipelineChunk:
+            try:
+                if self._description_cache is not None:
+                    chunk.img_metadata = self._generate_cached(chunk.imgs, chunk.cached)
+                else:
+                    chunk.img_metadata = self._generate_new(chunk.imgs)
+            except ChatbotPartiallyFailed as e:
+                chunk.img_metadata = e.results
+                chunk.errors = e.errors
+            return chunk
+
+        def write(chunk: _PipelineChunk) -> _PipelineChunk:
+            if self._should_write(output_dir):
+                succeeded = [i for i, description in enumerate(chunk.img_metadata) if description is not None]
+                chunk.imgs.subset(succeeded).write_description_metadata([chunk.img_metadata[i] for i in succeeded], output_dir, self._write_mode)
+            chunk.imgs.close()
+
+            # chunk is kept until the end of run, only descriptions are kept so memory doesn't grow with number of images
+            chunk.imgs.discard_encoded()
+            chunk.imgs = None
+            chunk.cached = None
+            return chunk
+
+        pipeline = Pipeline([
+            PipelineStage("prepare", prepare, queue_size=queue_size),
+            PipelineStage("upload", upload, queue_size=queue_size),
+            PipelineStage("generate", generate, workers=generate_workers, queue_size=queue_size),
+            PipelineStage("write", write, queue_size=queue_size),
+        ])
+        chunks = [_PipelineChunk(img_paths[i:i + chunk_size]) for i in range(0, len(img_paths), chunk_size)]
+        chunk_results = pipeline.run(chunks)
+        self._pipeline_stats = pipeline.get_stats()
 
-        img_metadata = self._chatbot.generate_image_description(imgs)
+        img_metadata: list[ImageDescription] = []
+        errors: list[Exception] = []
+        for chunk, chunk_result in zip(chunks, chunk_results):
+            if isinstance(chunk_result, ChatbotFailed):
+                img_metadata += [None] * len(chunk.img_paths)
+                errors.append(chunk_result)
+            elif isinstance(chunk_result, Exception):
+                raise chunk_result
+            else:
+                img_metadata += chunk_result.img_metadata
+                errors += chunk_result.errors
 
-        if output_dir:
-            imgs.write_description_metadata(img_metadata, output_dir)
+        if errors:
+            if img_metadata.count(None) == len(img_metadata):
+                raise errors[0]
+            raise ChatbotPartiallyFailed(img_metadata, errors) from errors[0]
 
-        return img_metadata
\ No newline at end of file
+        return img_metadata
@@ -0,0 +1,273 @@
+from imgdescgenlib.chatbot.exceptions import ChatbotFailed, ChatbotPartiallyFailed
+from imgdescgenlib.exceptions import ImageToolException
+from imgdescgenlib.imgdescgen import ImgDescGen
+from imgdescgenlib.schemas import JobManifest, JobManifestEntry
+
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger("imgdescgenlib")
+
+# extensions of files processed by job
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".heic", ".heif", ".tif", ".tiff")
+
+# manifest is stored in output directory if path is not set
+MANIFEST_FILENAME = ".imgdescgen-manifest.json"
+
+# size of block read when hashing file
+HASH_BLOCK_SIZE = 1024*1024
+
+def hash_file(path: str) -> str:
+    """
+    Returns SHA-256 hex digest of file content.
+    """
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+class JobResult:
+    """
+    Result of directory job run.
+    """
+    def __init__(self):
+        self.total = 0 # number of images found
+        self.skipped = 0 # images which output was up to date
+        self.described = 0 # images described by this run
+        self.written = 0 # images written by this run
+        self.errors: list[Exception] = [] # errors of images that remain unfinished
+
+    def __repr__(self) -> str:
+        return f"total {self.total}, skipped {self.skipped}, described {self.described}, written {self.written}, errors {len(self.errors)}"
+
+class DescriptionJob:
+    """
+    Describes all images in directory tree and writes them to output directory with the same structure.
+    State of each image is checkpointed in manifest file after every chunk,
+    so interrupted or partially failed job continues from where it stopped when run again.
+    Image is processed again only if its content changed or its output is missing or outdated.
+    Source images are never modified, so generator must use copy write mode.
+    """
+    def __init__(
+        self,
+        img_desc_gen: ImgDescGen,
+        input_dir: str,
+        output_dir: str,
+        manifest_path: str = None,
+        exiftool_path: str = None,
+        chunk_size: int = 50,
+        recursive: bool = True,
+        extensions: tuple[str, ...] = IMAGE_EXTENSIONS
+    ):
+        """
+        Args:
+            img_desc_gen (ImgDescGen): Generator used to describe and write images, its write mode must be copy.
+            input_dir (str): Directory with source images.
+            output_dir (str): Directory for updated images.
+            manifest_path (str): Path to the manifest file, if None it is stored in output directory.
+            exiftool_path (str): Path to the ExifTool executable.
+            chunk_size (int): Number of images described in one call, manifest is saved after each chunk.
+            recursive (bool): Process subdirectories.
+            extensions (tuple[str, ...]): Extensions of image files, case insensitive.
+        """
+        if img_desc_gen.get_write_mode() != "copy":
+            raise ValueError(f"Job requires generator in copy write mode, got {img_desc_gen.get_write_mode()}")
+
+        self._img_desc_gen = img_desc_gen
+        self._input_dir = os.path.normpath(input_dir)
+        self._output_dir = os.path.normpath(output_dir)
+        self._manifest_path = manifest_path or os.path.join(self._output_dir, MANIFEST_FILENAME)
+        self._exiftool_path = exiftool_path
+        self._chunk_size = chunk_size
+        self._recursive = recursive
+        self._extensions = tuple(extension.lower() for extension in extensions)
+
+        self._manifest = self._load_manifest()
+
+    def _load_manifest(self) -> JobManifest:
+        empty = JobManifest(input_dir=self._input_dir, output_dir=self._output_dir)
+        if not os.path.exists(self._manifest_path):
+            return empty
+
+        try:
+            with open(self._manifest_path, "r", encoding="utf-8") as f:
+                manifest = JobManifest.model_validate_json(f.read())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load job manifest {self._manifest_path}: {e}")
+            return empty
+
+        if manifest.input_dir != self._input_dir or manifest.output_dir != self._output_dir:
+            logger.warning(f"Job manifest {self._manifest_path} belongs to another job, starting from scratch")
+            return empty
+
+        return manifest
+
+    def _save_manifest(self):
+        """
+        Writes manifest atomically, so it is never left half written.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self._manifest_path)), exist_ok=True)
+        tmp_path = f"{self._manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self._manifest.model_dump_json())
+        os.replace(tmp_path, self._manifest_path)
+
+    def get_manifest(self) -> JobManifest:
+        """
+        Returns current state of all images.
+        """
+        return self._manifest
+
+    def _source_path(self, rel_path: str) -> str:
+        return os.path.join(self._input_dir, *rel_path.split("/"))
+
+    def _output_dir_of(self, rel_path: str) -> str:
+        return os.path.join(self._output_dir, *rel_path.split("/")[:-1])
+
+    def _scan(self) -> list[str]:
+        """
+        Returns sorted paths of images relative to input directory, with "/" as separator.
+        """
+        output_dir = os.path.realpath(self._output_dir)
+        rel_paths = []
+        for dirpath, dirnames, filenames in os.walk(self._input_dir):
+            if not self._recursive:
+                dirnames.clear()
+            # don't process images written by the job itself
+            dirnames[:] = [d for d in dirnames if os.path.realpath(os.path.join(dirpath, d)) != output_dir]
+
+            for filename in filenames:
+                if filename.lower().endswith(self._extensions):
+                    rel_path = os.path.relpath(os.path.join(dirpath, filename), self._input_dir)
+                    rel_paths.append(rel_path.replace(os.sep, "/"))
+        return sorted(rel_paths)
+
+    def _refresh_entry(self, rel_path: str) -> JobManifestEntry:
+        """
+        Returns manifest entry of image, reset to pending if source file content changed.
+        Content is hashed only if file size or modification time changed.
+        """
+        stat = os.stat(self._source_path(rel_path))
+        entry = self._manifest.files.get(rel_path)
+        if entry and entry.size == stat.st_size and entry.mtime == stat.st_mtime:
+            return entry
+
+        sha256 = hash_file(self._source_path(rel_path))
+        if entry and entry.sha256 == sha256:
+            entry.size, entry.mtime = stat.st_size, stat.st_mtime
+            return entry
+
+        return JobManifestEntry(size=stat.st_size, mtime=stat.st_mtime, sha256=sha256)
+
+    def _is_output_up_to_date(self, entry: JobManifestEntry) -> bool:
+        return bool(entry.output_path) and os.path.exists(entry.output_path) \
+            and os.path.getmtime(entry.output_path) >= entry.mtime
+
+    def _group_chunks(self, rel_paths: list[str]) -> list[list[str]]:
+        """
+        Splits images into chunks of images from the same directory.
+        """
+        groups: dict[str, list[str]] = {}
+        for rel_path in rel_paths:
+            groups.setdefault(rel_path.rpartition("/")[0], []).append(rel_path)
+
+        return [
+            group[i:i + self._chunk_size]
+            for group in groups.values()
+            for i in range(0, len(group), self._chunk_size)
+        ]
+
+    def _describe(self, rel_paths: list[str], result: JobResult, **generate_kwargs):
+        """
+        Generates descriptions without writing them, images are written by _write.
+        """
+        for chunk in self._group_chunks(rel_paths):
+            try:
+                descriptions = self._img_desc_gen.generate_image_description(
+                    [self._source_path(rel_path) for rel_path in chunk],
+                    exiftool_path=self._exiftool_path,
+                    **generate_kwargs
+                )
+            except ChatbotPartiallyFailed as e:
+                descriptions = e.results
+                result.errors += e.errors
+            except (ChatbotFailed, ImageToolException) as e:
+                logger.warning(f"Failed to describe {len(chunk)} images: {e}")
+                result.errors.append(e)
+                continue
+
+            for rel_path, description in zip(chunk, descriptions):
+                if description is None:
+                    continue
+                entry = self._manifest.files[rel_path]
+                entry.state = "described"
+                entry.description = description
+                result.described += 1
+
+            self._save_manifest()
+
+    def _write(self, rel_paths: list[str], result: JobResult):
+        for chunk in self._group_chunks(rel_paths):
+            output_dir = self._output_dir_of(chunk[0])
+            output_paths = [os.path.join(output_dir, os.path.basename(rel_path)) for rel_path in chunk]
+
+            # ExifTool doesn't overwrite files, remove outdated outputs
+            for output_path in output_paths:
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+
+            try:
+                self._img_desc_gen.write_description_metadata(
+                    [self._source_path(rel_path) for rel_path in chunk],
+                    [self._manifest.files[rel_path].description for rel_path in chunk],
+                    output_dir,
+                    self._exiftool_path
+                )
+            except ImageToolException as e:
+                logger.warning(f"Failed to write {len(chunk)} images to {output_dir}: {e}")
+                result.errors.append(e)
+                continue
+
+            for rel_path, output_path in zip(chunk, output_paths):
+                entry = self._manifest.files[rel_path]
+                entry.state = "written"
+                entry.output_path = output_path
+                result.written += 1
+
+            self._save_manifest()
+
+    def run(self, reduce_quality: bool = True, size_budget: int = None, max_dimension: int = None) -> JobResult:
+        """
+        Describes and writes images that are not done yet.
+        Arguments are passed to ImgDescGen.generate_image_description.
+        Errors of single chunks don't stop the job, they are returned in result and failed images are retried on next run.
+        """
+        result = JobResult()
+
+        rel_paths = self._scan()
+        self._manifest.files = {rel_path: self._refresh_entry(rel_path) for rel_path in rel_paths}
+        result.total = len(rel_paths)
+
+        for entry in self._manifest.files.values():
+            # written image which output was removed or is older than source is written again
+            if entry.state == "written" and not self._is_output_up_to_date(entry):
+                entry.state = "described"
+        self._save_manifest()
+
+        pending = [rel_path for rel_path, entry in self._manifest.files.items() if entry.state == "pending"]
+        result.skipped = result.total - len(pending) - sum(1 for entry in self._manifest.files.values() if entry.state == "described")
+        logger.info(f"Job {self._input_dir}: {result.total} images, {len(pending)} to describe, {result.skipped} up to date")
+
+        self._describe(
+            pending,
+            result,
+            reduce_quality=reduce_quality,
+            size_budget=size_budget,
+            max_dimension=max_dimension
+        )
+        self._write([rel_path for rel_path, entry in self._manifest.files.items() if entry.state == "described"], result)
+
+        logger.info(f"Job {self._input_dir} finished: {result}")
+        return result
@@ -0,0 +1,195 @@
+import os
+import shutil
+import struct
+import PIL.Image
+
+from xml.sax.saxutils import escape
+
+from imgdescgenlib.schemas import ImageDescription
+
+EXIF_HEADER = b"Exif\x00\x00"
+XMP_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+XMP_EXTENSION_HEADER = b"http://ns.adobe.com/xmp/extension/\x00"
+PHOTOSHOP_HEADER = b"Photoshop 3.0\x00"
+
+APP0 = 0xE0
+APP1 = 0xE1
+APP13 = 0xED
+SOS = 0xDA
+EOI = 0xD9
+
+# max size of segment payload, length field is 2 bytes and includes itself
+MAX_SEGMENT_SIZE = 0xFFFF - 2
+
+# size of block copied after metadata segments
+COPY_BLOCK_SIZE = 1024*1024
+
+# IPTC keyword is limited to 64 bytes
+IPTC_KEYWORD_MAX_SIZE = 64
+
+TAG_IMAGE_DESCRIPTION = 0x010E
+TAG_EXIF_IFD = 0x8769
+TAG_INTEROP_IFD = 0xA005
+TAG_MAKER_NOTE = 0x927C
+
+def _read_segments(f) -> list[tuple[int, bytes]] | None:
+    """
+    Reads segments before image data, file position is left at start of scan.
+    Returns None if file is not a valid JPEG.
+    """
+    if f.read(2) != b"\xff\xd8":
+        return None
+
+    segments = []
+    while True:
+        position = f.tell()
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+
+        if marker[1] in (SOS, EOI):
+            f.seek(position)
+            return segments
+
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        payload = f.read(length - 2)
+        if len(payload) != length - 2:
+            return None
+        segments.append((marker[1], payload))
+
+def _has_unsafe_exif(exif_payload: bytes) -> bool:
+    """
+    Returns True if EXIF can't be rewritten without loss: it has thumbnail IFD, maker note or interoperability IFD
+    which offsets would be broken.
+    """
+    tiff = exif_payload[len(EXIF_HEADER):]
+    if len(tiff) < 8 or tiff[:2] not in (b"II", b"MM"):
+        return True
+
+    order = "<" if tiff[:2] == b"II" else ">"
+    ifd0_offset = struct.unpack(order + "I", tiff[4:8])[0]
+    if ifd0_offset + 2 > len(tiff):
+        return True
+    entry_count = struct.unpack(order + "H", tiff[ifd0_offset:ifd0_offset + 2])[0]
+    next_offset_position = ifd0_offset + 2 + entry_count * 12
+    if next_offset_position + 4 > len(tiff):
+        return True
+    if struct.unpack(order + "I", tiff[next_offset_position:next_offset_position + 4])[0] != 0:
+        return True # IFD1 with thumbnail
+
+    exif = PIL.Image.Exif()
+    exif.load(tiff)
+    exif_ifd = exif.get_ifd(TAG_EXIF_IFD)
+    return TAG_MAKER_NOTE in exif_ifd or TAG_INTEROP_IFD in exif_ifd
+
+def _exif_payload(existing: bytes | None, img_metadata: ImageDescription) -> bytes:
+    exif = PIL.Image.Exif()
+    if existing:
+        exif.load(existing[len(EXIF_HEADER):])
+        # nested IFDs must be loaded to be written back
+        exif.get_ifd(TAG_EXIF_IFD)
+
+    # EXIF ASCII tag is written as UTF-8 like ExifTool does
+    exif[TAG_IMAGE_DESCRIPTION] = img_metadata.description.encode("utf-8")
+
+    payload = exif.tobytes()
+    if not payload.startswith(EXIF_HEADER):
+        payload = EXIF_HEADER + payload
+    return payload
+
+def _xmp_payload(img_metadata: ImageDescription) -> bytes:
+    keywords = "".join(f"<rdf:li>{escape(keyword)}</rdf:li>" for keyword in img_metadata.keywords)
+    packet = (
+        '<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>'
+        '<x:xmpmeta xmlns:x="adobe:ns:meta/">'
+        '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+        '<rdf:Description rdf:about="" xmlns:dc="http://purl.org/dc/elements/1.1/">'
+        f'<dc:description><rdf:Alt><rdf:li xml:lang="x-default">{escape(img_metadata.description)}</rdf:li></rdf:Alt></dc:description>'
+        f'<dc:subject><rdf:Bag>{keywords}</rdf:Bag></dc:subject>'
+        '</rdf:Description>'
+        '</rdf:RDF>'
+        '</x:xmpmeta>'
+        '<?xpacket end="w"?>'
+    )
+    return XMP_HEADER + packet.encode("utf-8")
+
+def _truncate_utf8(value: str, max_size: int) -> bytes:
+    return value.encode("utf-8")[:max_size].decode("utf-8", errors="ignore").encode("utf-8")
+
+def _iptc_payload(img_metadata: ImageDescription) -> bytes:
+    def dataset(record: int, number: int, data: bytes) -> bytes:
+        return struct.pack(">BBBH", 0x1C, record, number, len(data)) + data
+
+    iptc = dataset(1, 90, b"\x1b%G") # coded character set: UTF-8
+    iptc += dataset(2, 0, b"\x00\x04") # record version
+    for keyword in img_metadata.keywords:
+        iptc += dataset(2, 25, _truncate_utf8(keyword, IPTC_KEYWORD_MAX_SIZE))
+    if len(iptc) % 2:
+        iptc += b"\x00"
+
+    # Photoshop image resource 0x0404 (IPTC) with empty name
+    return PHOTOSHOP_HEADER + b"8BIM" + struct.pack(">HHI", 0x0404, 0, len(iptc)) + iptc
+
+def _segment(marker: int, payload: bytes) -> bytes:
+    return struct.pack(">BBH", 0xFF, marker, len(payload) + 2) + payload
+
+def write_jpeg_metadata(src_path: str, dst_path: str, img_metadata: ImageDescription) -> bool:
+    """
+    Writes the same tags as MetadataWriter with ExifTool: description to EXIF and XMP, keywords to XMP and IPTC segments of JPEG.
+    Segments are replaced at the start of file, image data is copied as is without decoding.
+    Returns False and writes nothing if file can't be safely handled: it is not JPEG or already has XMP, IPTC
+    or EXIF with offsets that would be broken. ExifTool should be used for such files.
+
+    Args:
+        src_path (str): Source image.
+        dst_path (str): Output image, must not exist unless it is the source itself.
+            If it is the source, file is replaced atomically.
+        img_metadata (ImageDescription): Description and keywords.
+    """
+    in_place = os.path.abspath(src_path) == os.path.abspath(dst_path)
+    if not in_place and os.path.exists(dst_path):
+        return False
+
+    with open(src_path, "rb") as src:
+        segments = _read_segments(src)
+        if segments is None:
+            return False
+
+        exif = None
+        for marker, payload in segments:
+            if marker == APP13 or (marker == APP1 and payload.startswith((XMP_HEADER, XMP_EXTENSION_HEADER))):
+                return False
+            if marker == APP1 and payload.startswith(EXIF_HEADER):
+                if exif is not None or _has_unsafe_exif(payload):
+                    return False
+                exif = payload
+
+        metadata_segments = [
+            (APP1, _exif_payload(exif, img_metadata)),
+            (APP1, _xmp_payload(img_metadata)),
+            (APP13, _iptc_payload(img_metadata))
+        ]
+        if any(len(payload) > MAX_SEGMENT_SIZE for _, payload in metadata_segments):
+            return False
+
+        # JFIF segment must stay first
+        head = [segment for segment in segments[:1] if segment[0] == APP0]
+        tail = [segment for segment in segments[len(head):] if not (segment[0] == APP1 and segment[1] is exif)]
+
+        tmp_path = f"{dst_path}.tmp"
+        try:
+            with open(tmp_path, "wb") as dst:
+                dst.write(b"\xff\xd8")
+                for marker, payload in head + metadata_segments + tail:
+                    dst.write(_segment(marker, payload))
+                shutil.copyfileobj(src, dst, COPY_BLOCK_SIZE)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    os.replace(tmp_path, dst_path)
+    return True
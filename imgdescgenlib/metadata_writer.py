@@ -0,0 +1,171 @@
+import exiftool
+import json
+import logging
+import os
+import tempfile
+
+from typing import Literal
+
+from imgdescgenlib.exceptions import ImageToolException
+from imgdescgenlib.exiftool_pool import ExifToolPool, exiftool_session
+from imgdescgenlib.jpeg_metadata import write_jpeg_metadata
+from imgdescgenlib.schemas import ImageDescription
+
+# copy - images with metadata are written to output directory
+# in_place - original images are updated
+# sidecar - metadata is written to XMP sidecar files, images are not touched
+WriteMode = Literal["copy", "in_place", "sidecar"]
+
+WRITE_MODES = ("copy", "in_place", "sidecar")
+
+logger = logging.getLogger("imgdescgenlib")
+
+class MetadataWriter:
+    """
+    Writes description and keywords of many images with one ExifTool call.
+    Description is written to EXIF:ImageDescription and XMP-dc:Description,
+    keywords to IPTC:Keywords and XMP-dc:Subject. Sidecar files get only XMP tags.
+    Simple JPEG files are written natively without ExifTool, the rest fall back to ExifTool.
+    """
+    def __init__(self, mode: WriteMode = "copy", exiftool_pool: ExifToolPool = None, exiftool_path: str = None, native_jpeg: bool = True):
+        """
+        Args:
+            mode (WriteMode): Where metadata is written: copy, in_place or sidecar.
+            exiftool_pool (ExifToolPool): Pool of running ExifTool processes, if None a new process is started for each call.
+            exiftool_path (str): Path to the ExifTool executable, used if pool is not set.
+            native_jpeg (bool): Write JPEG files without ExifTool when possible, see write_jpeg_metadata.
+        """
+        if mode not in WRITE_MODES:
+            raise ValueError(f"Unknown write mode {mode}, expected one of {WRITE_MODES}")
+
+        self._mode = mode
+        self._exiftool_pool = exiftool_pool
+        self._exiftool_path = exiftool_path
+        self._native_jpeg = native_jpeg
+
+    def _tags(self, img_metadata: ImageDescription) -> dict:
+        """
+        Returns tags written for image description.
+        """
+        tags = {
+            "XMP-dc:Description": img_metadata.description,
+            "XMP-dc:Subject": img_metadata.keywords
+        }
+        if self._mode != "sidecar":
+            tags.update({
+                "EXIF:ImageDescription": img_metadata.description,
+                "IPTC:Keywords": img_metadata.keywords,
+                "IPTC:CodedCharacterSet": "UTF8"
+            })
+        return tags
+
+    @staticmethod
+    def get_sidecar_path(img_path: str, output_path: str = None) -> str:
+        """
+        Returns path of XMP sidecar of image: next to the image or in output_path if set.
+        """
+        directory = output_path or os.path.dirname(img_path)
+        return os.path.join(directory, os.path.splitext(os.path.basename(img_path))[0] + ".xmp")
+
+    def write(self, img_paths: list[str], img_metadata: list[ImageDescription], output_path: str = None):
+        """
+        Writes description of each image.
+
+        Args:
+            img_paths (list[str]): List of images path.
+            img_metadata (list[ImageDescription]): Description of each image.
+            output_path (str): Output directory, required in copy mode.
+                In sidecar mode sidecars are written to it instead of image directory.
+        """
+        # SourceFile in json must match file names passed to ExifTool
+        img_paths = [os.path.abspath(img_path) for img_path in img_paths]
+
+        if self._mode == "copy":
+            if not output_path:
+                raise ValueError("Output path is required in copy mode")
+            os.makedirs(output_path, exist_ok=True)
+            img_paths, img_metadata = self._write_native(img_paths, img_metadata, output_path)
+            if img_paths:
+                self._execute(img_paths, img_metadata, "-o", f"{output_path}/")
+        elif self._mode == "in_place":
+            img_paths, img_metadata = self._write_native(img_paths, img_metadata)
+            if img_paths:
+                self._execute(img_paths, img_metadata, "-overwrite_original")
+        else:
+            if output_path:
+                os.makedirs(output_path, exist_ok=True)
+
+            # existing sidecars are updated, the rest are created from images
+            sidecar_paths = [self.get_sidecar_path(img_path, output_path) for img_path in img_paths]
+            existing = [i for i, sidecar_path in enumerate(sidecar_paths) if os.path.exists(sidecar_path)]
+            new = [i for i, sidecar_path in enumerate(sidecar_paths) if not os.path.exists(sidecar_path)]
+
+            if existing:
+                self._execute(
+                    [sidecar_paths[i] for i in existing],
+                    [img_metadata[i] for i in existing],
+                    "-overwrite_original"
+                )
+            if new:
+                self._execute(
+                    [img_paths[i] for i in new],
+                    [img_metadata[i] for i in new],
+                    "-o", os.path.join(output_path, "%f.xmp") if output_path else "%d%f.xmp"
+                )
+
+    def _write_native(self, img_paths: list[str], img_metadata: list[ImageDescription], output_path: str = None) -> tuple[list[str], list[ImageDescription]]:
+        """
+        Writes JPEG files natively, to output_path or in place.
+        Returns images that must be written by ExifTool.
+        """
+        if not self._native_jpeg:
+            return img_paths, img_metadata
+
+        rest_paths, rest_metadata = [], []
+        for img_path, metadata in zip(img_paths, img_metadata):
+            dst_path = os.path.join(output_path, os.path.basename(img_path)) if output_path else img_path
+            try:
+                written = write_jpeg_metadata(img_path, dst_path, metadata)
+            except OSError as e:
+                raise ImageToolException(f"Failed to write {img_path}: {e}")
+
+            if not written:
+                rest_paths.append(img_path)
+                rest_metadata.append(metadata)
+
+        if len(rest_paths) < len(img_paths):
+            logger.debug(f"Written {len(img_paths) - len(rest_paths)} JPEG images natively, {len(rest_paths)} with ExifTool")
+        return rest_paths, rest_metadata
+
+    def _execute(self, file_paths: list[str], img_metadata: list[ImageDescription], *args: str):
+        """
+        Imports tags of files from json file in one ExifTool call, files are passed in argfile.
+        """
+        with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tmpdir:
+            json_path = os.path.join(tmpdir, "metadata.json")
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    [{"SourceFile": file_path, **self._tags(metadata)} for file_path, metadata in zip(file_paths, img_metadata)],
+                    f,
+                    ensure_ascii=False
+                )
+
+            # file list is passed in argfile, so command line length doesn't grow with number of images
+            argfile_path = os.path.join(tmpdir, "files.txt")
+            with open(argfile_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(file_paths))
+
+            try:
+                with exiftool_session(self._exiftool_pool, self._exiftool_path) as et:
+                    et.execute(
+                        "-charset", "filename=utf8",
+                        f"-json={json_path}",
+                        *args,
+                        "-@", argfile_path
+                    )
+            except FileNotFoundError as e:
+                raise ImageToolException(f"ExifTool not found: {e}")
+            except exiftool.exceptions.ExifToolExecuteException as e:
+                raise ImageToolException(f"ExifTool execution error: {e}")
+            except exiftool.exceptions.ExifToolException as e:
+                raise ImageToolException(f"ExifTool error: {e}")
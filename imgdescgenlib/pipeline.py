@@ -0,0 +1,145 @@
+import logging
+import queue
+import threading
+import time
+
+from typing import Any, Callable, Iterable
+
+logger = logging.getLogger("imgdescgenlib")
+
+# marks end of input in stage queue
+_END = object()
+
+class StageStats:
+    """
+    Statistics of pipeline stage.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.processed = 0
+        self.failed = 0
+        self.busy_time = 0.0 # time spent processing items
+        self.idle_time = 0.0 # time spent waiting for input, stage is starved
+        self.blocked_time = 0.0 # time spent waiting for space in output queue, next stage is too slow (backpressure)
+        self.max_queue_depth = 0 # max number of items waiting in input queue
+
+    def __repr__(self) -> str:
+        return f"{self.name}: processed {self.processed}, failed {self.failed}, busy {self.busy_time:.2f} s, " \
+            f"idle {self.idle_time:.2f} s, blocked {self.blocked_time:.2f} s, max queue depth {self.max_queue_depth}"
+
+class PipelineStage:
+    """
+    Stage of pipeline: function applied to each item by worker threads.
+    """
+    def __init__(self, name: str, func: Callable[[Any], Any], workers: int = 1, queue_size: int = 1):
+        """
+        Args:
+            name (str): Stage name used in statistics.
+            func (Callable): Function that processes item and returns item for the next stage.
+            workers (int): Number of threads that process items concurrently.
+            queue_size (int): Max number of items waiting for this stage, previous stage blocks when queue is full.
+        """
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue_size = queue_size
+
+class Pipeline:
+    """
+    Runs items through stages connected by bounded queues, so different items are processed by different stages at the same time.
+    If stage raises exception for item, exception is passed to the end of pipeline instead of item, following stages skip it.
+    """
+    def __init__(self, stages: list[PipelineStage]):
+        self._stages = stages
+        self._stats: list[StageStats] = []
+
+    def get_stats(self) -> list[StageStats]:
+        """
+        Returns statistics of stages of the last run.
+        """
+        return self._stats
+
+    def _run_worker(self, stage: PipelineStage, stats: StageStats, input_queue: queue.Queue, output_queue: queue.Queue, lock: threading.Lock):
+        while True:
+            started = time.monotonic()
+            entry = input_queue.get()
+            waited = time.monotonic() - started
+            if entry is _END:
+                # let other workers of the stage finish too
+                input_queue.put(_END)
+                return
+
+            queue_depth = input_queue.qsize() + 1
+
+            index, item = entry
+            started = time.monotonic()
+            processed = failed = 0
+            if not isinstance(item, Exception):
+                try:
+                    item = stage.func(item)
+                    processed = 1
+                except Exception as e:
+                    logger.debug(f"Pipeline stage {stage.name} failed: {e}")
+                    item = e
+                    failed = 1
+            busy = time.monotonic() - started
+
+            started = time.monotonic()
+            output_queue.put((index, item))
+            blocked = time.monotonic() - started
+
+            with lock:
+                stats.idle_time += waited
+                stats.busy_time += busy
+                stats.blocked_time += blocked
+                stats.max_queue_depth = max(stats.max_queue_depth, queue_depth)
+                stats.processed += processed
+                stats.failed += failed
+
+    def run(self, items: Iterable) -> list:
+        """
+        Runs items through all stages.
+        Returns results in input order, exception for items that failed.
+        """
+        queues = [queue.Queue(stage.queue_size) for stage in self._stages]
+        results_queue = queue.Queue()
+        self._stats = [StageStats(stage.name) for stage in self._stages]
+
+        stage_threads: list[list[threading.Thread]] = []
+        for i, stage in enumerate(self._stages):
+            output_queue = queues[i + 1] if i + 1 < len(queues) else results_queue
+            lock = threading.Lock()
+            threads = [
+                threading.Thread(
+                    target=self._run_worker,
+                    args=(stage, self._stats[i], queues[i], output_queue, lock),
+                    name=f"pipeline-{stage.name}",
+                    daemon=True
+                )
+                for _ in range(stage.workers)
+            ]
+            for thread in threads:
+                thread.start()
+            stage_threads.append(threads)
+
+        count = 0
+        for count, item in enumerate(items, 1):
+            queues[0].put((count - 1, item))
+        queues[0].put(_END)
+
+        # stages finish one after another, end of input is passed further when all workers of stage are done
+        for i, threads in enumerate(stage_threads):
+            for thread in threads:
+                thread.join()
+            if i + 1 < len(queues):
+                queues[i + 1].put(_END)
+
+        results = [None] * count
+        while not results_queue.empty():
+            index, result = results_queue.get()
+            results[index] = result
+
+        for stats in self._stats:
+            logger.debug(f"Pipeline stage {stats}")
+
+        return results
@@ -0,0 +1,146 @@
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import uuid
+
+from concurrent.futures import ProcessPoolExecutor
+
+from imgdescgenlib.image import EncodedImage, Image
+
+logger = logging.getLogger("imgdescgenlib")
+
+def _preprocess_image(img_path: str, quality: int | str, max_dimension: int, max_bytes: int, fit: bool, output_path: str) -> dict:
+    """
+    Encodes image in worker process and writes encoded bytes to output_path.
+    Returns encoding settings chosen by worker and encoded image info.
+    """
+    img = Image(img_path)
+    trials = 1
+    if fit:
+        trials = img.fit_to_budget(max_bytes, max_dimension)
+    else:
+        img._quality = quality
+        img.set_max_dimension(max_dimension)
+
+    encoded = img.encode()
+    with open(output_path, "wb") as f:
+        f.write(encoded.data)
+
+    return {
+        "quality": img._quality,
+        "max_dimension": img._max_dimension,
+        "mime_type": encoded.mime_type,
+        "sha256": encoded.sha256,
+        "trials": trials
+    }
+
+class ImagePreprocessor:
+    """
+    Decodes, resizes, encodes and hashes images in a pool of worker processes.
+    Encoded bytes are passed back through temporary files instead of being pickled,
+    lazy images keep the file and read bytes from it when they are sent.
+    Images that are sent as is (passthrough) are only read from disk, so they are not sent to workers.
+    """
+    def __init__(self, workers: int = None):
+        """
+        Args:
+            workers (int): Number of worker processes, None for number of CPUs.
+        """
+        self._workers = workers or os.cpu_count()
+        self._executor: ProcessPoolExecutor = None
+        self._lock = threading.Lock()
+        self._tmpdir = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """
+        Returns process pool, pool is started on first use.
+        """
+        with self._lock:
+            if self._executor is None:
+                # client threads may hold locks at fork time, so workers are spawned
+                self._executor = ProcessPoolExecutor(self._workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def close(self):
+        """
+        Stops worker processes, they are started again on next use.
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _run(self, images: list[Image], jobs: list[tuple]) -> int:
+        """
+        Runs jobs (quality, max_dimension, max_bytes, fit) for images and applies results to them.
+        Returns number of trial encodes.
+        """
+        executor = self._get_executor()
+        futures = []
+        for img, job in zip(images, jobs):
+            output_path = os.path.join(self._tmpdir.name, uuid.uuid4().hex)
+            futures.append((img, output_path, executor.submit(_preprocess_image, img._img_path, *job, output_path)))
+
+        trials = 0
+        for img, output_path, future in futures:
+            try:
+                result = future.result()
+                img._quality = result["quality"]
+                img.set_max_dimension(result["max_dimension"])
+                if img._lazy:
+                    img._cache_encoded_file(output_path, os.path.getsize(output_path), result["sha256"], result["mime_type"])
+                    output_path = None
+                else:
+                    with open(output_path, "rb") as f:
+                        encoded = EncodedImage(f.read(), result["mime_type"])
+                    encoded._sha256 = result["sha256"]
+                    img._cache_encoded(encoded, img._encode_key())
+            finally:
+                if output_path is not None and os.path.exists(output_path):
+                    os.remove(output_path)
+            trials += result["trials"]
+
+        return trials
+
+    def encode(self, images: list[Image]):
+        """
+        Encodes images with their current settings.
+        Images that are already encoded or sent as is are skipped.
+        """
+        pending = [img for img in images if not img._is_encoded() and not img.is_passthrough()]
+        if not pending:
+            return
+
+        self._run(pending, [(img._quality, img._max_dimension, None, False) for img in pending])
+        logger.debug(f"Encoded {len(pending)} images in {self._workers} processes")
+
+    def fit_to_budget(self, images: list[Image], budgets: list[int | None], max_dimension: int = None) -> int:
+        """
+        Fits each image into its byte budget, see Image.fit_to_budget.
+        Returns number of trial encodes.
+        """
+        trials = 0
+        pending: list[Image] = []
+        jobs: list[tuple] = []
+        for img, max_bytes in zip(images, budgets):
+            # images that need no re-encoding are checked locally
+            img._quality = "keep"
+            img.set_max_dimension(max_dimension)
+            if img.is_passthrough() and (max_bytes is None or img.size() <= max_bytes):
+                trials += 1
+                continue
+
+            pending.append(img)
+            jobs.append(("keep", max_dimension, max_bytes, True))
+
+        if pending:
+            trials += self._run(pending, jobs)
+        return trials
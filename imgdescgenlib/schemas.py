@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from typing import Literal
 
 class ImageDescription(BaseModel):
     """
@@ -6,3 +7,22 @@ class ImageDescription(BaseModel):
     """
     description: str
     keywords: list[str]
+
+class JobManifestEntry(BaseModel):
+    """
+    State of image in directory job manifest.
+    """
+    state: Literal["pending", "described", "written"] = "pending"
+    size: int # source file size and modification time, used to detect changed files without hashing them
+    mtime: float
+    sha256: str # hash of source file content
+    description: ImageDescription | None = None
+    output_path: str | None = None
+
+class JobManifest(BaseModel):
+    """
+    Content of directory job manifest file.
+    """
+    input_dir: str
+    output_dir: str
+    files: dict[str, JobManifestEntry] = {} # path relative to input directory -> state
@@ -0,0 +1,222 @@
+import json
+import os
+import threading
+import time
+import PIL.Image
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from imgdescgenlib.chatbot.base import ChatbotBase
+from imgdescgenlib.images import Images
+from imgdescgenlib.schemas import ImageDescription
+
+import pytest
+
+class CountingChatbot(ChatbotBase):
+    """
+    Describes images with their file names and records names of described images.
+    """
+    def __init__(self):
+        self.described: list[str] = []
+
+    def generate_image_description(self, images: Images) -> list[ImageDescription]:
+        self.described += [img.get_filename() for img in images]
+        return [ImageDescription(description=img.get_filename(), keywords=[]) for img in images]
+
+    def get_cache_key(self) -> str:
+        return "test model\ntest prompt"
+
+class StubGeminiHandler(BaseHTTPRequestHandler):
+    """
+    Minimal Gemini API: generateContent, streamGenerateContent, countTokens, files.list and resumable uploads.
+    Behaviour is set by attributes of the server, see gemini_server.
+    """
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body: dict, status: int = 200, headers: dict = {}):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            data = b""
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return data
+                data += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_GET(self):
+        if "/v1beta/files" in self.path:
+            return self._send({"files": []})
+        self._send({"models": []})
+
+    def do_POST(self):
+        server = self.server
+        if self.path.startswith("/resumable/"):
+            return self._upload(self.path[len("/resumable/"):])
+
+        body = self._read_body()
+        if "/upload/v1beta/files" in self.path:
+            name = json.loads(body)["file"]["display_name"]
+            return self._send({}, headers={"X-Goog-Upload-URL": f"{server.url}/resumable/{name}"})
+        if ":countTokens" in self.path:
+            return self._send({"totalTokens": 100})
+
+        request = json.loads(body)
+        parts = request["contents"][0]["parts"]
+        image_count = sum(1 for part in parts if "inlineData" in part or "file_data" in part)
+        with server.lock:
+            server.generate_requests.append(image_count)
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        time.sleep(server.delay)
+        with server.lock:
+            server.in_flight -= 1
+        if server.status or image_count in server.fail_image_counts:
+            return self._send({"error": "stub failure"}, status=server.status or 400)
+
+        # items have ids only if images are labeled, description tells name of server and position of image in request
+        ids = [int(part["text"].split(": ")[1]) for part in parts if part.get("text", "").startswith("Image id")]
+        items = [{"description": f"{server.name}{i}", "keywords": []} for i in range(image_count)]
+        if ids:
+            items = [dict(item, id=i) for i, item in zip(ids, items)]
+        if server.drop_last and image_count > 1:
+            items = items[:-1]
+
+        text = json.dumps(items)
+        usage = {"promptTokenCount": 1, "candidatesTokenCount": server.output_tokens_per_image * image_count}
+        if ":streamGenerateContent" not in self.path:
+            return self._send({"candidates": [{"content": {"parts": [{"text": text}]}, "finishReason": "STOP"}], "usageMetadata": usage})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        pieces = [text[i:i + server.stream_piece_size] for i in range(0, len(text), server.stream_piece_size)]
+        for i, piece in enumerate(pieces):
+            event = {"candidates": [{"content": {"parts": [{"text": piece}], "role": "model"}}]}
+            if i == len(pieces) - 1:
+                event["candidates"][0]["finishReason"] = "STOP"
+                event["usageMetadata"] = usage
+            self.wfile.write(f"data: {json.dumps(event)}\r\n\r\n".encode())
+            self.wfile.flush()
+
+    def _upload(self, name: str):
+        server = self.server
+        command = self.headers.get("X-Goog-Upload-Command")
+        received = server.received.get(name, 0)
+        if command == "query":
+            self._read_body()
+            return self._send({}, headers={"X-Goog-Upload-Status": "active", "X-Goog-Upload-Size-Received": str(received)})
+
+        offset = int(self.headers["X-Goog-Upload-Offset"])
+        size = int(self.headers["Content-Length"])
+        server.upload_offsets.append((name, offset))
+        if name in server.drop_uploads and name not in server.dropped_uploads:
+            # connection is lost in the middle of the body, server keeps bytes it received
+            server.dropped_uploads.add(name)
+            self.rfile.read(size // 2)
+            server.received[name] = offset + size // 2
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+
+        self.rfile.read(size)
+        if name in server.fail_uploads:
+            return self._send({"error": "stub failure"}, status=400)
+        server.received[name] = offset + size
+        if name in server.broken_uploads:
+            return self._send({})
+        self._send({"file": {"uri": f"{server.url}/files/{name}", "expirationTime": "2099-01-01T00:00:00Z"}})
+
+@pytest.fixture
+def gemini_server():
+    """
+    Returns function that starts stub Gemini server on a local port, servers are stopped after test.
+    Attributes of returned server set failures:
+        delay: seconds each generate request takes.
+        status: status code of every generate request.
+        fail_image_counts: generate requests with this number of images fail with 400.
+        drop_last: description of the last image is omitted from responses with several images.
+        stream_piece_size: number of characters of response text in one server-sent event.
+        output_tokens_per_image: output tokens of one description reported in usage metadata.
+        drop_uploads: display names of images which upload is interrupted once in the middle of the body.
+        fail_uploads: display names of images which upload fails with 400.
+        broken_uploads: display names of images which upload response has no file.
+    """
+    servers = []
+
+    def start(name: str = "d", **attributes) -> ThreadingHTTPServer:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubGeminiHandler)
+        server.url = f"http://127.0.0.1:{server.server_port}"
+        server.name = name
+        server.lock = threading.Lock()
+        server.delay = 0
+        server.status = None
+        server.fail_image_counts = set()
+        server.drop_last = False
+        server.stream_piece_size = 25
+        server.output_tokens_per_image = 10
+        server.drop_uploads = set()
+        server.fail_uploads = set()
+        server.broken_uploads = set()
+        server.generate_requests = [] # number of images of each generate request
+        server.upload_offsets = [] # (display name, offset) of each upload request
+        server.in_flight = 0
+        server.max_in_flight = 0 # max number of generate requests processed at the same time
+        server.received = {}
+        server.dropped_uploads = set()
+        for attribute, value in attributes.items():
+            setattr(server, attribute, value)
+
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def counting_chatbot() -> CountingChatbot:
+    """
+    Returns chatbot that describes images with their file names, see CountingChatbot.
+    """
+    return CountingChatbot()
+
+@pytest.fixture
+def create_temp_image():
+    """
+    Returns function that saves solid color image to directory and returns its path.
+    File name pattern is formatted with index, its extension sets image format.
+    """
+    def create(directory: str, index: int = 0, filename: str = "temp_image_{}.jpg", size: tuple[int, int] = (228, 1337), color: tuple[int, int, int] = (0, 0, 255)) -> str:
+        img_path = os.path.join(directory, filename.format(index))
+        os.makedirs(os.path.dirname(img_path), exist_ok=True)
+        PIL.Image.new('RGB', size=size, color=color).save(img_path)
+        return img_path
+
+    return create
+
+@pytest.fixture
+def create_temp_images(create_temp_image):
+    """
+    Returns function that saves count images named by their index, see create_temp_image.
+    Colors of images differ, so they are not near duplicates of each other.
+    """
+    def create(directory: str, count: int, filename: str = "{}.jpg", size: tuple[int, int] = (64, 64)) -> list[str]:
+        return [create_temp_image(directory, i, filename, size, color=(i * 50, 0, 0)) for i in range(count)]
+
+    return create
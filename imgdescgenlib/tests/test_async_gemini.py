@@ -0,0 +1,57 @@
+import asyncio
+import tempfile
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from imgdescgenlib.async_imgdescgen import AsyncImgDescGen
+from imgdescgenlib.chatbot.exceptions import ChatbotPartiallyFailed
+from imgdescgenlib.chatbot.gemini.async_gemini import AsyncGeminiClient
+from imgdescgenlib.chatbot.gemini.exceptions import GeminiUploadFailed
+from imgdescgenlib.chatbot.gemini.schemas import GeminiConfig, GeminiModel
+
+def stub_config(server, **kwargs) -> GeminiConfig:
+    return GeminiConfig(base_url=server.url, model_name=GeminiModel(name="models/test"), count_tokens=False, **kwargs)
+
+def generate(client: AsyncGeminiClient, img_paths: list[str]) -> list:
+    async def run():
+        async with client, AsyncImgDescGen(client) as img_desc_gen:
+            return await img_desc_gen.generate_image_description(img_paths)
+    return asyncio.run(run())
+
+def descriptions_of(results: list) -> list[str | None]:
+    return [description.description if description else None for description in results]
+
+def test_async_chunks_with_concurrency_limit(gemini_server, create_temp_images):
+    server = gemini_server(delay=0.05)
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        client = AsyncGeminiClient(stub_config(server, chunk_max_image_count=2), max_concurrency=2)
+        results = generate(client, create_temp_images(tempdir, 7))
+
+    # results are in input order, description tells position of image in its chunk
+    assert descriptions_of(results) == ["d0", "d1", "d0", "d1", "d0", "d1", "d0"]
+    assert sorted(server.generate_requests) == [1, 2, 2, 2]
+    assert server.max_in_flight == 2
+
+def test_async_partial_failure_and_missing_retry(gemini_server, create_temp_images):
+    # chunk of two images fails, last description of chunk of three is missing and requested again
+    server = gemini_server(fail_image_counts={2}, drop_last=True)
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        client = AsyncGeminiClient(stub_config(server, chunk_max_image_count=3, missing_retries=1))
+        with pytest.raises(ChatbotPartiallyFailed) as e:
+            generate(client, create_temp_images(tempdir, 5))
+
+    assert descriptions_of(e.value.results) == ["d0", "d1", "d0", None, None]
+    assert sorted(server.generate_requests) == [1, 2, 3]
+    assert len(e.value.errors) == 1
+
+def test_async_upload_failure(gemini_server, create_temp_images):
+    server = gemini_server(fail_uploads={"0.jpg"}, broken_uploads={"2.jpg"})
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        client = AsyncGeminiClient(stub_config(server, force_upload=True))
+        with pytest.raises(ChatbotPartiallyFailed) as e:
+            generate(client, create_temp_images(tempdir, 3))
+
+    assert descriptions_of(e.value.results) == [None, "d0", None]
+    assert sorted(error.image_filename for error in e.value.errors) == ["0.jpg", "2.jpg"]
+    assert all(isinstance(error, GeminiUploadFailed) for error in e.value.errors)
@@ -0,0 +1,43 @@
+import asyncio
+import os
+import tempfile
+
+from imgdescgenlib.async_imgdescgen import AsyncImgDescGen
+from imgdescgenlib.chatbot.async_base import AsyncChatbotBase
+from imgdescgenlib.images import Images
+from imgdescgenlib.schemas import ImageDescription
+
+class FilenameChatbot(AsyncChatbotBase):
+    async def generate_image_description(self, images: Images) -> list[ImageDescription]:
+        return [ImageDescription(description=img.get_filename(), keywords=[]) for img in images]
+
+    def get_cache_key(self) -> str:
+        return "filename"
+
+def test_async_generate_without_sync_apis(create_temp_images):
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_paths = create_temp_images(tempdir, 2)
+
+        async def generate():
+            async with AsyncImgDescGen(FilenameChatbot()) as img_desc_gen:
+                return await img_desc_gen.generate_image_description(img_paths)
+
+        descriptions = asyncio.run(generate())
+        assert [description.description for description in descriptions] == ["0.jpg", "1.jpg"]
+
+    # pipelined generation needs sync chatbot
+    assert not hasattr(AsyncImgDescGen, "generate_image_description_pipelined")
+
+def test_async_generate_stream(create_temp_images):
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_paths = create_temp_images(tempdir, 3)
+        output_dir = os.path.join(tempdir, "output")
+        os.makedirs(output_dir)
+
+        async def generate():
+            async with AsyncImgDescGen(FilenameChatbot()) as img_desc_gen:
+                return [result async for result in img_desc_gen.generate_image_description_stream(img_paths, output_dir, write_batch_size=2)]
+
+        results = asyncio.run(generate())
+        assert [(os.path.basename(path), description.description) for path, description in results] == [("0.jpg", "0.jpg"), ("1.jpg", "1.jpg"), ("2.jpg", "2.jpg")]
+        assert sorted(os.listdir(output_dir)) == ["0.jpg", "1.jpg", "2.jpg"]
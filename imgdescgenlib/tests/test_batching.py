@@ -0,0 +1,78 @@
+import os
+import tempfile
+
+from imgdescgenlib.chatbot.batching import plan_chunks
+from imgdescgenlib.chatbot.gemini.common import IMAGE_TILE_TOKENS
+from imgdescgenlib.chatbot.gemini.gemini import GeminiClient
+from imgdescgenlib.chatbot.gemini.schemas import GeminiConfig, GeminiModel, GeminiUsageMetadata
+from imgdescgenlib.image import Image
+from imgdescgenlib.images import Images
+from imgdescgenlib.imgdescgen import ImgDescGen
+
+def test_plan_chunks_by_count():
+    chunks = plan_chunks([1] * 5, [1] * 5, max_count=2)
+    assert chunks == [[0, 1], [2, 3], [4]]
+
+def test_plan_chunks_by_bytes_and_tokens():
+    sizes = [10, 10, 30, 5, 5]
+    tokens = [1, 1, 1, 8, 8]
+    chunks = plan_chunks(sizes, tokens, max_count=10, max_bytes=25, max_tokens=10)
+
+    # image larger than byte limit goes to its own chunk
+    assert chunks == [[0, 1], [2], [3], [4]]
+    assert sum(chunks, []) == list(range(len(sizes)))
+
+def test_plan_chunks_by_output_tokens():
+    chunks = plan_chunks([1] * 5, [1] * 5, max_count=10, output_tokens=[300] * 5, max_output_tokens=700)
+    assert chunks == [[0, 1], [2, 3], [4]]
+
+def test_gemini_plan_chunks_by_token_limits(create_temp_images):
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        images = Images(create_temp_images(tempdir, 6, "{}.png", size=(100, 100)))
+
+        config = GeminiConfig(
+            model_name=GeminiModel(name="models/test", inputTokenLimit=1000, outputTokenLimit=1000),
+            description_output_tokens=100,
+            count_tokens=False
+        )
+        client = GeminiClient(config)
+        client._prompt_tokens = 100
+        # counted tokens of resolution are used instead of estimate
+        client._image_tokens[(100, 100)] = 300
+        assert client._plan_chunks(images) == [[0, 1, 2], [3, 4, 5]]
+
+        # output estimate is raised from response usage, so chunks get smaller
+        client._update_output_tokens(GeminiUsageMetadata(promptTokenCount=1, candidatesTokenCount=800), 2)
+        assert client._plan_chunks(images) == [[0, 1], [2, 3], [4, 5]]
+
+def test_gemini_images_are_encoded_by_preprocessor(gemini_server, monkeypatch, create_temp_images):
+    server = gemini_server()
+    parent_encodes = []
+    encode_pixels = Image._encode_pixels
+    monkeypatch.setattr(Image, "_encode_pixels", lambda img: parent_encodes.append(img) or encode_pixels(img))
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_paths = create_temp_images(tempdir, 4, "{}.png", size=(100, 100))
+
+        config = GeminiConfig(base_url=server.url, model_name=GeminiModel(name="models/test"), chunk_max_image_count=2, count_tokens=False)
+        with ImgDescGen(GeminiClient(config), preprocess_workers=2) as img_desc_gen:
+            descriptions = img_desc_gen.generate_image_description(img_paths)
+
+    assert len(descriptions) == 4 and all(descriptions)
+    # workers are spawned, so encodes in worker processes are not counted
+    assert parent_encodes == []
+
+def test_gemini_undecodable_passthrough_image(gemini_server, create_temp_image):
+    server = gemini_server()
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        # HEIC PIL can't identify is sent as is, its tokens are estimated without dimensions
+        heic_path = os.path.join(tempdir, "0.heic")
+        with open(heic_path, "wb") as f:
+            f.write(b"\x00\x00\x00\x18ftypheic\x00\x00\x00\x00" + bytes(1000))
+        jpeg_path = create_temp_image(tempdir, 1, "{}.jpg", size=(100, 100))
+
+        client = GeminiClient(GeminiConfig(base_url=server.url, model_name=GeminiModel(name="models/test")))
+        descriptions = client.generate_image_description(Images([heic_path, jpeg_path]))
+
+        assert [description.description for description in descriptions] == ["d0", "d1"]
+        assert client._estimate_image_tokens(Image(heic_path)) == 16 * IMAGE_TILE_TOKENS
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import time
+
+from imgdescgenlib.cache import SQLiteDescriptionCache
+from imgdescgenlib.image import Image
+from imgdescgenlib.imgdescgen import ImgDescGen
+from imgdescgenlib.schemas import ImageDescription
+
+def test_cache_eviction():
+    description = ImageDescription(description="test", keywords=["word 1"])
+    with SQLiteDescriptionCache(":memory:", max_entries=2) as cache:
+        for key in ["a", "b", "c"]:
+            cache.put(key, description)
+            time.sleep(0.01)
+
+        assert len(cache) == 2
+        assert cache.get("a") is None
+        assert cache.get("c") == description
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    with SQLiteDescriptionCache(":memory:", max_age=0.01) as cache:
+        cache.put("a", description)
+        time.sleep(0.02)
+        assert cache.get("a") is None
+
+def test_imgdescgen_uses_cache(counting_chatbot, create_temp_image):
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_paths = [create_temp_image(tempdir, i, color=(i * 80, 0, 255)) for i in range(3)]
+        chatbot = counting_chatbot
+
+        with SQLiteDescriptionCache(os.path.join(tempdir, "cache.sqlite")) as cache:
+            img_desc_gen = ImgDescGen(chatbot, description_cache=cache)
+
+            img_desc_gen.generate_image_description(img_paths[:2])
+            assert chatbot.described == ["temp_image_0.jpg", "temp_image_1.jpg"]
+
+            chatbot.described.clear()
+            descriptions = img_desc_gen.generate_image_description(img_paths)
+
+            assert chatbot.described == ["temp_image_2.jpg"]
+            assert [desc.description for desc in descriptions] == [os.path.basename(path) for path in img_paths]
+            assert (cache.hits, cache.misses) == (2, 3)
+
+def test_cache_hit_skips_encoding(monkeypatch, counting_chatbot, create_temp_image):
+    encoded = []
+    encode_pixels = Image._encode_pixels
+    monkeypatch.setattr(Image, "_encode_pixels", lambda img: encoded.append(img.get_filename()) or encode_pixels(img))
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_paths = [create_temp_image(tempdir, i, color=(i * 80, 0, 255)) for i in range(2)]
+        with SQLiteDescriptionCache(":memory:") as cache:
+            img_desc_gen = ImgDescGen(counting_chatbot, description_cache=cache)
+            img_desc_gen.generate_image_description(img_paths)
+
+            encoded.clear()
+            img_desc_gen.generate_image_description(img_paths)
+            assert encoded == []
+            assert cache.hits == 2
+
+            # other encoding settings are a different key
+            img_desc_gen.generate_image_description(img_paths, max_dimension=100)
+            assert cache.hits == 2
+
+
+def test_cache_hit_with_size_budget(monkeypatch, counting_chatbot, create_temp_image):
+    encoded = []
+    encode_pixels = Image._encode_pixels
+    monkeypatch.setattr(Image, "_encode_pixels", lambda img: encoded.append(img.get_filename()) or encode_pixels(img))
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_paths = [create_temp_image(tempdir, i, color=(i * 80, 0, 255)) for i in range(6)]
+        with SQLiteDescriptionCache(":memory:") as cache:
+            chatbot = counting_chatbot
+            img_desc_gen = ImgDescGen(chatbot, description_cache=cache)
+            img_desc_gen.generate_image_description(img_paths[:3], size_budget=3000)
+
+            # key doesn't depend on quality chosen for the batch, cached images are not fit to budget
+            encoded.clear()
+            chatbot.described.clear()
+            img_desc_gen.generate_image_description(img_paths, size_budget=3000)
+            assert (cache.hits, cache.misses) == (3, 6)
+            assert chatbot.described == ["temp_image_3.jpg", "temp_image_4.jpg", "temp_image_5.jpg"]
+            assert set(encoded) == {"temp_image_3.jpg", "temp_image_4.jpg", "temp_image_5.jpg"}
@@ -0,0 +1,42 @@
+import os
+import random
+import tempfile
+import PIL.Image
+import PIL.ImageDraw
+
+from imgdescgenlib.dedup import BKTree, find_near_duplicates, hamming_distance
+from imgdescgenlib.images import Images
+
+def draw_temp_image(path: str, shape_box: tuple[int, int, int, int], brightness: int = 0):
+    pil_image = PIL.Image.new('RGB', size=(640, 480), color=(40 + brightness, 80, 120))
+    PIL.ImageDraw.Draw(pil_image).ellipse(shape_box, fill=(250, 240, 200))
+    pil_image.save(path)
+
+def test_bk_tree_search():
+    rng = random.Random(1)
+    hashes = [rng.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for i, hash_value in enumerate(hashes):
+        tree.add(hash_value, i)
+
+    query = hashes[10] ^ 0b1011
+    expected = sorted((hamming_distance(query, hash_value), i) for i, hash_value in enumerate(hashes) if hamming_distance(query, hash_value) <= 20)
+    assert tree.search(query, 20) == expected
+    assert tree.search(query, 3)[0] == (3, 10)
+
+def test_find_near_duplicates():
+    assert find_near_duplicates([0b0000, 0b0001, 0b1111, 0b0011, 0b1110], 1) == [0, 0, 2, 3, 2]
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_paths = [os.path.join(tempdir, f"{i}.jpg") for i in range(4)]
+        draw_temp_image(img_paths[0], (100, 100, 300, 300))
+        # burst shot: slightly moved and brighter
+        draw_temp_image(img_paths[1], (104, 102, 304, 302), brightness=6)
+        draw_temp_image(img_paths[2], (350, 150, 600, 450))
+        draw_temp_image(img_paths[3], (100, 100, 300, 300))
+
+        assert Images(img_paths).find_near_duplicates(6) == [0, 0, 2, 0]
+        assert Images(img_paths).find_near_duplicates(0) == [0, 1, 2, 0]
+
+def test_find_near_duplicates_without_hash():
+    assert find_near_duplicates([0b0000, None, 0b0001, None], 1) == [0, 1, 0, 3]
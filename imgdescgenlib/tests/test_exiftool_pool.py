@@ -0,0 +1,47 @@
+import os
+import tempfile
+import threading
+
+from imgdescgenlib.exiftool_pool import ExifToolPool
+from imgdescgenlib.image import Image
+from imgdescgenlib.images import Images
+from imgdescgenlib.metadata_writer import MetadataWriter
+from imgdescgenlib.schemas import ImageDescription
+
+PROCESSED_IMAGES_DIR = 'processed_images'
+
+def test_pool_metadata_rw(create_temp_image):
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir, ExifToolPool(size=2) as pool:
+        img_paths = [create_temp_image(tempdir, i) for i in range(4)]
+        output_path = os.path.join(tempdir, PROCESSED_IMAGES_DIR)
+
+        def write(i: int):
+            # JPEG would be written natively, so native writer is off to write through the pool
+            writer = MetadataWriter("copy", pool, native_jpeg=False)
+            writer.write([img_paths[i]], [ImageDescription(description=f"test_{i}", keywords=[])], output_path)
+
+        threads = [threading.Thread(target=write, args=(i,)) for i in range(len(img_paths))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        new_imgs = Images([os.path.join(output_path, os.path.basename(path)) for path in img_paths])
+        new_imgs.set_exiftool_pool(pool)
+        tags = new_imgs.read_metadata()
+
+        for i in range(len(img_paths)):
+            assert tags[i]["EXIF:ImageDescription"] == f"test_{i}"
+
+def test_pool_restarts_crashed_process(create_temp_image):
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir, ExifToolPool(size=1) as pool:
+        img = Image(create_temp_image(tempdir))
+        img.set_exiftool_pool(pool)
+        img.read_metadata()
+
+        # kill the process behind the pool's back
+        with pool.acquire() as et:
+            et._process.kill()
+            et._process.wait()
+
+        assert img.read_metadata()[0]["SourceFile"]
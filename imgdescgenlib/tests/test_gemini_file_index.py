@@ -0,0 +1,45 @@
+import os
+import tempfile
+
+from datetime import datetime, timedelta, timezone
+
+from imgdescgenlib.chatbot.gemini.file_index import GeminiFileIndex
+from imgdescgenlib.chatbot.gemini.schemas import GeminiFile
+
+def create_gemini_file(sha256_hash: str, expiration_time: datetime) -> GeminiFile:
+    return GeminiFile(
+        name=f"files/{sha256_hash}",
+        displayName=f"{sha256_hash}.jpg",
+        mimeType="image/jpeg",
+        sizeBytes="1",
+        createTime="2025-01-01T00:00:00Z",
+        updateTime="2025-01-01T00:00:00Z",
+        expirationTime=expiration_time.isoformat(),
+        sha256Hash=sha256_hash,
+        uri=f"https://example.com/files/{sha256_hash}"
+    )
+
+def test_file_index_persistence():
+    now = datetime.now(timezone.utc)
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        path = os.path.join(tempdir, "files.json")
+
+        index = GeminiFileIndex("key", path)
+        assert index.needs_refresh()
+
+        index.replace([
+            create_gemini_file("a", now + timedelta(hours=1)),
+            create_gemini_file("expired", now - timedelta(hours=1)),
+        ])
+        index.add("b", "https://example.com/files/b", now + timedelta(hours=1))
+        index.save()
+
+        index = GeminiFileIndex("key", path)
+        assert not index.needs_refresh()
+        assert index.get("a") == "https://example.com/files/a"
+        assert index.get("b") == "https://example.com/files/b"
+        assert index.get("expired") is None
+
+        # index of another API key is ignored
+        index = GeminiFileIndex("another key", path)
+        assert index.get("a") is None
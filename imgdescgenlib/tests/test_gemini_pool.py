@@ -0,0 +1,49 @@
+import math
+import tempfile
+
+from imgdescgenlib.chatbot.gemini.common import OUTPUT_TOKENS_MARGIN
+from imgdescgenlib.chatbot.gemini.pool import GeminiClientPool
+from imgdescgenlib.chatbot.gemini.schemas import GeminiConfig, GeminiModel
+from imgdescgenlib.images import Images
+
+def stub_configs(servers) -> list[GeminiConfig]:
+    return [
+        GeminiConfig(
+            api_key=server.name,
+            base_url=server.url,
+            model_name=GeminiModel(name="models/test"),
+            chunk_max_image_count=2,
+            count_tokens=False,
+            max_retries=0,
+            max_workers=1
+        )
+        for server in servers
+    ]
+
+def test_pool_ejects_rate_limited_key(gemini_server, create_temp_images):
+    servers = [gemini_server("a", status=429), gemini_server("b")]
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        images = Images(create_temp_images(tempdir, 8, "{}.png", size=(10, 10)))
+        pool = GeminiClientPool(stub_configs(servers), eject_after=2, eject_duration=60)
+        descriptions = pool.generate_image_description(images)
+
+        # every chunk rate limited by first key succeeded on second one
+        assert [description.description for description in descriptions] == ["b0", "b1"] * 4
+
+        # first key is ejected after two rate limited chunks, only chunks already sent to it can fail after that
+        rate_limited, healthy = pool.get_members()
+        assert 2 <= len(servers[0].generate_requests) == rate_limited.failures < 4
+        assert rate_limited.ejected_until > 0
+        assert healthy.requests == 4 and healthy.failures == 0 and healthy.in_flight == 0
+
+def test_pool_shares_output_estimate(gemini_server, create_temp_images):
+    # all chunks go to second key, its long descriptions must raise estimate of first key that plans chunks
+    servers = [gemini_server("a"), gemini_server("b", output_tokens_per_image=1000)]
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        images = Images(create_temp_images(tempdir, 4, "{}.png", size=(10, 10)))
+        pool = GeminiClientPool(stub_configs(servers), weights=[0.001, 1.0])
+        pool.generate_image_description(images)
+
+    assert servers[0].generate_requests == []
+    expected = math.ceil(1000 * OUTPUT_TOKENS_MARGIN)
+    assert [member.client._output_tokens_per_image for member in pool.get_members()] == [expected, expected]
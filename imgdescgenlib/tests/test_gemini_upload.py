@@ -0,0 +1,52 @@
+import tempfile
+import pytest
+
+from imgdescgenlib.chatbot.exceptions import ChatbotPartiallyFailed
+from imgdescgenlib.chatbot.gemini.exceptions import GeminiUploadFailed
+from imgdescgenlib.chatbot.gemini.gemini import GeminiClient
+from imgdescgenlib.chatbot.gemini.schemas import GeminiConfig, GeminiModel
+from imgdescgenlib.images import Images
+from imgdescgenlib.imgdescgen import ImgDescGen
+
+def upload_config(server) -> GeminiConfig:
+    return GeminiConfig(base_url=server.url, model_name=GeminiModel(name="models/test"), force_upload=True, count_tokens=False)
+
+def test_upload_resumes_after_dropped_connection(gemini_server, create_temp_images):
+    server = gemini_server(drop_uploads={"1.png"})
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        descriptions = GeminiClient(upload_config(server)).generate_image_description(Images(create_temp_images(tempdir, 3, "{}.png")))
+
+    assert [description.description for description in descriptions] == ["d0", "d1", "d2"]
+
+    # second request continues from the offset received by the server before connection was lost
+    offsets = [offset for name, offset in server.upload_offsets if name == "1.png"]
+    assert len(offsets) == 2 and offsets[0] == 0 and offsets[1] == server.received["1.png"] // 2
+
+def test_upload_failure_fails_only_its_image(gemini_server, create_temp_images):
+    server = gemini_server(fail_uploads={"0.png"}, broken_uploads={"2.png"})
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        with pytest.raises(ChatbotPartiallyFailed) as e:
+            GeminiClient(upload_config(server)).generate_image_description(Images(create_temp_images(tempdir, 3, "{}.png")))
+
+    assert [description.description if description else None for description in e.value.results] == [None, "d0", None]
+    assert sorted(error.image_filename for error in e.value.errors) == ["0.png", "2.png"]
+    assert all(isinstance(error, GeminiUploadFailed) for error in e.value.errors)
+
+def test_close_stops_upload_threads(gemini_server, create_temp_images):
+    server = gemini_server()
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        images = Images(create_temp_images(tempdir, 2, "{}.png"))
+        client = GeminiClient(upload_config(server))
+        with ImgDescGen(client) as img_desc_gen:
+            img_desc_gen.generate_image_description([img._img_path for img in images])
+            executor = client._upload_executor
+            assert executor is not None
+
+        # closing generator closes its chatbot
+        assert client._upload_executor is None
+        assert not any(thread.is_alive() for thread in executor._threads)
+
+        # client starts upload threads again on next use
+        with client:
+            assert len(client.generate_image_description(images)) == 2
+        assert client._upload_executor is None
@@ -2,22 +2,12 @@ import os
 import tempfile
 import PIL.Image
 
-from imgdescgenlib.image import Image
+from imgdescgenlib.image import DEFAULT_JPEG_QUALITY, Image
 from imgdescgenlib.schemas import ImageDescription
 
 PROCESSED_IMAGES_DIR = 'processed_images'
 
-def create_temp_image(directory: str) -> str:
-    img_filename = "temp_image.jpg"
-    img = PIL.Image.new('RGB',
-                      size=(228, 1337),
-                      color=(0, 0, 255))
-
-    temp_img_path = os.path.join(directory, img_filename)
-    img.save(temp_img_path)
-    return temp_img_path
-
-def test_image_metadata_rw():
+def test_image_metadata_rw(create_temp_image):
     with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
         metadata = ImageDescription.model_validate(
             {
@@ -29,7 +19,7 @@ def test_image_metadata_rw():
             }
         )
 
-        img_path = create_temp_image(tempdir)
+        img_path = create_temp_image(tempdir, filename="temp_image.jpg")
         new_img_path = os.path.join(tempdir, PROCESSED_IMAGES_DIR, os.path.basename(img_path))
 
         img = Image(img_path)
@@ -40,13 +30,124 @@ def test_image_metadata_rw():
 
         assert tags[0]["EXIF:ImageDescription"] == metadata.description
 
-def test_image_reduce_quality():
+def test_image_reduce_quality(create_temp_image):
     with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
-        img_path = create_temp_image(tempdir)
+        img_path = create_temp_image(tempdir, filename="temp_image.jpg")
         img = Image(img_path)
 
         original_size = img.size()
         img.reduce_quality()
         reduced_size = img.size()
 
-        assert reduced_size < original_size
\ No newline at end of file
+        assert reduced_size < original_size
+
+def test_image_encode_cache(create_temp_image):
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_path = create_temp_image(tempdir, filename="temp_image.jpg")
+        img = Image(img_path)
+
+        encoded = img.encode()
+        assert img.encode() is encoded
+        assert img.size() == encoded.size
+        assert img.save_to_buffer().getvalue() == encoded.data
+
+        img.reduce_quality()
+        reduced = img.encode()
+        assert reduced is not encoded
+        assert img.encode() is reduced
+        assert img.sha256() == reduced.sha256
+
+def test_image_passthrough(create_temp_image):
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_path = create_temp_image(tempdir, filename="temp_image.jpg")
+        img = Image(img_path)
+
+        with open(img_path, "rb") as f:
+            original_bytes = f.read()
+
+        assert img.is_passthrough()
+        assert img.encode().data == original_bytes
+        assert img.encode().mime_type == "image/jpeg"
+        assert img._internal_image is None # pixels are not decoded
+
+def test_image_png_reduce_quality():
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_path = os.path.join(tempdir, "temp_image.png")
+        PIL.Image.new('RGBA', size=(228, 1337), color=(0, 0, 255, 128)).save(img_path)
+
+        img = Image(img_path)
+        assert img.encode().mime_type == "image/png"
+
+        img.reduce_quality()
+        assert not img.is_passthrough()
+        assert img.encode().mime_type == "image/jpeg"
+        assert img.encode().data.startswith(b"\xff\xd8")
+
+def test_image_fit_to_budget():
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_path = os.path.join(tempdir, "temp_image.png")
+        PIL.Image.effect_noise((1024, 768), 64).convert("RGB").save(img_path)
+
+        img = Image(img_path)
+        max_bytes = 60 * 1024
+        img.fit_to_budget(max_bytes)
+        assert img.size() <= max_bytes
+        assert img.encode().mime_type == "image/jpeg"
+
+        img.fit_to_budget(max_bytes=None, max_dimension=256)
+        assert max(PIL.Image.open(img.save_to_buffer()).size) == 256
+
+        img.fit_to_budget(max_bytes=None)
+        assert img.is_passthrough()
+
+def test_image_fit_to_budget_encodes_once_per_quality(monkeypatch):
+    encodes = []
+    encode_pixels = Image._encode_pixels
+    monkeypatch.setattr(Image, "_encode_pixels", lambda img: encodes.append(img._encode_key()) or encode_pixels(img))
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_path = os.path.join(tempdir, "temp_image.png")
+        PIL.Image.effect_noise((512, 512), 64).convert("RGB").save(img_path)
+
+        img = Image(img_path)
+        trials = img.fit_to_budget(20 * 1024, max_dimension=400)
+        assert img.size() <= 20 * 1024
+
+        # resized image at "keep" quality is encoded at default quality, it is not encoded again by quality search
+        assert encodes[0] == ("keep", "JPEG", 400)
+        assert (DEFAULT_JPEG_QUALITY, "JPEG", 400) not in encodes
+        assert len(encodes) == len(set(encodes)) == trials
+
+def test_image_max_dimension(create_temp_image):
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_path = create_temp_image(tempdir, filename="temp_image.jpg")
+        img = Image(img_path)
+
+        img.set_max_dimension(2000)
+        assert img.is_passthrough() # already smaller
+
+        img.set_max_dimension(300)
+        assert not img.is_passthrough()
+        assert img.get_encoded_dimensions() == (51, 300)
+        assert PIL.Image.open(img.save_to_buffer()).size == (51, 300)
+        assert img.get_dimensions() == (228, 1337) # original image is not modified
+
+def test_image_undecodable_passthrough():
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        # HEIC header with data PIL can't identify, as without HEIF plugin
+        img_path = os.path.join(tempdir, "temp_image.heic")
+        with open(img_path, "wb") as f:
+            f.write(b"\x00\x00\x00\x18ftypheic\x00\x00\x00\x00" + bytes(1000))
+
+        img = Image(img_path)
+        img.set_max_dimension(3072)
+        assert img.get_dimensions() is None
+        assert img.is_passthrough()
+        assert img.encode().mime_type == "image/heic"
+        assert img.perceptual_hash() is None
+
+        # image is sent as is even if it doesn't fit
+        img.fit_to_budget(max_bytes=100, max_dimension=3072)
+        assert img.size() == os.path.getsize(img_path)
+        img.reduce_quality()
+        assert img.encode().mime_type == "image/heic"
@@ -1,25 +1,14 @@
 import os
 import tempfile
-import PIL.Image
 
+from imgdescgenlib.image import Image
 from imgdescgenlib.images import Images
+from imgdescgenlib.preprocess import ImagePreprocessor
 from imgdescgenlib.schemas import ImageDescription
 
 PROCESSED_IMAGES_DIR = 'processed_images'
 
-def create_temp_image(index: int, directory: str) -> str:
-
-    img_filename = f"temp_image_{index}.jpg"
-    img = PIL.Image.new('RGB',
-                      size=(228, 1337),
-                      color=(0, 0, 255))
-
-    temp_img_path = os.path.join(directory, img_filename)
-    img.save(temp_img_path)
-
-    return temp_img_path
-
-def test_image_metadata_rw():
+def test_image_metadata_rw(create_temp_image):
     # create 2 images
     img_count = 2
 
@@ -28,7 +17,7 @@ def test_image_metadata_rw():
         new_imgs_path = []
         metadata = []
         for i in range(img_count):
-            img_paths.append(create_temp_image(i, tempdir))
+            img_paths.append(create_temp_image(tempdir, i))
             new_imgs_path.append(os.path.join(tempdir, PROCESSED_IMAGES_DIR, os.path.basename(img_paths[i])))
 
             metadata.append(
@@ -52,7 +41,7 @@ def test_image_metadata_rw():
         for i in range(img_count):
             assert tags[i]["EXIF:ImageDescription"] == metadata[i].description
 
-def test_image_metadata_rw_different_directories():
+def test_image_metadata_rw_different_directories(create_temp_image):
     # create 2 images
     img_count = 2
 
@@ -64,7 +53,7 @@ def test_image_metadata_rw_different_directories():
             dir = f"{tempdir}/{i}"
             os.makedirs(dir)
 
-            img_paths.append(create_temp_image(i, dir))
+            img_paths.append(create_temp_image(dir, i))
             new_imgs_path.append(os.path.join(tempdir, PROCESSED_IMAGES_DIR, os.path.basename(img_paths[i])))
 
             metadata.append(
@@ -86,4 +75,69 @@ def test_image_metadata_rw_different_directories():
         tags = new_imgs.read_metadata()
 
         for i in range(img_count):
-            assert tags[i]["EXIF:ImageDescription"] == metadata[i].description
\ No newline at end of file
+            assert tags[i]["EXIF:ImageDescription"] == metadata[i].description
+
+
+def test_images_lazy(create_temp_image):
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_paths = [create_temp_image(tempdir, i) for i in range(3)]
+
+        imgs = Images(img_paths, lazy=True)
+        imgs.set_max_dimension(100)
+        imgs.reduce_quality()
+
+        size = imgs.calculate_size()
+        for img in imgs:
+            assert img._internal_image is None # file is closed after encoding
+            assert img._encoded is None # encoded bytes are not kept
+            assert img.get_dimensions() == (228, 1337)
+
+        assert imgs.calculate_size() == size
+        assert imgs[0].sha256() == imgs[0].encode().sha256
+
+def test_images_preprocessor(create_temp_image):
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_paths = [create_temp_image(tempdir, i) for i in range(3)]
+
+        local = Images(img_paths)
+        local.set_max_dimension(100)
+        local.reduce_quality()
+
+        with ImagePreprocessor(2) as preprocessor:
+            imgs = Images(img_paths)
+            imgs.set_preprocessor(preprocessor)
+            imgs.set_max_dimension(100)
+            imgs.reduce_quality()
+
+            assert imgs.calculate_size() == local.calculate_size()
+            assert [img.sha256() for img in imgs] == [img.sha256() for img in local]
+
+            imgs.fit_to_budget(3000)
+            assert imgs.calculate_size() <= 3000
+
+def test_images_lazy_preprocessor(monkeypatch, create_temp_image):
+    parent_encodes = []
+    encode_pixels = Image._encode_pixels
+    monkeypatch.setattr(Image, "_encode_pixels", lambda img: parent_encodes.append(img) or encode_pixels(img))
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_paths = [create_temp_image(tempdir, i) for i in range(3)]
+
+        with ImagePreprocessor(2) as preprocessor:
+            imgs = Images(img_paths, lazy=True)
+            imgs.set_preprocessor(preprocessor)
+            imgs.reduce_quality()
+            size = imgs.calculate_size()
+
+            # bytes encoded by workers are read from their files, not encoded again
+            assert sum(len(data) for data in imgs.encode_base64()) == 4 * sum((img.size() + 2) // 3 for img in imgs)
+            assert imgs[0].sha256() == imgs[0].encode().sha256
+            assert imgs.calculate_size() == size
+            assert parent_encodes == []
+
+            # file is removed when settings change
+            path, _ = imgs[0]._encoded_file
+            imgs[0].set_max_dimension(100)
+            imgs[0].encode()
+            assert not os.path.exists(path)
+            assert len(parent_encodes) == 1
@@ -0,0 +1,82 @@
+import os
+import tempfile
+
+from imgdescgenlib.chatbot.base import ChatbotBase
+from imgdescgenlib.imgdescgen import ImgDescGen
+from imgdescgenlib.images import Images
+from imgdescgenlib.schemas import ImageDescription
+
+def test_skip_described(monkeypatch, counting_chatbot, create_temp_image):
+    existing_tags = [
+        {"SourceFile": "temp_image_0.jpg", "EXIF:ImageDescription": "existing", "IPTC:Keywords": "word 1", "XMP:Subject": ["word 1", "word 2"]},
+        {"SourceFile": "temp_image_1.jpg", "EXIF:ImageDescription": " "},
+        {"SourceFile": "temp_image_2.jpg"},
+    ]
+    requested_tags = []
+
+    def read_metadata(self, tags=None):
+        requested_tags.append(tags)
+        return existing_tags
+
+    monkeypatch.setattr(Images, "read_metadata", read_metadata)
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_paths = [create_temp_image(tempdir, i, size=(64, 64)) for i in range(3)]
+        chatbot = counting_chatbot
+
+        with ImgDescGen(chatbot) as img_desc_gen:
+            descriptions = img_desc_gen.generate_image_description(img_paths, skip_described=True)
+
+        assert requested_tags == [["EXIF:ImageDescription", "IPTC:Keywords", "XMP:Subject"]]
+        assert chatbot.described == ["temp_image_1.jpg", "temp_image_2.jpg"]
+        assert descriptions[0] == ImageDescription(description="existing", keywords=["word 1", "word 2"])
+        assert [description.description for description in descriptions[1:]] == ["temp_image_1.jpg", "temp_image_2.jpg"]
+
+def test_skip_described_prepares_and_writes_only_new(monkeypatch, counting_chatbot, create_temp_image):
+    monkeypatch.setattr(Images, "read_metadata", lambda self, tags=None: [
+        {"EXIF:ImageDescription": "existing"} if img.get_filename() == "temp_image_0.jpg" else {} for img in self
+    ])
+    fitted = []
+    written = []
+    monkeypatch.setattr(Images, "fit_to_budget", lambda self, max_bytes=None, max_dimension=None: fitted.extend(img.get_filename() for img in self))
+    monkeypatch.setattr(Images, "write_description_metadata", lambda self, img_metadata, output_dir, mode: written.extend(img.get_filename() for img in self))
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_paths = [create_temp_image(tempdir, i, size=(64, 64)) for i in range(3)]
+        with ImgDescGen(counting_chatbot, write_mode="in_place") as img_desc_gen:
+            descriptions = img_desc_gen.generate_image_description(img_paths, size_budget=1024*1024, skip_described=True)
+
+    # described image is neither fit to budget nor written again
+    assert fitted == written == ["temp_image_1.jpg", "temp_image_2.jpg"]
+    assert descriptions[0].description == "existing"
+
+def test_generate_stream_writes_early_results(create_temp_image):
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_paths = [create_temp_image(tempdir, i, size=(64, 64)) for i in range(4)]
+        output_dir = os.path.join(tempdir, "output")
+
+        class StreamingChatbot(ChatbotBase):
+            def generate_image_description_stream(self, images: Images):
+                # descriptions arrive in reverse order, one by one
+                for i in reversed(range(len(images))):
+                    yield i, ImageDescription(description=images[i].get_filename(), keywords=[])
+
+        with ImgDescGen(StreamingChatbot()) as img_desc_gen:
+            results = list(img_desc_gen.generate_image_description_stream(img_paths, output_dir, write_batch_size=2))
+
+        assert [(os.path.basename(img_path), description.description) for img_path, description in results] == \
+            [(f"temp_image_{i}.jpg", f"temp_image_{i}.jpg") for i in reversed(range(4))]
+        assert sorted(os.listdir(output_dir)) == [f"temp_image_{i}.jpg" for i in range(4)]
+
+def test_near_duplicates_are_described_once(counting_chatbot, create_temp_image):
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_paths = [create_temp_image(tempdir, i, size=(64, 64)) for i in range(3)]
+        chatbot = counting_chatbot
+
+        with ImgDescGen(chatbot, near_duplicate_distance=4) as img_desc_gen:
+            descriptions = img_desc_gen.generate_image_description(img_paths)
+
+        # images are identical, so only the first one is sent
+        assert chatbot.described == ["temp_image_0.jpg"]
+        assert [description.description for description in descriptions] == ["temp_image_0.jpg"] * 3
+        assert descriptions[1] is not descriptions[0]
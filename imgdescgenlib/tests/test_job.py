@@ -0,0 +1,50 @@
+import os
+import tempfile
+import pytest
+
+from imgdescgenlib.chatbot.base import ChatbotBase
+from imgdescgenlib.chatbot.exceptions import ChatbotFailed
+from imgdescgenlib.imgdescgen import ImgDescGen
+from imgdescgenlib.images import Images
+from imgdescgenlib.job import DescriptionJob
+from imgdescgenlib.schemas import ImageDescription
+
+class FlakyChatbot(ChatbotBase):
+    def __init__(self):
+        self.described: list[str] = []
+        self.failing = True
+
+    def generate_image_description(self, images: Images) -> list[ImageDescription]:
+        if self.failing and any(img.get_filename() == "b.jpg" for img in images):
+            raise ChatbotFailed("test error")
+        self.described += [img.get_filename() for img in images]
+        return [ImageDescription(description=img.get_filename(), keywords=[]) for img in images]
+
+def test_job_resumes(create_temp_image):
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        input_dir = os.path.join(tempdir, "input")
+        output_dir = os.path.join(tempdir, "output")
+        create_temp_image(input_dir, filename="a.jpg", size=(64, 64))
+        create_temp_image(input_dir, filename=os.path.join("sub", "b.jpg"), size=(64, 64))
+        create_temp_image(input_dir, filename=os.path.join("sub", "c.jpg"), size=(64, 64))
+
+        chatbot = FlakyChatbot()
+        with ImgDescGen(chatbot) as img_desc_gen:
+            result = DescriptionJob(img_desc_gen, input_dir, output_dir, chunk_size=1).run()
+            assert result.total == 3
+            assert result.described == 2
+            assert sorted(chatbot.described) == ["a.jpg", "c.jpg"]
+
+            # second run describes only failed image, state is loaded from manifest
+            chatbot.failing = False
+            job = DescriptionJob(img_desc_gen, input_dir, output_dir, chunk_size=1)
+            result = job.run()
+            assert result.described == 1
+            assert sorted(chatbot.described) == ["a.jpg", "b.jpg", "c.jpg"]
+            assert job.get_manifest().files["sub/b.jpg"].description.description == "b.jpg"
+            assert all(entry.state != "pending" for entry in job.get_manifest().files.values())
+
+def test_job_requires_copy_mode():
+    with ImgDescGen(FlakyChatbot(), write_mode="in_place") as img_desc_gen:
+        with pytest.raises(ValueError):
+            DescriptionJob(img_desc_gen, "input", "output")
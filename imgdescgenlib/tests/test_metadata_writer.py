@@ -0,0 +1,59 @@
+import os
+import tempfile
+import PIL.Image
+import PIL.IptcImagePlugin
+
+from imgdescgenlib.image import Image
+from imgdescgenlib.metadata_writer import MetadataWriter
+from imgdescgenlib.schemas import ImageDescription
+
+METADATA = ImageDescription(description="test description", keywords=["word 1", "word 2"])
+
+def test_sidecar_tags():
+    writer = MetadataWriter("sidecar")
+    assert writer._tags(METADATA) == {"XMP-dc:Description": "test description", "XMP-dc:Subject": ["word 1", "word 2"]}
+    assert MetadataWriter.get_sidecar_path("/images/a.cr2") == os.path.join("/images", "a.xmp")
+    assert MetadataWriter.get_sidecar_path("/images/a.cr2", "/out") == os.path.join("/out", "a.xmp")
+
+def test_write_in_place(create_temp_image):
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_path = create_temp_image(tempdir, filename="temp_image.jpg", size=(64, 64))
+        img = Image(img_path)
+        img.write_description_metadata(METADATA, mode="in_place")
+
+        tags = img.read_metadata(["EXIF:ImageDescription", "IPTC:Keywords", "XMP:Subject"])[0]
+        assert tags["EXIF:ImageDescription"] == METADATA.description
+        assert tags["IPTC:Keywords"] == METADATA.keywords
+        assert tags["XMP:Subject"] == METADATA.keywords
+        assert os.listdir(tempdir) == ["temp_image.jpg"]
+
+def test_write_jpeg_natively(create_temp_image):
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_path = create_temp_image(tempdir, filename="temp_image.jpg", size=(64, 64))
+        output_path = os.path.join(tempdir, "output")
+        metadata = ImageDescription(description="опис <test> & more", keywords=["word 1", "слово"])
+
+        # ExifTool is not needed for simple JPEG
+        MetadataWriter("copy", exiftool_path="missing-exiftool").write([img_path], [metadata], output_path)
+
+        with PIL.Image.open(img_path) as original, PIL.Image.open(os.path.join(output_path, "temp_image.jpg")) as written:
+            assert written.getexif()[0x010E] is not None
+            assert "опис &lt;test&gt; &amp; more" in written.info["xmp"].decode("utf-8")
+            assert [marker for marker, _ in written.applist] == ["APP0", "APP1", "APP1", "APP13"]
+            # same IPTC tags as written by ExifTool, see MetadataWriter._tags
+            iptc = PIL.IptcImagePlugin.getiptcinfo(written)
+            assert set(iptc) == {(1, 90), (2, 0), (2, 25)}
+            assert [keyword.decode("utf-8") for keyword in iptc[(2, 25)]] == ["word 1", "слово"]
+            assert written.tobytes() == original.tobytes()
+
+def test_write_jpeg_natively_fallback(create_temp_image):
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_path = create_temp_image(tempdir, filename="temp_image.png", size=(64, 64))
+
+        writer = MetadataWriter("in_place")
+        assert writer._write_native([img_path], [METADATA]) == ([img_path], [METADATA])
+        # existing XMP is left to ExifTool
+        jpeg_path = create_temp_image(tempdir, filename="temp_image.jpg", size=(64, 64))
+        assert writer._write_native([jpeg_path], [METADATA]) == ([], [])
+        assert writer._write_native([jpeg_path], [METADATA]) == ([jpeg_path], [METADATA])
+        assert sorted(os.listdir(tempdir)) == ["temp_image.jpg", "temp_image.png"]
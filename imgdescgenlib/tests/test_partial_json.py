@@ -0,0 +1,72 @@
+import json
+import tempfile
+import pytest
+
+from imgdescgenlib.chatbot.exceptions import ChatbotFailed
+from imgdescgenlib.chatbot.gemini.gemini import GeminiClient
+from imgdescgenlib.chatbot.gemini.schemas import GeminiConfig, GeminiModel
+from imgdescgenlib.chatbot.partial_json import ArrayItemParser, parse_array_items
+from imgdescgenlib.images import Images
+
+def generate_content_response(text: str, finish_reason: str) -> dict:
+    return {
+        "candidates": [{"content": {"parts": [{"text": text}]}, "finishReason": finish_reason}],
+        "usageMetadata": {"promptTokenCount": 1, "candidatesTokenCount": 1}
+    }
+
+def test_parse_array_items():
+    assert parse_array_items('[{"a": 1}, {"b": [2, 3]}]') == ([{"a": 1}, {"b": [2, 3]}], True)
+    assert parse_array_items(' [ ] ') == ([], True)
+
+    # complete items of truncated array are returned
+    assert parse_array_items('[{"a": 1}, {"b": [2, 3]}, {"c": "trunc') == ([{"a": 1}, {"b": [2, 3]}], False)
+    assert parse_array_items('[{"a": 1},') == ([{"a": 1}], False)
+    assert parse_array_items('{"a": 1}') == ([], False)
+
+def test_array_item_parser_stream():
+    text = '[{"a": 1}, {"b": "x]"} ,{"c": [1, 2]}]'
+    parser = ArrayItemParser()
+    items = []
+    for i in range(0, len(text), 3):
+        items += parser.feed(text[i:i + 3])
+        if i + 3 <= text.index("}"):
+            assert not items
+    assert items == [{"a": 1}, {"b": "x]"}, {"c": [1, 2]}]
+    assert parser.complete and parser.item_count == 3
+
+def test_salvage_truncated_response():
+    client = GeminiClient(GeminiConfig())
+    items = [
+        {"id": 2, "description": "third", "keywords": []},
+        {"id": 0, "description": "first", "keywords": ["a"]},
+        {"id": 1, "description": "second", "keywords": []}
+    ]
+    text = json.dumps(items)
+
+    # descriptions are matched to images by id
+    descriptions = client._parse_generate_content_response(generate_content_response(text, "STOP"), 3)
+    assert [description.description for description in descriptions] == ["first", "second", "third"]
+
+    truncated = text[:text.index('{"id": 1')] + '{"id": 1, "descr'
+    descriptions = client._parse_generate_content_response(generate_content_response(truncated, "MAX_TOKENS"), 3)
+    assert [description.description if description else None for description in descriptions] == ["first", None, "third"]
+
+    # items without id are matched by position
+    text = json.dumps([{"description": "first", "keywords": []}])
+    descriptions = client._parse_generate_content_response(generate_content_response(text, "STOP"), 2)
+    assert descriptions[0].description == "first" and descriptions[1] is None
+
+    with pytest.raises(ChatbotFailed):
+        client._parse_generate_content_response(generate_content_response('[{"descr', "MAX_TOKENS"), 2)
+
+def test_stream_items_without_id_in_one_event(gemini_server, create_temp_images):
+    # whole response array comes in one event, items without id are matched by position
+    server = gemini_server(stream_piece_size=10000)
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_paths = create_temp_images(tempdir, 3, "{}.png", size=(10, 10))
+
+        config = GeminiConfig(base_url=server.url, model_name=GeminiModel(name="models/test"), label_images=False, count_tokens=False)
+        results = dict(GeminiClient(config).generate_image_description_stream(Images(img_paths)))
+
+    assert {i: description.description for i, description in results.items()} == {0: "d0", 1: "d1", 2: "d2"}
+    assert server.generate_requests == [3]
@@ -0,0 +1,73 @@
+import tempfile
+import time
+
+from imgdescgenlib.chatbot.base import ChatbotBase
+from imgdescgenlib.chatbot.exceptions import ChatbotFailed, ChatbotPartiallyFailed
+from imgdescgenlib.imgdescgen import ImgDescGen
+from imgdescgenlib.images import Images
+from imgdescgenlib.pipeline import Pipeline, PipelineStage
+from imgdescgenlib.schemas import ImageDescription
+
+import pytest
+
+class FailingChatbot(ChatbotBase):
+    def generate_image_description(self, images: Images) -> list[ImageDescription]:
+        if any(img.get_filename() == "temp_image_2.jpg" for img in images):
+            raise ChatbotFailed("test error")
+        return [ImageDescription(description=img.get_filename(), keywords=[]) for img in images]
+
+    def get_cache_key(self) -> str:
+        return "test model\ntest prompt"
+
+def test_pipeline_stages_overlap():
+    def slow(item):
+        time.sleep(0.05)
+        return item
+
+    def fail_odd(item):
+        if item % 2:
+            raise ValueError(item)
+        return item * 10
+
+    pipeline = Pipeline([PipelineStage("a", slow), PipelineStage("b", fail_odd), PipelineStage("c", slow)])
+
+    started = time.monotonic()
+    results = pipeline.run(range(6))
+    elapsed = time.monotonic() - started
+
+    assert results[0::2] == [0, 20, 40]
+    assert all(isinstance(result, ValueError) for result in results[1::2])
+    assert elapsed < 0.05 * 9 # sequential run takes 0.05 * 9
+    assert [stats.processed for stats in pipeline.get_stats()] == [6, 3, 3]
+    assert [stats.failed for stats in pipeline.get_stats()] == [0, 3, 0]
+
+def test_imgdescgen_pipelined(create_temp_image):
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_paths = [create_temp_image(tempdir, i) for i in range(5)]
+
+        with ImgDescGen(FailingChatbot()) as img_desc_gen:
+            with pytest.raises(ChatbotPartiallyFailed) as e:
+                img_desc_gen.generate_image_description_pipelined(img_paths, chunk_size=2)
+
+        descriptions = [description.description if description else None for description in e.value.results]
+        assert descriptions == ["temp_image_0.jpg", "temp_image_1.jpg", None, None, "temp_image_4.jpg"]
+        assert [stats.processed for stats in img_desc_gen.get_pipeline_stats()] == [3, 3, 2, 2]
+
+def test_imgdescgen_pipelined_releases_chunks(create_temp_image):
+    class RecordingChatbot(FailingChatbot):
+        def __init__(self):
+            self.images: list[Images] = []
+
+        def generate_image_description(self, images: Images) -> list[ImageDescription]:
+            self.images.append(images)
+            return super().generate_image_description(images)
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tempdir:
+        img_paths = [create_temp_image(tempdir, i) for i in (0, 1, 3)]
+        chatbot = RecordingChatbot()
+        with ImgDescGen(chatbot) as img_desc_gen:
+            img_desc_gen.generate_image_description_pipelined(img_paths, chunk_size=1)
+
+        # encoded bytes of written chunks are not kept until the end of run
+        assert len(chatbot.images) == 3
+        assert all(img._encoded is None and not img._is_encoded() for images in chatbot.images for img in images)
@@ -0,0 +1,54 @@
+from imgdescgenlib.chatbot.client_base import ChatbotClientBase
+from imgdescgenlib.chatbot.exceptions import ChatbotCircuitOpen
+from imgdescgenlib.chatbot.rate_limit import CircuitBreaker, RetryPolicy, TokenBucket
+
+from email.utils import formatdate
+
+import time
+
+import pytest
+
+def test_token_bucket_burst_does_not_wait():
+    bucket = TokenBucket(600, burst_seconds=1) # 10 tokens per second, capacity 10
+    for _ in range(10):
+        assert bucket.acquire() == 0
+
+    assert bucket.acquire() > 0
+
+def test_retry_policy_retry_after():
+    policy = RetryPolicy(max_retries=3, base_delay=1, max_delay=60)
+    assert policy.get_delay(0, "5") == 5
+    assert policy.get_delay(0, "120") == 60
+    assert 25 < policy.get_delay(0, formatdate(time.time() + 30, usegmt=True)) <= 30
+    assert 0 <= policy.get_delay(2) <= 4
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.is_open()
+    with pytest.raises(ChatbotCircuitOpen):
+        breaker.before_request()
+
+    time.sleep(0.06)
+    breaker.before_request() # trial request
+    with pytest.raises(ChatbotCircuitOpen):
+        breaker.before_request()
+
+    breaker.record_success()
+    assert not breaker.is_open()
+
+def test_retried_streamed_response_is_closed(gemini_server):
+    server = gemini_server(status=503)
+    client = ChatbotClientBase(retry_policy=RetryPolicy(max_retries=2, base_delay=0.01))
+    responses = []
+    request = client.session.request
+    client.session.request = lambda *args, **kwargs: responses.append(request(*args, **kwargs)) or responses[-1]
+
+    response = client._request("POST", f"{server.url}/v1beta/models/test:streamGenerateContent", json={"contents": [{"parts": []}]}, stream=True)
+
+    # connections of retried responses are returned to the pool, the last one is left to the caller
+    assert len(responses) == 3 and response is responses[-1]
+    assert all(retried.raw.closed for retried in responses[:-1])
+    assert not response.raw.closed
@@ -0,0 +1,21 @@
+from imgdescgenlib.chatbot.streaming import Base64Value, JsonStream
+
+import base64
+import json
+import os
+
+def test_json_stream():
+    data = [os.urandom(size) for size in (0, 1, 2, 3, 1000)]
+    document = {
+        "text": "prompt \"quoted\"",
+        "parts": [{"data": Base64Value(d)} for d in data]
+    }
+
+    stream = JsonStream(document, block_size=64)
+    body = b"".join(stream)
+
+    assert len(body) == len(stream) == stream.bytes_sent
+    parsed = json.loads(body)
+    assert parsed["text"] == document["text"]
+    assert [base64.b64decode(part["data"]) for part in parsed["parts"]] == data
+    assert b"".join(stream) == body # stream can be sent again on retry
@@ -7,4 +7,7 @@ setup(
     install_requires=[
         'pyexiftool>=0.5.6', 'requests>=2.32.3', 'pillow>=11.1.0', 'pytest>=8.3.5', 'pydantic-settings>=2.8.1',
     ],
+    extras_require={
+        'async': ['aiohttp>=3.9'],
+    },
 )
\ No newline at end of file